@@ -150,6 +150,31 @@ class FileFormat(IntEnum):
     CF GRIDSPEC conventions.
     """
 
+# FileStatus
+class FileStatus(IntEnum):
+    """
+    This flag is used in the write routines to indicate the expected status of
+    the output file.
+    """
+    UNKNOWN = 0
+    """
+    The file is created if it does not exist, otherwise the existing file is
+    used.
+    """
+    OLD = 1
+    """
+    The file must already exist.
+    """
+    NEW = 2
+    """
+    The file must not already exist, it will be created.
+    """
+    REPLACE = 3
+    """
+    The file is created if it does not exist, otherwise it is deleted and
+    recreated.
+    """
+
 # GridItem
 class GridItem(IntEnum):
     """
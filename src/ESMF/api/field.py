@@ -10,6 +10,9 @@ from ESMF.api.grid import *
 from ESMF.api.mesh import *
 from ESMF.api.locstream import *
 from ESMF.util.esmpyarray import *
+from ESMF.util.coarsen import block_sum as _block_sum, add_blocks as _add_blocks
+from ESMF.util.parallel import allgather as _allgather, \
+    require_mpi4py as _require_mpi4py
 
 #### Field class ##############################################################
 [node, element] = [0, 1]
@@ -327,6 +330,117 @@ class Field(object):
         """
         return self._xd
 
+    def coarsen(self, factor=None, dstfield=None, mask_values=None,
+                norm_type=None):
+        """
+        Conservatively coarsen the data of a :class:`~ESMF.api.field.Field`
+        on a rectilinear :class:`~ESMF.api.grid.Grid` by averaging blocks of
+        cells weighted by their areas.  When the cell faces of the
+        destination grid are every ``factor``-th cell face of the source grid
+        the blocks are reduced directly with numpy, without the search for
+        cell intersections of a :class:`~ESMF.api.regrid.Regrid`.  Otherwise
+        the data is regridded with
+        :attr:`~ESMF.api.constants.RegridMethod.CONSERVE`.  The cell areas are
+        taken from the :attr:`~ESMF.api.constants.GridItem.AREA` item of the
+        source grid if it is set, and computed from the corners otherwise.  In
+        parallel the local corners usually do not close the last local cells,
+        the data is then regridded unless the AREA item is set.
+
+        *REQUIRED:*
+
+        Either ``factor`` or ``dstfield``.
+
+        :param factor: The number of cells merged along every dimension, a
+            single integer or a list with an integer for each dimension.  The
+            destination :class:`~ESMF.api.field.Field` is then created on
+            the grid given by :meth:`~ESMF.api.grid.Grid.coarsen`.
+        :param Field dstfield: The :class:`~ESMF.api.field.Field` to hold the
+            coarsened data.
+
+        *OPTIONAL:*
+
+        :param list mask_values: The values of the mask of the source grid
+            which mark cells to leave out of the averages.
+        :param NormType norm_type: The normalization of the averages, as in
+            :class:`~ESMF.api.regrid.Regrid`.  If ``None``, defaults to
+            :attr:`~ESMF.api.constants.NormType.DSTAREA`, i.e. masked cells
+            count as zero, :attr:`~ESMF.api.constants.NormType.FRACAREA`
+            averages over the unmasked cells only.
+
+        :return: dstfield
+        """
+
+        if norm_type is None:
+            norm_type = NormType.DSTAREA
+        if not isinstance(self.grid, Grid) or \
+                self.staggerloc != StaggerLoc.CENTER:
+            raise FieldDOError("only Fields on the CENTER stagger location "
+                               "of a Grid can be coarsened")
+
+        if dstfield is None:
+            if factor is None:
+                raise RequiredArgs("must supply either factor or dstfield")
+            grid = self.grid.coarsen(factor, mask_values=mask_values)
+            dstfield = Field(grid, name=self.name, typekind=self.type,
+                             staggerloc=self.staggerloc,
+                             ndbounds=self.ndbounds)
+
+        _require_mpi4py("Field.coarsen")
+        factor = None
+        if isinstance(dstfield.grid, Grid) and \
+                dstfield.staggerloc == StaggerLoc.CENTER and \
+                dstfield.xd == self.xd:
+            factor = self.grid._coarse_factor_(dstfield.grid)
+
+        center = StaggerLoc.CENTER
+        areas = self.grid.area[center]
+        if areas is None and self.grid.rank == 2 and \
+                self.grid.staggerloc[StaggerLoc.CORNER]:
+            try:
+                areas = self.grid.get_cell_areas()
+            except SerialMethod:
+                # the corners of the last local cells are on another PET
+                areas = None
+        # both paths are collective, so every PET must take the same one
+        if not all(_allgather(areas is not None)):
+            areas = None
+
+        # fall back to regridding when the grids do not align
+        if factor is None or areas is None:
+            from ESMF.api.regrid import Regrid
+            regrid = Regrid(self, dstfield, src_mask_values=mask_values,
+                            regrid_method=RegridMethod.CONSERVE,
+                            norm_type=norm_type,
+                            unmapped_action=UnmappedAction.IGNORE)
+            try:
+                regrid(self, dstfield)
+            finally:
+                regrid.destroy()
+            return dstfield
+
+        weights = np.array(areas, dtype=np.float64)
+        total = weights
+        if mask_values is not None and self.grid.mask[center] is not None:
+            weights = np.where(np.isin(self.grid.mask[center], mask_values),
+                               0., weights)
+
+        lower = self.grid.lower_bounds[center]
+        dst_lower = dstfield.grid.lower_bounds[center]
+        dst_upper = dstfield.grid.upper_bounds[center]
+        sums = [_block_sum(self.data * weights, lower, factor),
+                _block_sum(weights, lower, factor)]
+        if norm_type == NormType.DSTAREA:
+            sums.append(_block_sum(total, lower, factor))
+        sums = [_add_blocks(parts, dst_lower, dst_upper)
+                for parts in zip(*_allgather(sums))]
+
+        norm = sums[-1]
+        data = np.zeros(sums[0].shape, dtype=np.float64)
+        np.divide(sums[0], norm, out=data, where=(norm > 0))
+        dstfield.data[...] = data
+
+        return dstfield
+
     def copy(self):
         """
         Copy a :class:`~ESMF.api.field.Field` in an ESMF-safe manner.
@@ -359,30 +473,105 @@ class Field(object):
         # call into the ctypes layer
         ESMP_FieldRegridGetArea(self)
 
-    def read(self, filename, variable, ndbounds=None):
+    def get_data(self, original_order=False):
+        """
+        Return the data of a :class:`~ESMF.api.field.Field`.
+
+        *OPTIONAL:*
+
+        :param bool original_order: Return the data of a
+            :class:`~ESMF.api.field.Field` on a
+            :class:`~ESMF.api.locstream.LocStream` whose points were
+            reordered along a space filling curve in the original order of
+            the points, see
+            :meth:`~ESMF.api.locstream.LocStream.from_arrays`.  Defaults to
+            ``False``.
+
+        :return: The data of the :class:`~ESMF.api.field.Field`, or a copy
+            of it in the original order of the points.
+        """
+
+        if original_order and isinstance(self.grid, LocStream) and \
+                self.grid.order is not None:
+            return self.grid.unpermute(self.data)
+
+        return self.data
+
+    def read(self, filename, variable, ndbounds=None, timeslice=None):
         """
         Read data into an existing :class:`~ESMF.api.field.Field` from a
         CF-compliant NetCDF file.
 
+        Several time slices and/or variables can be read in a single call by
+        passing a sequence to ``timeslice`` and/or ``variable``.  Every
+        combination of variable and time slice is then read into one entry of
+        the ungridded dimensions of the :class:`~ESMF.api.field.Field`, in
+        order of variable first and time slice second, so the ungridded
+        dimensions must hold exactly that many entries (e.g.
+        ``ndbounds=[365]`` for a year of daily data in one variable, or
+        ``ndbounds=[2, 365]`` for two variables).
+
         :note: This interface is not supported when ESMF is built with
             ``ESMF_COMM=mpiuni``.
 
         *REQUIRED:*
 
         :param str filename: The name of the NetCDF file.
-        :param str variable: The name of the data variable to read from file.
+        :param str variable: The name of the data variable to read from
+            file, or a list of names.
 
         *OPTIONAL:*
 
         :param list ndbounds: The number of ungridded dimensions to read.
+            It cannot be combined with ``timeslice`` or a list of variables,
+            which fill the ungridded dimensions themselves.
+        :param int timeslice: The time slice (1 based) to read, or a
+            sequence of time slices such as a list or a ``range``.  Any
+            iterable of integers is accepted, so time slices may also be
+            handed over from a generator.
         """
 
         assert (type(filename) is str)
-        assert (type(variable) is str)
 
         # format defaults to NetCDF for now
         format = 1
 
+        if type(variable) is str:
+            variables = None
+        else:
+            variables = list(variable)
+            assert (all(type(var) is str for var in variables))
+
+        if ndbounds is not None and (timeslice is not None or
+                                     variables is not None):
+            raise ValueError("ndbounds cannot be combined with timeslice or "
+                             "a list of variables")
+
+        if timeslice is None or isinstance(timeslice, (int, np.integer)):
+            timeslices = None
+        else:
+            timeslices = [int(ts) for ts in timeslice]
+            if any(ts < 1 for ts in timeslices):
+                raise ValueError("timeslice values must be 1 or greater")
+
+        # read many slices and/or variables into the ungridded dimensions
+        if variables is not None or timeslices is not None:
+            if variables is None:
+                variables = [variable]
+            if timeslices is None:
+                timeslices = [1 if timeslice is None else int(timeslice)]
+            self._read_ndbounds_(filename, variables, timeslices, format)
+            return
+
+        if timeslice is not None:
+            if timeslice < 1:
+                raise ValueError("timeslice must be 1 or greater")
+            ESMP_FieldRead(self, filename=filename,
+                           variablename=variable,
+                           timeslice=int(timeslice),
+                           iofmt=format)
+            return
+
         # if ndbounds is not passed in, set it to the first of extra field dimensions, if they exist
         timeslice = 1
         if ndbounds is None:
@@ -409,3 +598,118 @@ class Field(object):
                        variablename=variable,
                        timeslice=timeslice,
                        iofmt=format)
+
+    def _read_ndbounds_(self, filename, variables, timeslices, format):
+        # every (variable, timeslice) pair fills one entry of the ungridded
+        # dimensions, walked in C order so variables vary slowest
+        if not self.ndbounds:
+            raise ValueError("reading multiple time slices or variables "
+                             "requires a Field with ungridded dimensions")
+        size = len(variables) * len(timeslices)
+        if size != int(np.prod(self.ndbounds)):
+            raise ValueError("the ungridded dimensions of the Field hold %d "
+                             "entries, but %d variable/timeslice "
+                             "combinations were requested" %
+                             (int(np.prod(self.ndbounds)), size))
+
+        # a single scratch Field on the same discretization receives each
+        # slice in turn, its data is then copied into place
+        if isinstance(self.grid, Grid):
+            scratch = Field(self.grid, typekind=self.type,
+                            staggerloc=self.staggerloc)
+        elif isinstance(self.grid, Mesh):
+            scratch = Field(self.grid, typekind=self.type,
+                            meshloc=self.staggerloc)
+        else:
+            scratch = Field(self.grid, typekind=self.type)
+
+        try:
+            index = np.ndindex(*self.ndbounds)
+            for var in variables:
+                for ts in timeslices:
+                    ESMP_FieldRead(scratch, filename=filename,
+                                   variablename=var,
+                                   timeslice=ts,
+                                   iofmt=format)
+                    self.data[next(index)] = scratch.data
+        finally:
+            scratch.destroy()
+
+    def write(self, filename, variable, timeslice=None, overwrite=False,
+              status=None, original_order=False):
+        """
+        Write the data of a :class:`~ESMF.api.field.Field` to a NetCDF file.
+        The write is collective, every PET writes the data in its local bounds
+        directly to the file so the data is never gathered onto a single PET.
+
+        :note: This interface is not supported when ESMF is built with
+            ``ESMF_COMM=mpiuni``.
+
+        *REQUIRED:*
+
+        :param str filename: The name of the NetCDF file.
+        :param str variable: The name of the data variable to write to file.
+
+        *OPTIONAL:*
+
+        :param int timeslice: The time slice (1 based) to write the data
+            into.  The variable is given an unlimited time dimension, so
+            consecutive calls with an increasing ``timeslice`` append along
+            time.  If ``None``, the variable is written without a time
+            dimension.
+        :param bool overwrite: Set to ``True`` to allow data of an existing
+            variable in the file to be overwritten. Defaults to ``False``.
+        :param FileStatus status: The expected
+            :attr:`~ESMF.api.constants.FileStatus` of the file. If ``None``,
+            defaults to :attr:`~ESMF.api.constants.FileStatus.UNKNOWN` when
+            ``timeslice`` is ``None`` or ``1``, and to
+            :attr:`~ESMF.api.constants.FileStatus.OLD` when appending a later
+            time slice to an existing file.
+        :param bool original_order: Write the data of a
+            :class:`~ESMF.api.field.Field` on a
+            :class:`~ESMF.api.locstream.LocStream` whose points were
+            reordered along a space filling curve in the original order of
+            the points.  The data is reordered in place for the write and
+            restored afterwards.  Defaults to ``False``.
+        """
+
+        assert (type(filename) is str)
+        assert (type(variable) is str)
+
+        # format defaults to NetCDF for now
+        format = 1
+
+        # a timeslice of 0 tells ESMF not to add a time dimension
+        if timeslice is None:
+            timeslice = 0
+        elif timeslice < 1:
+            raise ValueError("timeslice must be a positive integer")
+
+        if status is None:
+            if timeslice > 1:
+                status = FileStatus.OLD
+            else:
+                status = FileStatus.UNKNOWN
+
+        if not (original_order and isinstance(self.grid, LocStream) and
+                self.grid.order is not None):
+            ESMP_FieldWrite(self, filename=filename,
+                            variablename=variable,
+                            overwrite=overwrite,
+                            status=status,
+                            timeslice=timeslice,
+                            iofmt=format)
+            return
+
+        # ESMF writes the data from its own memory
+        data = self.data.copy()
+        self.grid.unpermute(data, out=self.data)
+        try:
+            ESMP_FieldWrite(self, filename=filename,
+                            variablename=variable,
+                            overwrite=overwrite,
+                            status=status,
+                            timeslice=timeslice,
+                            iofmt=format)
+        finally:
+            self.data[...] = data
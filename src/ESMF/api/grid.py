@@ -11,8 +11,17 @@ from copy import copy
 
 from ESMF.api.esmpymanager import *
 from ESMF.util.esmpyarray import ndarray_from_esmf
+from ESMF.util.fingerprint import fingerprint as _fingerprint
+from ESMF.util.file_cache import cache_path, read_cache, write_cache
+from ESMF.util.geometry import polygon_areas, polygon_centroids
+from ESMF.util.spatial_index import SpatialIndex
+from ESMF.util.parallel import allgather as _allgather, \
+    require_mpi4py as _require_mpi4py
+from ESMF.util.decomp import DecompPlan, decomp_counts as _decomp_counts, plan_decomp as _plan_decomp
+from ESMF.util.coarsen import block_sum as _block_sum, add_blocks as _add_blocks, coarsen_vector as _coarsen_vector
+from ESMF.util.masking import masked_cells as _masked_cells
 import ESMF.api.constants as constants
-from ESMF.util.slicing import get_formatted_slice, get_none_or_slice, get_none_or_bound, get_none_or_ssslice
+from ESMF.util.slicing import get_formatted_slice, get_none_or_slice, get_none_or_bound, get_none_or_ssslice, get_none_or_1d
 
 
 #### Grid class #########################################################
@@ -77,6 +86,18 @@ class Grid(object):
 
     *OPTIONAL:*
 
+    :param list reg_decomp: A 2 element integer list specifying how the grid
+        is decomposed. Each entry is the number of decounts for that dimension.
+        The total decounts cannot exceed the total number of PETs. In other
+        words, at most one DE is allowed per processor. A
+        :class:`~ESMF.util.decomp.DecompPlan` returned by
+        :meth:`~ESMF.api.grid.Grid.plan_decomp` may be given instead, its
+        ``decompflag`` is then used unless ``decompflag`` is given.
+        If ``None``, defaults to ``[pet_count(), 1]``.
+    :param list decompflag: List of 2 integers specifying the decomposition
+        of each dimension with a :attr:`~ESMF.api.constants.DecompFlag`.
+        If ``None``, defaults to
+        :attr:`~ESMF.api.constants.DecompFlag.BALANCED` in each dimension.
     :param bool is_sphere: Set to ``True`` for a spherical grid, or ``False``
         for regional. Defaults to ``True``.
     :param bool add_corner_stagger: Set to ``True`` to use the information in
@@ -103,6 +124,19 @@ class Grid(object):
         coordinates defined in the file. This argument is only supported with
         filetype :attr:`~ESMF.api.constants.FileFormat.GRIDSPEC`.
         Defaults to ``None``.
+    :param cache: Set to ``True`` to keep a binary copy of the coordinates,
+        masks and areas read from the grid file in a ``.esmpy_cache``
+        directory next to the file, or give the path of a directory to keep
+        it in. Later grids created from the same file, with the same options
+        and on the same number of PETs, are then built in memory from the
+        cache without parsing the file. The cache is keyed on the path,
+        modification time and size of the file, so it is rebuilt whenever
+        the file changes. GRIDSPEC files with 1D coordinates are not cached,
+        and neither are grids with a ``reg_decomp`` or ``decompflag`` other
+        than the default ``[pet_count(), 1]`` balanced decomposition, which
+        is the only one ESMF can reproduce in memory.  The cache is only used
+        if it is valid on all PETs.
+        Defaults to ``None``.
     """
 
     @initialize
@@ -122,10 +156,15 @@ class Grid(object):
                  add_user_area=None,
                  add_mask=None,
                  varname=None,
-                 coord_names=None):
+                 coord_names=None,
+                 cache=None):
  
         # initialize the from_file flag to False
         from_file = False
+
+        # contents of the sidecar cache of a grid file, and where to write it
+        cached = None
+        cache_file = None
         
         # in-memory grid
         if max_index is not None:
@@ -155,6 +194,8 @@ class Grid(object):
                 warnings.warn("varname is only used for grids created from file, this argument will be ignored.")
             if coord_names:
                 warnings.warn("coord_names is only used for grids created from file, this argument will be ignored.")
+            if cache:
+                warnings.warn("cache is only used for grids created from file, this argument will be ignored.")
         # filename and filetype are required for from-file grids
         elif (filename is None) or (filetype is None):
             # raise error, need max_index to create in memory or filename to create from file
@@ -217,10 +258,18 @@ class Grid(object):
         # placeholder for the list of numpy arrays which hold the grid coords
         self._coords = [None]
 
+        # placeholder for the 1D coordinate vectors of rectilinear grids
+        self._coords_1d = [None]
+
         # mask and area
         self._mask = np.zeros(None)
         self._area = np.zeros(None)
 
+        # stagger locations and items which are allocated in ESMF but have
+        # not been linked to Python yet, this is done on first access
+        self._pending_coords = []
+        self._pending_items = []
+
         # create the correct grid
         self._struct = None
 
@@ -228,22 +277,14 @@ class Grid(object):
             # create default reg_decomp if it is not passed as an argument
             if reg_decomp is None:
                 reg_decomp = [pet_count(), 1]
-            # create the grid from file
-            self._struct = ESMP_GridCreateFromFile(filename, filetype,
-                                                  reg_decomp,
-                                                  decompflag=decompflag,
-                                                  isSphere=is_sphere,
-                                                  addCornerStagger=add_corner_stagger,
-                                                  addUserArea=add_user_area,
-                                                  addMask=add_mask, 
-                                                  varname=varname,
-                                                  coordNames=coord_names)
-            # grid rank and dims
-            if filetype == FileFormat.SCRIP:
-                self._rank, self._max_index = ESMP_ScripInq(filename)
-                self._ndims = self.rank
-            else: # must be GRIDSPEC
-                self._rank, self._ndims, self._max_index = ESMP_GridspecInq(filename)
+            # or take the decomposition of a plan
+            elif isinstance(reg_decomp, DecompPlan):
+                if decompflag is None:
+                    decompflag = reg_decomp.decompflag
+                reg_decomp = reg_decomp.reg_decomp
+            if decompflag is not None:
+                decompflag = np.array(decompflag, dtype=np.int32)
+
             # stagger is not required for from-file grids, but we need to
             # correctly allocate the space
             staggerloc = [StaggerLoc.CENTER]
@@ -263,6 +304,55 @@ class Grid(object):
                 self._periodic_dim = 0
                 # TODO: we assume that all periodic grids create from file will be periodic across the first
                 #       dimension.. is that true?
+
+            # build the grid in memory if the file has been cached, the cache
+            # is only valid for the same file, options and decomposition, and
+            # grids created in memory always have the default decomposition
+            default_decomp = list(reg_decomp) == [pet_count(), 1] and \
+                (decompflag is None or np.all(decompflag == DecompFlag.BALANCED))
+            if cache and default_decomp:
+                options = (int(filetype), list(reg_decomp),
+                           None if decompflag is None else decompflag.tolist(),
+                           is_sphere, add_corner_stagger, add_user_area,
+                           add_mask, varname, coord_names,
+                           pet_count(), local_pet())
+                _require_mpi4py("Grid(cache=...)")
+                cache_file = cache_path(filename, cache, options)
+                cached = read_cache(cache_file)
+                items = []
+                if add_user_area:
+                    items.append(GridItem.AREA)
+                if add_mask:
+                    items.append(GridItem.MASK)
+
+                # grid creation is collective, so every PET must take the
+                # same path: the cache is only used if it is valid on all PETs
+                valid = cached is not None and \
+                    self._cache_complete_(cached, staggerloc, items)
+                if not all(_allgather(valid)):
+                    cached = None
+                elif not self._create_from_cache_(cached, staggerloc, items):
+                    cached = None
+
+            if cached is None:
+                # create the grid from file
+                self._struct = ESMP_GridCreateFromFile(filename, filetype,
+                                                      reg_decomp,
+                                                      decompflag=decompflag,
+                                                      isSphere=is_sphere,
+                                                      addCornerStagger=add_corner_stagger,
+                                                      addUserArea=add_user_area,
+                                                      addMask=add_mask, 
+                                                      varname=varname,
+                                                      coordNames=coord_names)
+                # grid rank and dims
+                if filetype == FileFormat.SCRIP:
+                    self._rank, self._max_index = ESMP_ScripInq(filename)
+                    self._ndims = self.rank
+                else: # must be GRIDSPEC
+                    self._rank, self._ndims, self._max_index = ESMP_GridspecInq(filename)
+            else:
+                cache_file = None
             
         else:
             # ctypes stuff
@@ -308,6 +398,12 @@ class Grid(object):
         self._coords = [[None for a in range(self.rank)] \
                         for b in range(2**self.rank)]
 
+        # rectilinear grids also keep the 1D coordinate vectors aliased to
+        # ESMF memory, the full coordinates are broadcast views of these
+        # index order is [staggerLoc][coord_dim]
+        self._coords_1d = [[None for a in range(self.rank)] \
+                           for b in range(2**self.rank)]
+
         # initialize the item structures
         # index order is [staggerLoc][itemDim]
         self._mask = [None for a in range(2**self.rank)]
@@ -326,9 +422,24 @@ class Grid(object):
             self.add_item(GridItem.MASK, staggerloc=StaggerLoc.CENTER, 
                           from_file=from_file)
 
+        # fill the grid from the cache, or write the cache for the next time
+        if cached is not None:
+            self._read_cache_(cached)
+        elif cache_file is not None and not self.rectilinear:
+            self._write_cache_(cache_file)
+
         # for arbitrary metadata
         self._meta = {}
 
+        # memoized digest of the grid, see fingerprint()
+        self._fingerprint = None
+
+        # spatial index of the cells and the digest it was built for
+        self._spatial_index = None
+
+        # incremented when the mask values change, see Regrid.masks_changed
+        self._mask_version = 0
+
         # regist with atexit
         import atexit; atexit.register(self.__del__)
         self._finalized = False
@@ -349,8 +460,15 @@ class Grid(object):
         ret._coords = [[get_none_or_ssslice(get_none_or_slice(get_none_or_slice(self.coords, stagger), coorddim), slc,
                                             stagger, self.rank)
                         for coorddim in range(self.rank)] for stagger in range(2 ** self.rank)]
+        if self.rectilinear:
+            ret._coords_1d = [[get_none_or_1d(get_none_or_slice(get_none_or_slice(ret.coords, stagger), coorddim),
+                                              coorddim)
+                               for coorddim in range(self.rank)] for stagger in range(2 ** self.rank)]
         ret._mask = [get_none_or_slice(get_none_or_slice(self.mask, stagger), slc) for stagger in range(2 ** self.rank)]
         ret._area = [get_none_or_slice(get_none_or_slice(self.area, stagger), slc) for stagger in range(2 ** self.rank)]
+        ret._pending_coords = []
+        ret._pending_items = []
+        ret._fingerprint = None
 
         # upper bounds are "sliced" by taking the shape of the coords
         ret._upper_bounds = [get_none_or_bound(get_none_or_slice(ret.coords, stagger), 0) for stagger in
@@ -401,6 +519,7 @@ class Grid(object):
             ``upper_bounds - lower_bounds``.
         """
 
+        self._link_pending_items_()
         return self._area
 
     @property
@@ -424,6 +543,7 @@ class Grid(object):
         :return: The coordinates of the :class:`~ESMF.api.grid.Grid`.
         """
 
+        self._link_pending_coords_()
         return self._coords
 
     @property
@@ -477,6 +597,7 @@ class Grid(object):
             `upper_bounds - lower_bounds``.
         """
 
+        self._link_pending_items_()
         return self._mask
 
     @property
@@ -509,6 +630,20 @@ class Grid(object):
 
         return self._ndims
 
+    @property
+    def rectilinear(self):
+        """
+        :rtype: bool
+        :return: ``True`` if the coordinates of the
+            :class:`~ESMF.api.grid.Grid` are stored as 1D vectors, one per
+            coordinate dimension.  The arrays in
+            :attr:`~ESMF.api.grid.Grid.coords` are then read-only broadcast
+            views of these vectors, use
+            :meth:`~ESMF.api.grid.Grid.get_coords_1d` to modify them.
+        """
+
+        return self.ndims == 1 and self.rank > 1
+
     @property
     def num_peri_dims(self):
         """
@@ -602,7 +737,8 @@ class Grid(object):
         """
         return self._upper_bounds
 
-    def add_coords(self, staggerloc=None, coord_dim=None, from_file=False):
+    def add_coords(self, staggerloc=None, coord_dim=None, from_file=False,
+                   init_values=True):
         """
         Add coordinates to the :class:`~ESMF.api.grid.Grid` at the specified
         stagger location.
@@ -618,6 +754,11 @@ class Grid(object):
             staggerlocs is a list with more than one element).
         :param bool from_file: Boolean for internal use to determine whether the
             :class:`~ESMF.api.grid.Grid` has already been created from file.
+        :param bool init_values: If ``True`` the coordinates are initialized
+            to zero.  Set to ``False`` to skip the initialization when all
+            coordinate values will be overwritten, the coordinates are then
+            linked to the ESMF allocation on first access.  Defaults to
+            ``True``.
 
         :return: A numpy array of coordinate values if staggerloc and
             coord_dim are specified, otherwise return None.
@@ -630,8 +771,10 @@ class Grid(object):
             except TypeError:
                 staggerloc = [staggerloc]
 
+        self._fingerprint = None
         for stagger in staggerloc:
-            if self.coords[stagger][0] is not None:
+            if self._coords[stagger][0] is not None or \
+                    stagger in self._pending_coords:
                 warnings.warn("This coordinate has already been added.")
             else:
                 # request that ESMF allocate space for the coordinates
@@ -639,7 +782,8 @@ class Grid(object):
                     ESMP_GridAddCoord(self, staggerloc=stagger)
 
                 # and now for Python
-                self._allocate_coords_(stagger, from_file=from_file)
+                self._allocate_coords_(stagger, from_file=from_file,
+                                       init_values=init_values)
 
                 # set the staggerlocs to be done
                 self.staggerloc[stagger] = True
@@ -647,7 +791,8 @@ class Grid(object):
         if len(staggerloc) == 1 and coord_dim is not None:
             return self.coords[staggerloc[0]][coord_dim]
 
-    def add_item(self, item, staggerloc=None, from_file=False):
+    def add_item(self, item, staggerloc=None, from_file=False,
+                 init_values=True):
         """
         Allocate space for a :class:`~ESMF.api.grid.Grid` item (mask or areas)
         at a specified stagger location.
@@ -666,6 +811,11 @@ class Grid(object):
             3D.
         :param bool from_file: Boolean for internal use to determine whether the
             :class:`~ESMF.api.grid.Grid` has already been created from file.
+        :param bool init_values: If ``True`` the mask is initialized to one
+            and the areas to zero.  Set to ``False`` to skip the
+            initialization when all values will be overwritten, the item is
+            then linked to the ESMF allocation on first access.  Defaults to
+            ``True``.
 
         :return: A numpy array of the mask or area values if a single
             staggerloc is given, otherwise return None.
@@ -678,19 +828,22 @@ class Grid(object):
             except TypeError:
                 staggerloc = [staggerloc]
 
+        self._fingerprint = None
         done = True
         for stagger in staggerloc:
             # check to see if they are done
             if item == GridItem.MASK:
-                if self.mask[stagger] is not None:
+                if self._mask[stagger] is not None:
                     raise GridItemAlreadyLinked
                 done = False
             elif item == GridItem.AREA:
-                if self.area[stagger] is not None:
+                if self._area[stagger] is not None:
                     raise GridItemAlreadyLinked
                 done = False
             else:
                 raise GridItemNotSupported
+            if (item, stagger) in self._pending_items:
+                raise GridItemAlreadyLinked
 
             if not done:
                 # request that ESMF allocate space for the coordinates
@@ -698,7 +851,8 @@ class Grid(object):
                     ESMP_GridAddItem(self, item, staggerloc=stagger)
 
                 # and now for Python..
-                self._allocate_items_(item, stagger, from_file=from_file)
+                self._allocate_items_(item, stagger, from_file=from_file,
+                                      init_values=init_values)
 
         if len(staggerloc) is 1:
             if item == GridItem.MASK:
@@ -708,6 +862,67 @@ class Grid(object):
             else:
                 raise GridItemNotSupported
 
+    def coarsen(self, factor, mask_values=None):
+        """
+        Create a new :class:`~ESMF.api.grid.Grid` by merging blocks of
+        ``factor`` cells of a rectilinear :class:`~ESMF.api.grid.Grid` into
+        single cells, e.g. to coarsen a 0.25 degree grid to a 1 degree grid
+        with a factor of ``4``.  Every ``factor``-th cell face of the grid is
+        kept as a cell face of the new grid, the coordinates of the other
+        stagger locations are averaged over the blocks and the cell areas at
+        the :attr:`~ESMF.api.constants.StaggerLoc.CENTER` stagger location
+        are summed over the blocks.  Use
+        :meth:`~ESMF.api.field.Field.coarsen` to average data onto the new
+        grid.
+
+        *REQUIRED:*
+
+        :param factor: The number of cells merged along every dimension, a
+            single integer for all dimensions or a list with an integer for
+            each dimension.  The factors must divide ``max_index``.
+
+        *OPTIONAL:*
+
+        :param list mask_values: The values of the mask at the
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER` stagger location
+            which mark masked cells.  The cells of the new grid of which all
+            merged cells are masked are given a mask of ``1``, the other cells
+            a mask of ``0``.  If ``None``, the mask is not coarsened.
+
+        :return: A new :class:`~ESMF.api.grid.Grid`.
+        """
+
+        _require_mpi4py("Grid.coarsen")
+        factor = self._coarsen_factor_(factor)
+        vectors = self._coarsen_vectors_(factor)
+        if vectors is None:
+            raise GridArgumentError("only grids with rectilinear coordinates can be coarsened")
+
+        max_index = np.array(self.max_index, dtype=np.int32) // \
+            np.array(factor, dtype=np.int32)
+        if self.num_peri_dims > 0:
+            ret = Grid(max_index, num_peri_dims=1,
+                       periodic_dim=self.periodic_dim, pole_dim=self.pole_dim,
+                       coord_sys=self.coord_sys, coord_typekind=self.type)
+        else:
+            ret = Grid(max_index, coord_sys=self.coord_sys,
+                       coord_typekind=self.type)
+
+        for stagger in sorted(vectors):
+            for xyz, vector in enumerate(vectors[stagger]):
+                ret.set_coords(xyz, vector, staggerloc=stagger)
+
+        center = StaggerLoc.CENTER
+        if self.area[center] is not None:
+            ret.set_item(GridItem.AREA,
+                         self._coarsen_sum_(self.area[center], factor, ret))
+        if mask_values is not None and self.mask[center] is not None:
+            active = ~np.isin(self.mask[center], mask_values)
+            active = self._coarsen_sum_(active, factor, ret)
+            ret.set_item(GridItem.MASK, np.where(active > 0, 0, 1))
+
+        return ret
+
     def copy(self):
         """
         Copy a :class:`~ESMF.api.grid.Grid` in an ESMF-safe manner.
@@ -730,6 +945,102 @@ class Grid(object):
                 ESMP_GridDestroy(self)
                 self._finalized = True
 
+    def fingerprint(self, refresh=False):
+        """
+        Return a digest of the geometry, masks and decomposition of the
+        :class:`~ESMF.api.grid.Grid`, suitable as a key when caching
+        anything computed from it (e.g. regridding weights or areas).  The
+        coordinates, masks and areas of every stagger location are hashed
+        directly from the ESMF buffers together with the bounds, the
+        periodicity, the coordinate system and the number of PETs, so the
+        digest describes the part of the grid on the current PET.
+
+        :note: The digest is memoized and recomputed after coordinates or
+            items are added.  Values written in place through the aliased
+            arrays cannot be detected, pass ``refresh=True`` after
+            modifying them.
+
+        *OPTIONAL:*
+
+        :param bool refresh: Recompute the digest even if it was memoized.
+
+        :return: A hexadecimal digest string.
+        """
+
+        if self._fingerprint is None or refresh:
+            coords = self.coords
+            staggers = []
+            for stagger in range(2 ** self.rank):
+                if not self.staggerloc[stagger]:
+                    continue
+                # rectilinear coordinates are fully described by the vectors
+                if self.rectilinear:
+                    coords_stagger = self._coords_1d[stagger]
+                else:
+                    coords_stagger = coords[stagger]
+                staggers.append([stagger,
+                                 self.lower_bounds[stagger],
+                                 self.upper_bounds[stagger],
+                                 coords_stagger,
+                                 self.mask[stagger],
+                                 self.area[stagger]])
+
+            coord_sys = self.coord_sys
+            if coord_sys is None:
+                coord_sys = CoordSys.SPH_DEG
+
+            self._fingerprint = _fingerprint("Grid", self.rank, self.type,
+                                             coord_sys, self.num_peri_dims,
+                                             self.periodic_dim, self.pole_dim,
+                                             pet_count(), local_pet(),
+                                             staggers)
+
+        return self._fingerprint
+
+    def get_cell_areas(self, chunk_size=None):
+        """
+        Compute the areas of the local cells of a 2D
+        :class:`~ESMF.api.grid.Grid` from the coordinates at the
+        :attr:`~ESMF.api.constants.StaggerLoc.CORNER` stagger location,
+        without creating a :class:`~ESMF.api.field.Field`.  Cells are bounded
+        by great circle arcs on spherical grids and the areas are given on the
+        unit sphere, as computed by ESMF.
+
+        :note: In parallel the corners of all local cells must be available on
+            the local PET.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of cells processed at once, this
+            bounds the temporary memory used for large grids.
+
+        :return: A numpy array of cell areas of the size of the
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER` stagger location.
+        """
+
+        return self._cell_geometry_(polygon_areas, chunk_size)
+
+    def get_cell_centroids(self, chunk_size=None):
+        """
+        Compute the centroids of the local cells of a 2D
+        :class:`~ESMF.api.grid.Grid` from the coordinates at the
+        :attr:`~ESMF.api.constants.StaggerLoc.CORNER` stagger location.
+
+        :note: In parallel the corners of all local cells must be available on
+            the local PET.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of cells processed at once, this
+            bounds the temporary memory used for large grids.
+
+        :return: A list of numpy arrays, one for each coordinate dimension,
+            of the size of the :attr:`~ESMF.api.constants.StaggerLoc.CENTER`
+            stagger location.
+        """
+
+        return self._cell_geometry_(polygon_centroids, chunk_size)
+
     def get_coords(self, coord_dim, staggerloc=None):
         """
         Return a numpy array of coordinates at a specified stagger 
@@ -768,6 +1079,45 @@ class Grid(object):
 
         return ret
 
+    def get_coords_1d(self, coord_dim, staggerloc=None):
+        """
+        Return the 1D vector of coordinates of a rectilinear
+        :class:`~ESMF.api.grid.Grid` at a specified stagger location. The
+        returned array is NOT a copy, it is directly aliased to the underlying
+        memory allocated by ESMF.
+
+        *REQUIRED:*
+
+        :param int coord_dim: The dimension number of the coordinates to return
+            e.g. ``[x, y, z] = (0, 1, 2)``, or ``[lat, lon] = (0, 1)``.
+
+        *OPTIONAL:*
+
+        :param StaggerLoc staggerloc: The stagger location of the coordinate
+            values. If ``None``, defaults to
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER`
+            in 2D and :attr:`~ESMF.api.constants.StaggerLoc.CENTER_VCENTER` in
+            3D.
+
+        :return: A 1D numpy array of coordinate values along ``coord_dim``.
+        """
+
+        if not self.rectilinear:
+            raise GridArgumentError("1D coordinates are only available on rectilinear grids")
+
+        # handle the default case
+        if staggerloc is None:
+            staggerloc = StaggerLoc.CENTER
+        elif type(staggerloc) is list:
+            raise GridSingleStaggerloc
+        elif type(staggerloc) is tuple:
+            raise GridSingleStaggerloc
+
+        self._link_pending_coords_()
+        assert (self._coords_1d[staggerloc][coord_dim] is not None)
+
+        return self._coords_1d[staggerloc][coord_dim]
+
     def get_item(self, item, staggerloc=None):
         """
         Return a numpy array of item values at a specified stagger
@@ -810,20 +1160,481 @@ class Grid(object):
 
         return ret
 
-    def set_coords(self, staggerloc, item_data):
-        raise MethodNotImplemented
-        # check sizes
-        # assert (self.coords[staggerloc][:,:,coord_dim].shape == 
-        #         coord_data.shape)
-        # use user coordinates to initialize underlying ESMF data
-        # self.coords[staggerloc][:,:,coord_dim] = coord_data.copy()
-
-    def set_item(self, item, staggerloc, item_data):
-        raise MethodNotImplemented
-        # check sizes
-        # set item_out = item_data.copy()
-        # set the item as a grid property and return this pointer
-        # self.item[staggerloc_local] = item_out
+    def locate(self, lons, lats, chunk_size=None):
+        """
+        Find the local cells of a 2D :class:`~ESMF.api.grid.Grid` which
+        contain a set of points, with the bilinear weights of the cell
+        corners at the points.  The cells are given by the coordinates at the
+        :attr:`~ESMF.api.constants.StaggerLoc.CORNER` stagger location and
+        are bounded by great circle arcs on spherical grids.  A spatial index
+        of the cells is built on the first call and kept with the
+        :class:`~ESMF.api.grid.Grid` for later calls.
+
+        :note: The index is rebuilt when the
+            :meth:`~ESMF.api.grid.Grid.fingerprint` of the grid changes, pass
+            ``refresh=True`` to it after modifying the corners in place.  In
+            parallel only the cells of the local PET are searched.
+
+        *REQUIRED:*
+
+        :param lons: A numpy array of the longitudes (or ``x`` coordinates of
+            cartesian grids) of the points.
+        :param lats: A numpy array of the latitudes (or ``y`` coordinates of
+            cartesian grids) of the points.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of points located at once, this
+            bounds the temporary memory used for large queries.
+
+        :return: A tuple of a tuple of two numpy arrays of the local indices
+            of the cell containing every point into the arrays of the
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER` stagger location,
+            ``-1`` for points outside all local cells, and a numpy array with
+            a last dimension of size 4 of the weights of the corners
+            ``(i, j)``, ``(i+1, j)``, ``(i+1, j+1)`` and ``(i, j+1)`` of the
+            cell ``(i, j)``.
+        """
+
+        digest = self.fingerprint()
+        if self._spatial_index is None or self._spatial_index[0] != digest:
+            self._spatial_index = (digest,
+                                   SpatialIndex(self._cell_vertices_(),
+                                                coord_sys=self.coord_sys))
+
+        cells, weights = self._spatial_index[1].locate(lons, lats,
+                                                       chunk_size=chunk_size)
+
+        ny = self.size[StaggerLoc.CENTER][1]
+        found = (cells >= 0)
+        index = (np.where(found, cells // ny, -1),
+                 np.where(found, cells % ny, -1))
+
+        return index, weights
+
+    def mask_from(self, values, missing_value=None, nan=True, predicate=None,
+                  staggerloc=None):
+        """
+        Set the :attr:`~ESMF.api.constants.GridItem.MASK` of the
+        :class:`~ESMF.api.grid.Grid` at a stagger location from data values
+        in a single vectorized pass.  Cells with missing values are given a
+        mask of ``1`` and the other cells a mask of ``0``, so the mask is
+        used in :class:`~ESMF.api.regrid.Regrid` with ``src_mask_values`` or
+        ``dst_mask_values`` of ``[1]``.  The mask item is added if it has not
+        been added yet.
+
+        :note: :class:`~ESMF.api.regrid.Regrid` objects created with mask
+            values before the mask changes keep using the previous mask, see
+            :attr:`~ESMF.api.regrid.Regrid.masks_changed`.
+
+        *REQUIRED:*
+
+        :param values: A :class:`~ESMF.api.field.Field` on the
+            :class:`~ESMF.api.grid.Grid`, or a numpy array of the global or
+            local shape of the stagger location, optionally with leading
+            (e.g. ungridded) dimensions.  A cell is masked if any of its
+            values is missing.  The masked values of a numpy masked array are
+            missing.
+
+        *OPTIONAL:*
+
+        :param missing_value: A value, or a list of values, which are
+            missing.
+        :param bool nan: Set to ``False`` to keep NaN values unmasked.
+            Defaults to ``True``.
+        :param predicate: A function of the data values which returns a
+            boolean numpy array that is ``True`` for missing values, e.g.
+            ``lambda data: data < 0``.
+        :param StaggerLoc staggerloc: The stagger location of the mask.  If
+            ``None``, defaults to the stagger location of a
+            :class:`~ESMF.api.field.Field`, or to
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER`.
+
+        :return: ``True`` if the mask values changed.
+        """
+
+        from ESMF.api.field import Field
+
+        if isinstance(values, Field):
+            if values.grid is not self and \
+                    values.grid.struct is not self.struct:
+                raise GridArgumentError("the Field is not built on this Grid")
+            if staggerloc is None:
+                staggerloc = values.staggerloc
+            values = values.data
+
+        # handle the default case
+        if staggerloc is None:
+            staggerloc = StaggerLoc.CENTER
+        elif type(staggerloc) is list:
+            raise GridSingleStaggerloc
+        elif type(staggerloc) is tuple:
+            raise GridSingleStaggerloc
+
+        _require_mpi4py("Grid.mask_from")
+        masked = _masked_cells(values, self.rank, missing_value=missing_value,
+                               nan=nan, predicate=predicate)
+        self._verify_grid_bounds_(staggerloc)
+        mask = self._global_values_(masked, staggerloc)
+        if mask is None:
+            raise GridArgumentError("values of shape {0} do not match the "
+                                    "stagger location of global shape "
+                                    "{1}".format(np.shape(values),
+                                    tuple(self._global_shape_(staggerloc))))
+        mask = mask.astype(np.int32)
+
+        old = self.mask[staggerloc]
+        changed = old is None or bool(np.any(old != mask))
+        changed = any(_allgather(changed))
+        if changed:
+            self.set_item(GridItem.MASK, mask, staggerloc=staggerloc)
+
+        return changed
+
+    @staticmethod
+    def plan_decomp(max_index=None, mask=None, pets=None, filename=None,
+                    filetype=None, reg_decomp=None, decompflag=None,
+                    tolerance=0.05):
+        """
+        Plan the regular decomposition of a 2D :class:`~ESMF.api.grid.Grid`
+        created from file so that the active (unmasked) cells, which carry
+        the work of regridding, are balanced over the PETs.  Every
+        factorization of the number of PETs into ``reg_decomp`` and every
+        combination of the :attr:`~ESMF.api.constants.DecompFlag.BALANCED`,
+        :attr:`~ESMF.api.constants.DecompFlag.RESTFIRST` and
+        :attr:`~ESMF.api.constants.DecompFlag.RESTLAST` decomposition flags,
+        which divide the grid into contiguous blocks, is evaluated, and among
+        the plans within ``tolerance`` of the best balance the one with the
+        most square blocks is chosen.
+        The returned plan can be passed as the ``reg_decomp`` argument of
+        :class:`~ESMF.api.grid.Grid` to apply it.
+
+        *REQUIRED:*
+
+        Either ``max_index`` or ``filename`` and ``filetype``.
+
+        :param list max_index: The number of grid cells in each dimension.
+        :param str filename: The name of a NetCDF grid file to read the number
+            of grid cells from.
+        :param FileFormat filetype: The grid
+            :attr:`~ESMF.api.constants.FileFormat`.
+
+        *OPTIONAL:*
+
+        :param mask: A numpy array of the global shape of the grid which is
+            non zero for the active cells.  If ``None``, all cells are active.
+        :param int pets: The number of PETs.  If ``None``, defaults to
+            ``pet_count()``.
+        :param list reg_decomp: Evaluate this decomposition instead of
+            searching for one, e.g. to report the balance of the default
+            ``[pet_count(), 1]`` decomposition.
+        :param list decompflag: The decomposition flags of ``reg_decomp``,
+            :attr:`~ESMF.api.constants.DecompFlag.CYCLIC` is not supported.
+            If ``None``, defaults to
+            :attr:`~ESMF.api.constants.DecompFlag.BALANCED` in each dimension.
+        :param float tolerance: The relative imbalance traded for contiguous
+            blocks.  Defaults to ``0.05``.
+
+        :return: A :class:`~ESMF.util.decomp.DecompPlan` with the
+            ``reg_decomp`` and ``decompflag`` of the decomposition, the
+            expected number of active cells of every DE in ``counts`` and the
+            largest count over the mean in ``imbalance``.
+        """
+
+        if max_index is None:
+            if (filename is None) or (filetype is None):
+                raise GridArgumentError("must supply either max_index or filename and filetype to plan a decomposition")
+            if filetype == FileFormat.SCRIP:
+                _, max_index = ESMP_ScripInq(filename)
+            elif filetype == FileFormat.GRIDSPEC:
+                _, _, max_index = ESMP_GridspecInq(filename)
+            else:
+                raise GridArgumentError("filetype must be SCRIP or GRIDSPEC for Grid objects")
+        if len(max_index) != 2:
+            raise GridArgumentError("decompositions can only be planned for 2D grids")
+
+        if pets is None:
+            pets = pet_count()
+
+        if reg_decomp is None:
+            return _plan_decomp(max_index, pets, mask=mask,
+                                tolerance=tolerance)
+
+        if np.prod(reg_decomp) > pets:
+            raise GridArgumentError("reg_decomp has more DEs than PETs")
+        if decompflag is None:
+            decompflag = [DecompFlag.BALANCED, DecompFlag.BALANCED]
+        decompflag = np.array(decompflag, dtype=np.int32)
+        if DecompFlag.CYCLIC in decompflag:
+            raise GridArgumentError("CYCLIC decompositions are not supported for Grid objects")
+        counts = _decomp_counts(max_index, reg_decomp, decompflag, mask=mask)
+        mean = counts.mean()
+        imbalance = float(counts.max() / mean) if mean > 0 else 1.
+
+        return DecompPlan(list(reg_decomp), decompflag, counts, imbalance)
+
+    def set_coords(self, coord_dim, coord_data, staggerloc=None):
+        """
+        Set the coordinates of one coordinate dimension of the
+        :class:`~ESMF.api.grid.Grid` at a specified stagger location from
+        global coordinate values in a single assignment.  Only the part of
+        the values within ``lower_bounds`` and ``upper_bounds`` is copied, so
+        every PET can pass the same global values.  The coordinates are added
+        if they have not been added yet.
+
+        *REQUIRED:*
+
+        :param int coord_dim: The dimension number of the coordinates to set
+            e.g. ``[x, y, z] = (0, 1, 2)``, or ``[lat, lon] = (0, 1)``.
+        :param coord_data: The coordinate values, either:
+
+            - a numpy array of the global shape of the stagger location,
+            - a numpy array of the local shape of the stagger location, given
+              by ``upper_bounds - lower_bounds``,
+            - a 1D vector along the dimension ``coord_dim`` of the
+              :class:`~ESMF.api.grid.Grid`, which is broadcast along the other
+              dimensions,
+            - a CF-style ``(n, 2)`` array of cell bounds along the dimension
+              ``coord_dim``, where ``n`` is the number of cells.  The bounds
+              give the cell edges at stagger locations on the cell faces along
+              ``coord_dim`` (e.g. :attr:`~ESMF.api.constants.StaggerLoc.CORNER`)
+              and the midpoints of the cells otherwise,
+            - a scalar.
+
+        *OPTIONAL:*
+
+        :param StaggerLoc staggerloc: The stagger location of the coordinate
+            values. If ``None``, defaults to
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER`
+            in 2D and :attr:`~ESMF.api.constants.StaggerLoc.CENTER_VCENTER` in
+            3D.
+
+        :return: A numpy array of coordinate values at the specified staggerloc.
+        """
+
+        # handle the default case
+        if staggerloc is None:
+            staggerloc = StaggerLoc.CENTER
+        elif type(staggerloc) is list:
+            raise GridSingleStaggerloc
+        elif type(staggerloc) is tuple:
+            raise GridSingleStaggerloc
+
+        if not self.staggerloc[staggerloc]:
+            self.add_coords(staggerloc=staggerloc, init_values=False)
+        self._link_pending_coords_()
+        self._fingerprint = None
+
+        coord_data = np.asanyarray(coord_data)
+        values = self._global_values_(coord_data, staggerloc)
+        if values is None:
+            values = self._coord_vector_(coord_dim, coord_data, staggerloc)
+        if values is None:
+            raise GridArgumentError("coordinate values of shape {0} do not "
+                                    "match the stagger location of global "
+                                    "shape {1}".format(
+                                    coord_data.shape,
+                                    tuple(self._global_shape_(staggerloc))))
+
+        # rectilinear coordinates are set through the 1D vectors
+        if self.rectilinear:
+            coords = self._coords_1d[staggerloc][coord_dim]
+            if values.ndim == self.rank:
+                vector = values[tuple(slice(None) if dim == coord_dim else 0
+                                      for dim in range(self.rank))]
+                if np.any(values != vector.reshape(
+                        self._broadcast_shape_(coord_dim))):
+                    raise GridArgumentError("coordinates of a rectilinear "
+                                            "grid must only vary along their "
+                                            "own dimension")
+                values = vector
+            coords[...] = values.reshape(-1)
+            return self.coords[staggerloc][coord_dim]
+
+        coords = self.coords[staggerloc][coord_dim]
+        coords[...] = values
+
+        return coords
+
+    def set_item(self, item, item_data, staggerloc=None):
+        """
+        Set the values of a :class:`~ESMF.api.grid.Grid` item (mask or areas)
+        at a specified stagger location from global values in a single
+        assignment.  Only the part of the values within ``lower_bounds`` and
+        ``upper_bounds`` is copied, so every PET can pass the same global
+        values.  The item is added if it has not been added yet.
+
+        *REQUIRED:*
+
+        :param GridItem item: The :attr:`~ESMF.api.constants.GridItem` to
+            set.
+        :param item_data: The item values, either a numpy array of the global
+            shape of the stagger location, a numpy array of the local shape of
+            the stagger location, given by ``upper_bounds - lower_bounds``, or
+            a scalar.
+
+        *OPTIONAL:*
+
+        :param StaggerLoc staggerloc: The stagger location of the item
+            values. If ``None``, defaults to
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER` in 2D and
+            :attr:`~ESMF.api.constants.StaggerLoc.CENTER_VCENTER` in 3D.
+
+        :return: A numpy array of mask or area values at the specified staggerloc.
+        """
+
+        # handle the default case
+        if staggerloc is None:
+            staggerloc = StaggerLoc.CENTER
+        elif type(staggerloc) is list:
+            raise GridSingleStaggerloc
+        elif type(staggerloc) is tuple:
+            raise GridSingleStaggerloc
+
+        if item == GridItem.MASK:
+            items = self.mask
+        elif item == GridItem.AREA:
+            items = self.area
+        else:
+            raise GridItemNotSupported
+
+        if items[staggerloc] is None:
+            self.add_item(item, staggerloc=staggerloc, init_values=False)
+        self._fingerprint = None
+
+        item_data = np.asanyarray(item_data)
+        values = self._global_values_(item_data, staggerloc)
+        if values is None:
+            raise GridArgumentError("item values of shape {0} do not match "
+                                    "the stagger location of global shape "
+                                    "{1}".format(item_data.shape,
+                                    tuple(self._global_shape_(staggerloc))))
+
+        ret = self.get_item(item, staggerloc=staggerloc)
+        ret[...] = values
+        if item == GridItem.MASK:
+            self._mask_version += 1
+
+        return ret
+
+    def subset(self, bbox=None, index_ranges=None, halo=1):
+        """
+        Create a new, smaller :class:`~ESMF.api.grid.Grid` from the cells of
+        the :class:`~ESMF.api.grid.Grid` within a bounding box or index
+        ranges, plus a halo of cells around them.  Unlike slicing, the result
+        is a new ESMF Grid with its own decomposition, so it can be used in
+        :class:`~ESMF.api.regrid.Regrid` to search only the region of
+        interest.  The coordinates of all stagger locations and the masks and
+        areas are copied to the new grid.  A subset which covers the whole
+        periodic dimension of the grid stays periodic, otherwise it may
+        wrap around the periodic dimension and is not periodic.
+
+        :note: In parallel every PET receives the values of the whole subset
+            to fill its part of the new grid, this requires mpi4py.
+
+        *REQUIRED:*
+
+        Either ``bbox`` or ``index_ranges``.
+
+        :param list bbox: A list of ``[min, max]`` pairs of coordinate values,
+            one for each coordinate dimension, e.g.
+            ``[[lon_min, lon_max], [lat_min, lat_max]]``.  The cells with
+            their centers within the box are selected, on spherical grids the
+            longitude range may cross the dateline (e.g. ``[170, -170]``).
+        :param list index_ranges: A list of ``[start, stop]`` pairs of global
+            cell indices, one for each dimension, ``None`` selects the whole
+            dimension.  Along the periodic dimension ``start`` may be larger
+            than ``stop`` to wrap around.
+
+        *OPTIONAL:*
+
+        :param int halo: The number of cells added around the selected cells
+            in every dimension.  Defaults to ``1``, so that the cells which
+            overlap the edges of ``bbox`` are included.
+
+        :return: A new :class:`~ESMF.api.grid.Grid`.
+        """
+
+        if (bbox is None) == (index_ranges is None):
+            raise GridArgumentError("must supply either bbox or index_ranges")
+        _require_mpi4py("Grid.subset")
+
+        if bbox is not None:
+            selected = self._select_bbox_(bbox)
+        else:
+            if len(index_ranges) != self.rank:
+                raise GridArgumentError("index_ranges must have an entry for every dimension of the grid")
+            selected = []
+            for dim, index_range in enumerate(index_ranges):
+                n = self.max_index[dim]
+                if index_range is None:
+                    start, stop = 0, n
+                else:
+                    start, stop = index_range
+                sel = np.zeros(n, dtype=bool)
+                if start <= stop:
+                    sel[start:stop] = True
+                elif self.num_peri_dims > 0 and dim == self.periodic_dim:
+                    sel[start:] = True
+                    sel[:stop] = True
+                else:
+                    raise GridArgumentError("index ranges can only wrap around the periodic dimension")
+                selected.append(sel)
+
+        # the first cell and number of cells along every dimension
+        starts = []
+        counts = []
+        for dim, sel in enumerate(selected):
+            periodic = (self.num_peri_dims > 0 and dim == self.periodic_dim)
+            start, count = self._index_cover_(sel, periodic)
+            if count == 0:
+                raise GridArgumentError("no cells selected along dimension {0}".format(dim))
+            n = self.max_index[dim]
+            if periodic:
+                start = (start - halo) % n
+                count = min(count + 2 * halo, n)
+            else:
+                stop = min(start + count + halo, n)
+                start = max(start - halo, 0)
+                count = stop - start
+            starts.append(start)
+            counts.append(count)
+
+        # the subset stays periodic if it covers the whole periodic dimension
+        max_index = np.array(counts, dtype=np.int32)
+        if self.num_peri_dims > 0 and \
+                counts[self.periodic_dim] == self.max_index[self.periodic_dim]:
+            ret = Grid(max_index, num_peri_dims=1,
+                       periodic_dim=self.periodic_dim, pole_dim=self.pole_dim,
+                       coord_sys=self.coord_sys, coord_typekind=self.type)
+        else:
+            ret = Grid(max_index, coord_sys=self.coord_sys,
+                       coord_typekind=self.type)
+
+        for stagger in range(2 ** self.rank):
+            if not self.staggerloc[stagger]:
+                continue
+
+            # global indices of the stagger locations of the subset, staggers
+            # on the cell faces have one more location unless the subset wraps
+            nstagger = ret._global_shape_(stagger)
+            extent = self._global_shape_(stagger)
+            index = [(starts[dim] + np.arange(nstagger[dim])) % extent[dim]
+                     for dim in range(self.rank)]
+
+            for xyz in range(self.rank):
+                values = self._gather_region_(self.coords[stagger][xyz],
+                                              stagger, index)
+                ret.set_coords(xyz, values, staggerloc=stagger)
+
+            for item, items in ((GridItem.MASK, self.mask),
+                                (GridItem.AREA, self.area)):
+                if items[stagger] is not None:
+                    values = self._gather_region_(items[stagger], stagger,
+                                                  index)
+                    ret.set_item(item, values, staggerloc=stagger)
+
+        return ret
 
     ################ Helper functions ##########################################
 
@@ -840,110 +1651,563 @@ class Grid(object):
             # find the local size of this stagger
             self._size[stagger] = np.array(self.upper_bounds[stagger] -
                                        self.lower_bounds[stagger])
+
+    def _global_shape_(self, stagger):
+        # the global number of stagger locations in each dimension, staggers
+        # on the cell faces along a dimension have one more location, except
+        # along the periodic dimension where they wrap around
+        offset = np.array([(int(stagger) >> dim) & 1
+                           for dim in range(self.rank)], dtype=np.int32)
+        if self.num_peri_dims > 0:
+            offset[self.periodic_dim] = 0
+
+        return np.array(self.max_index) + offset
+
+    def _broadcast_shape_(self, coord_dim):
+        bshape = [1] * self.rank
+        bshape[coord_dim] = -1
+
+        return bshape
+
+    def _global_values_(self, data, stagger):
+        # values of a scalar, or of an array of the global or local shape of a
+        # stagger location, within the bounds of the local PET
+        if data.ndim == 0:
+            return data
+        elif data.ndim != self.rank:
+            return None
+
+        lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
+        if data.shape == tuple(self._global_shape_(stagger)):
+            return data[tuple(slice(l, u) for l, u in zip(lb, ub))]
+        elif data.shape == tuple(ub - lb):
+            return data
+
+        return None
+
+    def _coord_vector_(self, coord_dim, data, stagger):
+        # values of a global 1D vector or of CF-style (n, 2) cell bounds along
+        # a coordinate dimension within the bounds of the local PET, shaped
+        # to broadcast along the other dimensions
+        lb = self.lower_bounds[stagger][coord_dim]
+        ub = self.upper_bounds[stagger][coord_dim]
+        ncells = self.max_index[coord_dim]
+        nstagger = self._global_shape_(stagger)[coord_dim]
+
+        if data.ndim == 1 and data.size == nstagger:
+            vector = data[lb:ub]
+        elif data.ndim == 1 and data.size == ub - lb:
+            vector = data
+        elif data.shape == (ncells, 2):
+            # staggers on the cell faces along this dimension take the edges
+            if (int(stagger) >> coord_dim) & 1:
+                if nstagger == ncells:
+                    edges = data[:, 0]
+                else:
+                    edges = np.concatenate((data[:, 0], data[-1:, 1]))
+            # and the other staggers take the midpoints
+            else:
+                edges = data.mean(axis=1)
+            vector = edges[lb:ub]
         else:
-            lb, ub = ESMP_GridGetCoordBounds(self, staggerloc=stagger)
-            assert(self.lower_bounds[stagger].all() == lb.all())
-            assert(self.upper_bounds[stagger].all() == ub.all())
-            assert(self.size[stagger].all() == np.array(ub-lb).all())
+            return None
+
+        return vector.reshape(self._broadcast_shape_(coord_dim))
+
+    def _coarsen_factor_(self, factor):
+        if np.ndim(factor) == 0:
+            factor = [factor] * self.rank
+        if len(factor) != self.rank:
+            raise GridArgumentError("factor must have an entry for every dimension of the grid")
+        factor = [int(f) for f in factor]
+        for n, f in zip(self.max_index, factor):
+            if f < 1 or n % f:
+                raise GridArgumentError("coarsening factors {0} do not divide the grid of shape {1}".format(factor, tuple(self.max_index)))
+
+        return factor
+
+    def _coord_vectors_(self, stagger):
+        # the global 1D coordinate vectors of a stagger location, or None if
+        # the coordinates vary along other dimensions than their own on any PET
+        lb = self.lower_bounds[stagger]
+        local = []
+        for xyz in range(self.rank):
+            coord = np.asarray(self.coords[stagger][xyz])
+            if coord.size == 0:
+                local.append((lb[xyz], coord.reshape(-1)))
+                continue
+            vector = coord[tuple(slice(None) if dim == xyz else 0
+                                 for dim in range(self.rank))]
+            if np.any(coord != vector.reshape(self._broadcast_shape_(xyz))):
+                local.append(None)
+            else:
+                local.append((lb[xyz], vector))
+
+        nstagger = self._global_shape_(stagger)
+        ret = [np.zeros(nstagger[xyz], dtype=np.float64)
+               for xyz in range(self.rank)]
+        for parts in _allgather(local):
+            for xyz, part in enumerate(parts):
+                if part is None:
+                    return None
+                start, vector = part
+                ret[xyz][start:start + vector.size] = vector
+
+        return ret
+
+    def _coarsen_vectors_(self, factor):
+        # the global 1D coordinate vectors of every stagger location of the
+        # grid coarsened by integer factors, or None if it is not rectilinear
+        if self.coord_sys == CoordSys.SPH_RAD:
+            period = 2. * np.pi
+        elif self.coord_sys == CoordSys.CART:
+            period = None
+        else:
+            period = 360.
+
+        ret = {}
+        for stagger in range(2 ** self.rank):
+            if not self.staggerloc[stagger]:
+                continue
+            vectors = self._coord_vectors_(stagger)
+            if vectors is None:
+                return None
+            ret[stagger] = [_coarsen_vector(vector, factor[xyz],
+                                            (stagger >> xyz) & 1,
+                                            period if xyz == 0 else None)
+                            for xyz, vector in enumerate(vectors)]
+
+        return ret
+
+    def _coarsen_sum_(self, array, factor, coarse):
+        # sum the local values at the CENTER stagger location, with any
+        # leading dimensions, over the blocks of the local cells of the
+        # coarsened grid
+        center = StaggerLoc.CENTER
+        coarse._verify_grid_bounds_(center)
+        parts = _allgather(_block_sum(array, self.lower_bounds[center],
+                                      factor))
+
+        return _add_blocks(parts, coarse.lower_bounds[center],
+                           coarse.upper_bounds[center])
+
+    def _coarse_factor_(self, coarse):
+        # the coarsening factors which give the coordinates of a coarse grid,
+        # or None if the grids are not aligned
+        if not isinstance(coarse, Grid) or coarse.rank != self.rank or \
+                coarse.coord_sys != self.coord_sys or \
+                coarse.num_peri_dims != self.num_peri_dims or \
+                (self.num_peri_dims > 0 and
+                 coarse.periodic_dim != self.periodic_dim):
+            return None
+        factor = []
+        for n, m in zip(self.max_index, coarse.max_index):
+            if m < 1 or n % m:
+                return None
+            factor.append(int(n // m))
+
+        # compare the coordinates of the stagger locations of both grids,
+        # the cell faces if available
+        staggers = [stagger for stagger in range(2 ** self.rank)
+                    if self.staggerloc[stagger] and coarse.staggerloc[stagger]]
+        if not staggers:
+            return None
+        if StaggerLoc.CORNER in staggers:
+            staggers = [StaggerLoc.CORNER]
+        vectors = self._coarsen_vectors_(factor)
+        if vectors is None:
+            return None
+        for stagger in staggers:
+            other = coarse._coord_vectors_(stagger)
+            if other is None:
+                return None
+            for xyz, (mine, theirs) in enumerate(zip(vectors[stagger], other)):
+                diff = mine - theirs
+                if xyz == 0 and self.coord_sys != CoordSys.CART:
+                    period = 2. * np.pi \
+                        if self.coord_sys == CoordSys.SPH_RAD else 360.
+                    diff = np.mod(diff + period / 2., period) - period / 2.
+                scale = max(np.max(np.abs(theirs)), 1.)
+                if np.any(np.abs(diff) > 1e-10 * scale):
+                    return None
+
+        return factor
+
+    def _select_bbox_(self, bbox):
+        # the global indices along every dimension of the cells with their
+        # centers within a bounding box, on any PET
+        if len(bbox) != self.rank:
+            raise GridArgumentError("bbox must have an entry for every coordinate dimension of the grid")
+        if not self.staggerloc[StaggerLoc.CENTER]:
+            raise GridArgumentError("the CENTER stagger location is required to select cells in a bbox")
+
+        inside = True
+        for xyz, (cmin, cmax) in enumerate(bbox):
+            coord = self.coords[StaggerLoc.CENTER][xyz]
+            # longitudes are compared modulo the period
+            if xyz == 0 and self.coord_sys != CoordSys.CART:
+                period = 2. * np.pi if self.coord_sys == CoordSys.SPH_RAD \
+                    else 360.
+                width = cmax - cmin
+                if width < 0 or width > period:
+                    width = width % period
+                inside = inside & (np.mod(coord - cmin, period) <= width)
+            else:
+                inside = inside & (coord >= cmin) & (coord <= cmax)
+
+        lb = self.lower_bounds[StaggerLoc.CENTER]
+        selected = []
+        for dim in range(self.rank):
+            axes = tuple(axis for axis in range(self.rank) if axis != dim)
+            local = np.any(inside, axis=axes)
+            sel = np.zeros(self.max_index[dim], dtype=bool)
+            sel[lb[dim]:lb[dim] + local.size] = local
+            selected.append(np.any(_allgather(sel), axis=0))
+
+        return selected
+
+    def _index_cover_(self, selected, periodic):
+        # the first index and number of indices of the smallest range, wrapping
+        # around if periodic, which covers the selected indices
+        index = np.where(selected)[0]
+        if index.size == 0:
+            return 0, 0
+        if not periodic:
+            return index[0], index[-1] - index[0] + 1
+
+        # leave out the largest gap between selected indices around the circle
+        n = selected.size
+        gaps = np.diff(np.append(index, index[0] + n))
+        largest = np.argmax(gaps)
+        start = index[(largest + 1) % index.size]
+        return start, n - gaps[largest] + 1
+
+    def _gather_region_(self, array, stagger, index):
+        # assemble the values at the global indices along every dimension of
+        # a stagger location from the parts of all PETs
+        lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
+        pos = []
+        loc = []
+        for dim, idx in enumerate(index):
+            p = np.where((idx >= lb[dim]) & (idx < ub[dim]))[0]
+            pos.append(p)
+            loc.append(idx[p] - lb[dim])
+        values = np.asarray(array)[np.ix_(*loc)]
+
+        ret = np.zeros(tuple(idx.size for idx in index), dtype=values.dtype)
+        for p, v in _allgather((pos, values)):
+            ret[np.ix_(*p)] = v
+
+        return ret
 
-    def _allocate_coords_(self, stagger, from_file=False):
+    def _inside_(self, stagger, index, lb=None, ub=None):
+        # whether the stagger locations at global indices (a tuple of index
+        # arrays, one for every dimension) are within bounds
+        if lb is None:
+            lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
+
+        return np.all([(idx >= l) & (idx < u)
+                       for idx, l, u in zip(index, lb, ub)], axis=0)
+
+    def _stagger_values_(self, arrays, stagger, index):
+        # the values of arrays of a stagger location at global indices (a
+        # tuple of index arrays, one for every dimension), taken from the
+        # local part or answered by the PETs holding them
+        lb = self.lower_bounds[stagger]
+        inside = self._inside_(stagger, index)
+        local = tuple(idx[inside] - l for idx, l in zip(index, lb))
+        ret = [np.empty(inside.shape, dtype=np.asarray(a).dtype)
+               for a in arrays]
+        for r, a in zip(ret, arrays):
+            r[inside] = np.asarray(a)[local]
+
+        missing = np.where(~inside)[0]
+        answers = []
+        for request in _allgather(tuple(idx[missing] for idx in index)):
+            pos = np.where(self._inside_(stagger, request))[0]
+            local = tuple(idx[pos] - l for idx, l in zip(request, lb))
+            answers.append((pos, [np.asarray(a)[local] for a in arrays]))
+        for reply in _allgather(answers):
+            pos, values = reply[local_pet()]
+            for r, v in zip(ret, values):
+                r[missing[pos]] = v
+
+        return ret
+
+    def _stagger_owners_(self, stagger, index):
+        # the PETs holding the stagger locations at global indices
+        owners = np.full(np.shape(index[0]), -1, dtype=np.int32)
+        bounds = _allgather((self.lower_bounds[stagger],
+                             self.upper_bounds[stagger]))
+        for pet, (lb, ub) in enumerate(bounds):
+            owners[self._inside_(stagger, index, lb, ub) & (owners < 0)] = pet
+
+        return owners
+
+    def _allocate_coords_(self, stagger, from_file=False, init_values=True):
         # this could be one of several entry points to the grid,
         # verify that bounds and other necessary data are available
         self._verify_grid_bounds_(stagger)
 
-        # allocate space for the coordinates on the Python side
-        self._coords[stagger][0] = np.zeros(shape = (self.size[stagger]),
-                                            dtype = constants._ESMF2PythonType[self.type])
-        self._coords[stagger][1] = np.zeros(shape = (self.size[stagger]),
-                                            dtype = constants._ESMF2PythonType[self.type])
-        if self.rank == 3:
-            self._coords[stagger][2] = np.zeros(shape = (self.size[stagger]),
-                                                dtype = constants._ESMF2PythonType[self.type])
+        # coordinates are either 1d or have the dimensionality of the grid
+        if (self.ndims < self.rank) and (self.ndims not in (0, 1)):
+            raise ValueError("Grid does not know how to handle coordinate arrays that are either 1 dimensional"
+                             "  or have dimensionality equivalent to the number coordinate dimensions of the Grid")
 
-        # link the ESMF allocations to the Python grid properties
-        # first if number of coordinate dimensions is equivalent to the grid rank
-        if (self.ndims == self.rank) or (self.ndims == 0):
-            for xyz in range(self.rank):
-                self._link_coord_buffer_(xyz, stagger)
-        # and this way if we have 1d coordinates
-        elif self.ndims < self.rank:
-            if not (self.ndims == 1):
-                raise ValueError("Grid does not know how to handle coordinate arrays that are either 1 dimensional"
-                                 "  or have dimensionality equivalent to the number coordinate dimensions of the Grid")
-            self._link_coord_buffer_1Dcoords(stagger)
+        if stagger in (StaggerLoc.CORNER, StaggerLoc.CORNER_VFACE):
+            self._has_corners = True
 
         # initialize to zeros, because ESMF doesn't handle that
-        if not from_file:
-            self._coords[stagger][0][...] = 0
-            self._coords[stagger][1][...] = 0
-            if self.rank == 3:
-               self._coords[stagger][2][...] = 0
+        if init_values and not from_file:
+            self._link_coords_(stagger)
+            for xyz in range(self.rank):
+                self._coords[stagger][xyz][...] = 0
+        # otherwise wait to link the ESMF allocations until they are accessed
+        else:
+            self._pending_coords.append(stagger)
 
-    def _allocate_items_(self, item, stagger, from_file=False):
+    def _allocate_items_(self, item, stagger, from_file=False, init_values=True):
         # this could be one of several entry points to the grid,
         # verify that bounds and other necessary data are available
         self._verify_grid_bounds_(stagger)
 
-        # if the item is a mask it is of type I4
-        if item == GridItem.MASK:
-            self._mask[stagger] = np.zeros(
-                shape=(self.size[stagger]),
-                dtype=constants._ESMF2PythonType[TypeKind.I4])
-        # if the item is area then it is of type R8
-        elif item == GridItem.AREA:
-            self._area[stagger] = np.zeros(
-                shape=(self.size[stagger]),
-                dtype=constants._ESMF2PythonType[TypeKind.R8])
-        else:
+        if item not in (GridItem.MASK, GridItem.AREA):
             raise GridItemNotSupported
 
-        # link the ESMF allocations to the grid properties
-        self._link_item_buffer_(item, stagger)
-
-        # initialize to zeros, because ESMF doesn't handle that
-        if not from_file:
+        # initialize the mask to ones and the area to zeros, because ESMF
+        # doesn't handle that
+        if init_values and not from_file:
+            self._link_item_buffer_(item, stagger)
             if item == GridItem.MASK:
                 self._mask[stagger][...] = 1
-            elif item == GridItem.AREA:
-                self._area[stagger][...] = 0
             else:
-                raise GridItemNotSupported
+                self._area[stagger][...] = 0
+        # otherwise wait to link the ESMF allocations until they are accessed
+        else:
+            self._pending_items.append((item, stagger))
+
+    def _link_pending_coords_(self):
+        while self._pending_coords:
+            self._link_coords_(self._pending_coords.pop(0))
+
+    def _link_pending_items_(self):
+        while self._pending_items:
+            self._link_item_buffer_(*self._pending_items.pop(0))
+
+    def _link_coords_(self, stagger):
+        # link the ESMF allocations to the Python grid properties
+        # first if number of coordinate dimensions is equivalent to the grid rank
+        if (self.ndims == self.rank) or (self.ndims == 0):
+            for xyz in range(self.rank):
+                self._link_coord_buffer_(xyz, stagger)
+        # and this way if we have 1d coordinates
+        elif self.ndims == 1:
+            self._link_coord_buffer_1Dcoords(stagger)
 
     def _link_coord_buffer_(self, coord_dim, stagger):
         # get the data pointer and bounds of the ESMF allocation
         data = ESMP_GridGetCoordPtr(self, coord_dim, staggerloc=stagger)
-        lb, ub = ESMP_GridGetCoordBounds(self, staggerloc=stagger)
+        lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
 
         gridCoordP = ndarray_from_esmf(data, self.type, ub-lb)
 
         # alias the coordinates to a grid property
         self._coords[stagger][coord_dim] = gridCoordP
 
-        if stagger in (StaggerLoc.CORNER, StaggerLoc.CORNER_VFACE):
-            self._has_corners = True
-
     def _link_coord_buffer_1Dcoords(self, stagger):
-        # get the data pointer and bounds of the ESMF allocation
-        lb, ub = ESMP_GridGetCoordBounds(self, staggerloc=stagger)
-
-        gc0 = ndarray_from_esmf(ESMP_GridGetCoordPtr(self, 0, staggerloc=stagger), self.type, ((ub - lb)[0],))
-        gc1 = ndarray_from_esmf(ESMP_GridGetCoordPtr(self, 1, staggerloc=stagger), self.type, ((ub - lb)[1],))
-        if self.rank == 3:
-            gc2 = ndarray_from_esmf(ESMP_GridGetCoordPtr(self, 2, staggerloc=stagger), self.type, ((ub - lb)[2],))
-            gc00, gc11, gc22 = np.meshgrid(gc0, gc1, gc2, indexing="ij")
-        elif self.rank == 2:
-            gc00, gc11 = np.meshgrid(gc0, gc1, indexing="ij")
-        else:
+        # get the bounds of the ESMF allocation
+        lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
+
+        if self.rank not in (2, 3):
             raise ValueError("Grid rank must be 2 or 3")
 
-        # alias the coordinates to a grid property
-        self._coords[stagger][0] = gc00
-        self._coords[stagger][1] = gc11
-        if self.rank == 3:
-            self._coords[stagger][2] = gc22
+        shape = tuple(ub - lb)
+        for xyz in range(self.rank):
+            gc = ndarray_from_esmf(ESMP_GridGetCoordPtr(self, xyz, staggerloc=stagger), self.type, (shape[xyz],))
+
+            # alias the 1D coordinates to a grid property, the full
+            # coordinates are a read-only broadcast view of the same memory
+            bshape = [1] * self.rank
+            bshape[xyz] = shape[xyz]
+            self._coords_1d[stagger][xyz] = gc
+            self._coords[stagger][xyz] = np.broadcast_to(gc.reshape(bshape), shape)
+
+    def _cell_corner_index_(self, dim):
+        # local indices of the lower and upper corners of the local cells
+        # along a dimension of the grid
+        center = StaggerLoc.CENTER
+        corner = StaggerLoc.CORNER
+        lower = np.arange(self.lower_bounds[center][dim],
+                          self.upper_bounds[center][dim])
+        upper = lower + 1
+
+        # the corners of periodic dimensions wrap around
+        if self.num_peri_dims > 0 and dim == self.periodic_dim:
+            upper = upper % self.max_index[dim]
+
+        lower = lower - self.lower_bounds[corner][dim]
+        upper = upper - self.lower_bounds[corner][dim]
+        if np.any(lower < 0) or np.any(upper < 0) or \
+                np.any(upper >= self.size[corner][dim]):
+            raise SerialMethod("the corners of the local cells are not all "
+                               "available on this PET")
+
+        return lower, upper
+
+    def _cell_vertices_(self, start=0, stop=None):
+        if self.rank != 2:
+            raise GridArgumentError("cell geometry can only be computed for 2D grids")
+        if not self.staggerloc[StaggerLoc.CORNER]:
+            raise GridArgumentError("the CORNER stagger location is required to compute cell geometry")
+
+        ilo, ihi = self._cell_corner_index_(0)
+        jlo, jhi = self._cell_corner_index_(1)
+        corners = self.coords[StaggerLoc.CORNER]
+
+        # corners of every cell in the rows start:stop in counterclockwise
+        # order in index space
+        ia, ib = ilo[start:stop], ihi[start:stop]
+        return [np.stack((coord[np.ix_(ia, jlo)], coord[np.ix_(ib, jlo)],
+                          coord[np.ix_(ib, jhi)], coord[np.ix_(ia, jhi)]),
+                         axis=-1).reshape(-1, 4) for coord in corners]
+
+    def _stagger_cells_(self, staggerloc):
+        # the cells between neighbouring points of a stagger location, as the
+        # coordinates of their vertices in counterclockwise order in index
+        # space and the flat local indices of the vertices
+        if self.rank != 2:
+            raise GridArgumentError("cells can only be formed on 2D grids")
+        if not self.staggerloc[staggerloc]:
+            raise GridArgumentError("the coordinates of the stagger location are required to form cells")
+
+        shape = tuple(self.size[staggerloc])
+        index = []
+        for dim in range(2):
+            lower = np.arange(shape[dim] - 1)
+            # the points of periodic dimensions wrap around
+            if self.num_peri_dims > 0 and dim == self.periodic_dim and \
+                    shape[dim] == self.max_index[dim]:
+                lower = np.arange(shape[dim])
+            index.append((lower, (lower + 1) % shape[dim]))
+        (ia, ib), (ja, jb) = index
+
+        flat = np.arange(shape[0] * shape[1]).reshape(shape)
+        cell = [np.stack((array[np.ix_(ia, ja)], array[np.ix_(ib, ja)],
+                          array[np.ix_(ib, jb)], array[np.ix_(ia, jb)]),
+                         axis=-1).reshape(-1, 4)
+                for array in list(self.coords[staggerloc][:2]) + [flat]]
+
+        return cell[:2], cell[2]
+
+    def _cell_geometry_(self, func, chunk_size):
+        coord_sys = self.coord_sys
+        if coord_sys is None:
+            coord_sys = CoordSys.SPH_DEG
+
+        # gather the corners of the cells a block of rows at a time
+        shape = tuple(self.size[StaggerLoc.CENTER])
+        if chunk_size is None:
+            rows = shape[0]
+        else:
+            rows = max(1, chunk_size // shape[1])
 
-        if stagger in (StaggerLoc.CORNER, StaggerLoc.CORNER_VFACE):
-            self._has_corners = True
+        ret = None
+        for start in range(0, shape[0], rows):
+            stop = min(start + rows, shape[0])
+            cell = self._cell_vertices_(start, stop)
+            out = func(cell, coord_sys=coord_sys, chunk_size=chunk_size)
+
+            if func is polygon_areas:
+                if ret is None:
+                    ret = np.zeros(shape, dtype=np.float64)
+                ret[start:stop] = out.reshape(stop - start, shape[1])
+            else:
+                if ret is None:
+                    ret = [np.zeros(shape, dtype=np.float64) for _ in out]
+                for xyz, o in enumerate(out):
+                    ret[xyz][start:stop] = o.reshape(stop - start, shape[1])
+
+        return ret
+
+    @staticmethod
+    def _cache_complete_(cached, staggerloc, items):
+        # check that the cache holds everything needed to create the grid
+        keys = ["rank", "ndims", "max_index"]
+        for stagger in staggerloc:
+            keys.append("lower_{0}".format(int(stagger)))
+            keys.append("coords_{0}_0".format(int(stagger)))
+        keys.extend("item_{0}".format(int(item)) for item in items)
+
+        return all(key in cached for key in keys)
+
+    def _create_from_cache_(self, cached, staggerloc, items):
+        # create an in-memory grid matching a grid file from its cache,
+        # return False on all PETs if the decomposition does not match the
+        # cached one on any PET
+        self._rank = int(cached["rank"])
+        self._ndims = int(cached["ndims"])
+        self._max_index = np.array(cached["max_index"], dtype=np.int32)
+
+        if self.num_peri_dims == 0:
+            self._struct = ESMP_GridCreateNoPeriDim(self.max_index)
+        else:
+            self._struct = ESMP_GridCreate1PeriDim(self.max_index)
+
+        matched = True
+        for stagger in staggerloc:
+            ESMP_GridAddCoord(self, staggerloc=stagger)
+            lb, ub = ESMP_GridGetCoordBounds(self, staggerloc=stagger)
+            if cached["coords_{0}_0".format(int(stagger))].shape != \
+                    tuple(ub - lb) or \
+                    np.any(cached["lower_{0}".format(int(stagger))] != lb):
+                matched = False
+        for item in items:
+            ESMP_GridAddItem(self, item, staggerloc=StaggerLoc.CENTER)
+
+        # the grid is destroyed collectively if any PET does not match
+        matched = all(_allgather(matched))
+        if not matched:
+            ESMP_GridDestroy(self)
+            self._struct = None
+
+        return matched
+
+    def _read_cache_(self, cached):
+        # copy the cached coordinates and items into the ESMF allocations
+        for stagger in range(2 ** self.rank):
+            if not self.staggerloc[stagger]:
+                continue
+            for xyz in range(self.rank):
+                self.coords[stagger][xyz][...] = \
+                    cached["coords_{0}_{1}".format(stagger, xyz)]
+        if self.mask[StaggerLoc.CENTER] is not None:
+            self.mask[StaggerLoc.CENTER][...] = \
+                cached["item_{0}".format(int(GridItem.MASK))]
+        if self.area[StaggerLoc.CENTER] is not None:
+            self.area[StaggerLoc.CENTER][...] = \
+                cached["item_{0}".format(int(GridItem.AREA))]
+
+    def _write_cache_(self, cache_file):
+        # store the local part of a grid created from file
+        cached = {"rank": np.array(self.rank),
+                  "ndims": np.array(self.ndims),
+                  "max_index": np.array(self.max_index, dtype=np.int32)}
+        for stagger in range(2 ** self.rank):
+            if not self.staggerloc[stagger]:
+                continue
+            cached["lower_{0}".format(stagger)] = \
+                np.array(self.lower_bounds[stagger], dtype=np.int32)
+            for xyz in range(self.rank):
+                cached["coords_{0}_{1}".format(stagger, xyz)] = \
+                    self.coords[stagger][xyz]
+        if self.mask[StaggerLoc.CENTER] is not None:
+            cached["item_{0}".format(int(GridItem.MASK))] = \
+                self.mask[StaggerLoc.CENTER]
+        if self.area[StaggerLoc.CENTER] is not None:
+            cached["item_{0}".format(int(GridItem.AREA))] = \
+                self.area[StaggerLoc.CENTER]
+
+        write_cache(cache_file, cached)
 
     def _link_item_buffer_(self, item, stagger):
 
@@ -959,7 +2223,7 @@ class Grid(object):
 
         # get the data pointer and bounds of the ESMF allocation
         data = ESMP_GridGetItem(self, item, staggerloc=stagger)
-        lb, ub = ESMP_GridGetCoordBounds(self, staggerloc=stagger)
+        lb, ub = self.lower_bounds[stagger], self.upper_bounds[stagger]
 
         # create Array of the appropriate type the appropriate type
         if item == GridItem.MASK:
@@ -10,6 +10,9 @@ from ESMF.api.esmpymanager import *
 from ESMF.util.esmpyarray import ndarray_from_esmf
 import ESMF.api.constants as constants
 from ESMF.util.slicing import get_formatted_slice
+from ESMF.util.fingerprint import fingerprint as _fingerprint
+from ESMF.util.masking import masked_cells as _masked_cells
+from ESMF.util.partition import curve_order as _curve_order
 
 
 #### LocStream class #########################################################
@@ -67,15 +70,24 @@ class LocStream(dict):
     :attr:`~ESMF.api.constants.CoordSys.CART`     ESMF:X       ESMF:Y       ESMF:Z
     ============================================  ===========  ===========  ===========
 
+    With ``curve`` the points are reordered along a space filling curve
+    once both horizontal coordinate keys are set, see
+    :meth:`~ESMF.api.locstream.LocStream.from_arrays`.  Keys are then set in
+    the original order of the points and are stored in the new order.
+
     :param int location_count: The number of points in this stream.
     :param CoordSys coord_sys: Coordinate system for the location stream.
         If ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
     :param str name: Optional name for the location stream.
     :param bool esmf: Internal parameter controlling shallow copying by ESMF.
+    :param str curve: ``'hilbert'`` or ``'morton'`` to reorder the points
+        along that space filling curve.  If ``None``, the points keep their
+        order.
     """
 
     @initialize
-    def __init__(self, location_count, coord_sys=None, name=None, esmf=True):
+    def __init__(self, location_count, coord_sys=None, name=None, esmf=True,
+                 curve=None):
 
         # for ocgis compatibility
         self._meta = {}
@@ -84,6 +96,18 @@ class LocStream(dict):
         self._rank = 1
         self._name = name
         self._size = location_count
+        self._coord_sys = coord_sys
+
+        # memoized digest of the locstream, see fingerprint()
+        self._fingerprint = None
+
+        # incremented when the mask values change, see Regrid.masks_changed
+        self._mask_version = 0
+
+        # the original index of every point if the points were reordered
+        # along a space filling curve, see from_arrays
+        self._curve = curve
+        self._order = None
 
         # call the ESMP layer
         if esmf:
@@ -129,6 +153,10 @@ class LocStream(dict):
             # upper bounds and size
             ret._upper_bounds = len(list(range(slc_ls.stop - slc_ls.start)))
             ret._size = ret.upper_bounds - ret.lower_bounds
+            ret._fingerprint = None
+            # the points of a slice are not a reordering of the original ones
+            ret._curve = None
+            ret._order = None
 
             # keys
             for x in ret.keys():
@@ -160,15 +188,24 @@ class LocStream(dict):
         if len(value) != self.size:
             raise ValueError("value must be of length " + str(self.size))
 
-        keyvals = value
-        if key not in self:
-            keyvals = self._add_(key, typekind=constants._Python2ESMFType[type(value[0])])
+        # the values are given in the original order of the points
+        if self._order is not None:
+            value = value[self._order]
+        ret = self._set_key_(key, value)
+        if self._curve is not None and self._order is None:
+            self._reorder_()
 
-        ret = dict.__setitem__(self, key, keyvals)
+        return ret
 
-        keyvals[...] = value
+    @property
+    def coord_sys(self):
+        """
+        :rtype: :attr:`~ESMF.api.constants.CoordSys`
+        :return: The coordinate system of the
+            :class:`~ESMF.api.locstream.LocStream`.
+        """
 
-        return ret
+        return self._coord_sys
 
     @property
     def finalized(self):
@@ -216,6 +253,18 @@ class LocStream(dict):
 
         return self._name
 
+    @property
+    def order(self):
+        """
+        :rtype: ndarray
+        :return: The original index of every point of a
+            :class:`~ESMF.api.locstream.LocStream` whose points were
+            reordered along a space filling curve, or ``None`` if they keep
+            their original order.
+        """
+
+        return self._order
+
     @property
     def rank(self):
         """
@@ -270,7 +319,8 @@ class LocStream(dict):
         :return: A :class:`~ESMF.api.locstream.LocStream` shallow copy.
         """
         # shallow copy
-        ret = LocStream(self._size, name=self._name, esmf=False)
+        ret = LocStream(self._size, coord_sys=self._coord_sys,
+                        name=self._name, esmf=False)
 
         ret._struct = self._struct
         ret._lower_bounds = self._lower_bounds
@@ -279,6 +329,11 @@ class LocStream(dict):
         for key, value in self.items():
             super(LocStream, ret).__setitem__(key, value)
 
+        ret._fingerprint = self._fingerprint
+        ret._mask_version = self._mask_version
+        ret._curve = self._curve
+        ret._order = self._order
+
         # don't call ESMF destructor twice on the same shallow Python object
         ret._finalized = True
 
@@ -295,6 +350,356 @@ class LocStream(dict):
                 ESMP_LocStreamDestroy(self)
                 self._finalized = True
 
+    @staticmethod
+    def from_arrays(lon=None, lat=None, radius=None, x=None, y=None, z=None,
+                    mask=None, keys=None, coord_sys=None, name=None,
+                    location_count=None, curve=None):
+        """
+        Create a :class:`~ESMF.api.locstream.LocStream` with all of its keys
+        from arrays.  Every key is allocated by ESMF with an explicit type,
+        coordinates as :attr:`~ESMF.api.constants.TypeKind.R8` and the mask
+        as :attr:`~ESMF.api.constants.TypeKind.I4`, and filled with a single
+        vectorized copy (and cast) of its array.
+
+        ESMF allocates the memory of the keys itself, so instead of an array
+        a key can be given as a numpy data type, e.g. ``np.float64``, to
+        allocate it without filling it.  The caller then writes the values
+        directly into the aliased ESMF memory, e.g. reading them from file
+        into ``locstream["ESMF:Lon"]``, without any intermediate copy.
+
+        With ``curve`` the points are reordered along a space filling curve
+        through their coordinates, so points which are close in space are
+        close in memory.  Regridding to or from the points then accesses the
+        data of the other side of the regridding in order instead of at
+        random, both when the weights are computed and when they are
+        applied.  The keys and the data of Fields on the
+        :class:`~ESMF.api.locstream.LocStream` are in the new order, the
+        original index of every point is kept in
+        :attr:`~ESMF.api.locstream.LocStream.order`, and
+        :meth:`~ESMF.api.locstream.LocStream.unpermute` and
+        :meth:`~ESMF.api.locstream.LocStream.permute` convert values between
+        both orders.  The data stays in the new order in memory, and is
+        returned in the original order where it leaves the
+        :class:`~ESMF.api.locstream.LocStream`: by
+        :meth:`~ESMF.api.field.Field.get_data` and
+        :meth:`~ESMF.api.field.Field.write` with ``original_order=True``, and
+        in the ``out`` array of :class:`~ESMF.api.regrid.Regrid` and
+        :class:`~ESMF.api.regrid.IncrementalRegrid`.  Keys set later with
+        ``locstream[key] = values`` are given in the original order too.
+
+        *OPTIONAL:*
+
+        :param lon: The ``ESMF:Lon`` key in spherical coordinates.
+        :param lat: The ``ESMF:Lat`` key in spherical coordinates.
+        :param radius: The ``ESMF:Radius`` key in spherical coordinates.
+        :param x: The ``ESMF:X`` key in Cartesian coordinates.
+        :param y: The ``ESMF:Y`` key in Cartesian coordinates.
+        :param z: The ``ESMF:Z`` key in Cartesian coordinates.
+        :param mask: The ``ESMF:Mask`` key.
+        :param dict keys: Other keys by name.
+        :param CoordSys coord_sys: Coordinate system for the location stream.
+            If ``None``, defaults to
+            :attr:`~ESMF.api.constants.CoordSys.CART` if Cartesian
+            coordinates are given and to
+            :attr:`~ESMF.api.constants.CoordSys.SPH_DEG` otherwise.
+        :param str name: Optional name for the location stream.
+        :param int location_count: The number of points, only required if no
+            key is given as an array.
+        :param str curve: ``'hilbert'`` or ``'morton'`` to reorder the points
+            along that space filling curve.  The coordinates must be given
+            as arrays.  If ``None``, the points keep their order.
+
+        :return: A new :class:`~ESMF.api.locstream.LocStream`.
+        """
+
+        cartesian = [("ESMF:X", x), ("ESMF:Y", y), ("ESMF:Z", z)]
+        spherical = [("ESMF:Lon", lon), ("ESMF:Lat", lat),
+                     ("ESMF:Radius", radius)]
+        if coord_sys is None and any(v is not None for _, v in cartesian):
+            coord_sys = CoordSys.CART
+        values = [(key, value) for key, value in
+                  spherical + cartesian + [("ESMF:Mask", mask)]
+                  if value is not None]
+        if keys is not None:
+            values.extend(sorted(keys.items()))
+
+        # keys given as data types are only allocated
+        dtypes = [isinstance(value, (type, np.dtype)) for _, value in values]
+        sizes = set(np.size(value) for (_, value), dtype in zip(values, dtypes)
+                    if not dtype)
+        if location_count is not None:
+            sizes.add(location_count)
+        if len(sizes) != 1:
+            raise ValueError("all keys must have the same number of points, "
+                             "or location_count must be given")
+
+        order = None
+        if curve is not None:
+            coords = [value for _, value in
+                      (cartesian if coord_sys == CoordSys.CART
+                       else spherical[:2]) if value is not None]
+            if len(coords) < 2 or \
+                    any(isinstance(c, (type, np.dtype)) for c in coords):
+                raise ValueError("reordering the points requires their "
+                                 "coordinates as arrays")
+            order = _curve_order(np.stack([np.ravel(c) for c in coords],
+                                          axis=1),
+                                 coord_sys=coord_sys, curve=curve)
+
+        ret = LocStream(sizes.pop(), coord_sys=coord_sys, name=name,
+                        curve=curve)
+        ret._order = order
+        for (key, value), dtype in zip(values, dtypes):
+            typekind, _ = ret._key_type_(key, np.dtype(value) if dtype
+                                         else np.asarray(value).dtype)
+            keyvals = ret._add_(key, typekind=typekind)
+            if not dtype:
+                value = np.ravel(value)
+                if order is not None:
+                    value = value[order]
+                LocStream._copy_key_(key, keyvals, value)
+            dict.__setitem__(ret, key, keyvals)
+            if key == "ESMF:Mask":
+                ret._mask_version += 1
+
+        return ret
+
+    def fingerprint(self, refresh=False):
+        """
+        Return a digest of the locations, masks and decomposition of the
+        :class:`~ESMF.api.locstream.LocStream`, suitable as a key when caching
+        anything computed from it (e.g. regridding weights).  All keys are
+        hashed directly from the ESMF buffers together with the bounds, the
+        coordinate system and the number of PETs, so the digest describes the
+        part of the location stream on the current PET.
+
+        :note: The digest is memoized and recomputed after a key is set.
+            Values written in place through the aliased arrays cannot be
+            detected, pass ``refresh=True`` after modifying them.
+
+        *OPTIONAL:*
+
+        :param bool refresh: Recompute the digest even if it was memoized.
+
+        :return: A hexadecimal digest string.
+        """
+
+        if self._fingerprint is None or refresh:
+            keys = [[key, super(LocStream, self).__getitem__(key)]
+                    for key in sorted(self.keys())]
+
+            coord_sys = self.coord_sys
+            if coord_sys is None:
+                coord_sys = CoordSys.SPH_DEG
+
+            self._fingerprint = _fingerprint("LocStream", coord_sys,
+                                             pet_count(), local_pet(),
+                                             self.lower_bounds,
+                                             self.upper_bounds, keys)
+
+        return self._fingerprint
+
+    def mask_from(self, values, missing_value=None, nan=True, predicate=None):
+        """
+        Set the ``ESMF:Mask`` key of the
+        :class:`~ESMF.api.locstream.LocStream` from data values in a single
+        vectorized pass.  Locations with missing values are given a mask of
+        ``1`` and the other locations a mask of ``0``, so the mask is used in
+        :class:`~ESMF.api.regrid.Regrid` with ``src_mask_values`` or
+        ``dst_mask_values`` of ``[1]``.  The key is added if it has not been
+        added yet, otherwise its values are overwritten in place.
+
+        :note: :class:`~ESMF.api.regrid.Regrid` objects created with mask
+            values before the mask changes keep using the previous mask, see
+            :attr:`~ESMF.api.regrid.Regrid.masks_changed`.
+
+        *REQUIRED:*
+
+        :param values: A :class:`~ESMF.api.field.Field` on the
+            :class:`~ESMF.api.locstream.LocStream`, or a numpy array of the
+            values of the locations, optionally with leading (e.g.
+            ungridded) dimensions.  A location is masked if any of its values
+            is missing.  The masked values of a numpy masked array are
+            missing.
+
+        *OPTIONAL:*
+
+        :param missing_value: A value, or a list of values, which are
+            missing.
+        :param bool nan: Set to ``False`` to keep NaN values unmasked.
+            Defaults to ``True``.
+        :param predicate: A function of the data values which returns a
+            boolean numpy array that is ``True`` for missing values, e.g.
+            ``lambda data: data < 0``.
+
+        :return: ``True`` if the mask values changed.
+        """
+
+        from ESMF.api.field import Field
+
+        if isinstance(values, Field):
+            values = values.data
+
+        mask = _masked_cells(values, 1, missing_value=missing_value, nan=nan,
+                             predicate=predicate).astype(np.int32)
+        if mask.size != self.size:
+            raise ValueError("values must be of length " + str(self.size))
+
+        if "ESMF:Mask" not in self:
+            self._set_key_("ESMF:Mask", mask)
+            return True
+
+        old = super(LocStream, self).__getitem__("ESMF:Mask")
+        if not np.any(old != mask):
+            return False
+
+        old[...] = mask
+        self._fingerprint = None
+        self._mask_version += 1
+
+        return True
+
+    def permute(self, values):
+        """
+        Reorder values of the points from their original order into the
+        order of the :class:`~ESMF.api.locstream.LocStream`, e.g. to fill a
+        key or the data of a source :class:`~ESMF.api.field.Field`.
+
+        *REQUIRED:*
+
+        :param values: A numpy array of the values of the points in their
+            original order, the points along the last dimension.
+
+        :return: A numpy array of the values in the order of the
+            :class:`~ESMF.api.locstream.LocStream`, or ``values`` if the
+            points were not reordered.
+        """
+
+        values = np.asarray(values)
+        if self._order is None:
+            return values
+
+        return values[..., self._order]
+
+    def unpermute(self, values, out=None):
+        """
+        Reorder values of the points from the order of the
+        :class:`~ESMF.api.locstream.LocStream` back into their original
+        order, e.g. regridding results.
+
+        *REQUIRED:*
+
+        :param values: A :class:`~ESMF.api.field.Field` on the
+            :class:`~ESMF.api.locstream.LocStream`, or a numpy array of the
+            values of the points, the points along the last dimension.
+
+        *OPTIONAL:*
+
+        :param ndarray out: A numpy array of the shape of the values to hold
+            the reordered values.
+
+        :return: A numpy array of the values in the original order of the
+            points, or ``values`` if the points were not reordered and
+            ``out`` is ``None``.
+        """
+
+        from ESMF.api.field import Field
+
+        if isinstance(values, Field):
+            values = values.data
+        values = np.asarray(values)
+
+        if out is None:
+            if self._order is None:
+                return values
+            out = np.empty_like(values)
+        elif out.shape != values.shape:
+            raise ValueError("out must be of shape " + str(values.shape))
+
+        if self._order is None:
+            out[...] = values
+        else:
+            out[..., self._order] = values
+
+        return out
+
+    def _set_key_(self, key, value):
+        # set a key in the order of the points in memory
+        self._fingerprint = None
+        if key == "ESMF:Mask":
+            self._mask_version += 1
+        keyvals = value
+        if key not in self:
+            typekind, _ = self._key_type_(key, value.dtype)
+            keyvals = self._add_(key, typekind=typekind)
+
+        ret = dict.__setitem__(self, key, keyvals)
+
+        self._copy_key_(key, keyvals, value)
+
+        return ret
+
+    def _reorder_(self):
+        # reorder the points along the curve once their coordinates are set,
+        # the keys set so far are permuted in place
+        if self.coord_sys == CoordSys.CART:
+            names = ("ESMF:X", "ESMF:Y")
+        else:
+            names = ("ESMF:Lon", "ESMF:Lat")
+        if not all(name in self for name in names):
+            return
+
+        coords = np.stack([super(LocStream, self).__getitem__(name)
+                           for name in names], axis=1)
+        self._order = _curve_order(coords, coord_sys=self.coord_sys,
+                                   curve=self._curve)
+        for key in self.keys():
+            keyvals = super(LocStream, self).__getitem__(key)
+            keyvals[...] = keyvals[self._order]
+        self._fingerprint = None
+        if "ESMF:Mask" in self:
+            self._mask_version += 1
+
+    @staticmethod
+    def _key_type_(key, dtype):
+        # the ESMF typekind and numpy data type of a key, the mask is I4 and
+        # the coordinates are R8, other keys keep 4 or 8 byte integers and
+        # floats and widen the other numeric types to the smallest type
+        # holding all of their values
+        if key == "ESMF:Mask":
+            return constants.TypeKind.I4, np.int32
+        if key in ("ESMF:Lon", "ESMF:Lat", "ESMF:Radius", "ESMF:X", "ESMF:Y",
+                   "ESMF:Z"):
+            return constants.TypeKind.R8, np.float64
+        dtype = np.dtype(dtype)
+        if dtype == np.float32:
+            return constants.TypeKind.R4, np.float32
+        if dtype == np.int32:
+            return constants.TypeKind.I4, np.int32
+        if dtype == np.int64:
+            return constants.TypeKind.I8, np.int64
+        if dtype.kind == "b" or (dtype.kind in "iu" and dtype.itemsize < 4):
+            return constants.TypeKind.I4, np.int32
+        if dtype.kind == "u":
+            # unsigned 8 byte values beyond I8 are rejected when they are set
+            return constants.TypeKind.I8, np.int64
+        if dtype.kind == "f":
+            return constants.TypeKind.R8, np.float64
+        raise ValueError("keys of type {0} are not supported".format(dtype))
+
+    @staticmethod
+    def _copy_key_(key, keyvals, value):
+        # copy the values into the key, integers out of the range of the key
+        # raise instead of wrapping around
+        value = np.asarray(value)
+        if value.dtype.kind in "iu" and keyvals.dtype.kind in "iu" and \
+                value.size:
+            info = np.iinfo(keyvals.dtype)
+            if int(value.min()) < info.min or int(value.max()) > info.max:
+                raise ValueError("the values of key {0} are out of the range "
+                                 "of {1}".format(key, keyvals.dtype))
+        np.copyto(keyvals, value, casting='unsafe')
+
     def _add_(self, key_name, typekind=None):
         # allocate the key
         ESMP_LocStreamAddKeyAlloc(self.struct, key_name, keyTypeKind=typekind)
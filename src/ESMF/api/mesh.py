@@ -14,6 +14,23 @@ from ESMF.util.decorators import initialize
 
 from ESMF.api.esmpymanager import *
 from ESMF.util.slicing import get_formatted_slice, get_none_or_slice, get_none_or_bound_list
+from ESMF.util.fingerprint import fingerprint as _fingerprint
+from ESMF.util.geometry import polygon_areas, polygon_centroids
+from ESMF.util.spatial_index import SpatialIndex
+from ESMF.util.masking import masked_cells as _masked_cells
+from ESMF.util.parallel import require_mpi4py as _require_mpi4py
+from ESMF.util.connectivity import faces_to_csr as _faces_to_csr, \
+    remap_ids as _remap_ids, sort_ids as _sort_ids, \
+    element_types as _element_types, \
+    stack_coords as _stack_coords, \
+    structured_elements as _structured_elements, \
+    weld_nodes as _weld_nodes, drop_repeated_nodes as _drop_repeated_nodes
+from ESMF.util.partition import PartitionPlan, \
+    plan_partition as _plan_partition, local_part as _local_part
+from ESMF.util.staging import ChunkedArray as _ChunkedArray, \
+    stage_chunk as _stage_chunk
+from ESMF.util.topology import element_adjacency as _element_adjacency, \
+    boundary_edges as _boundary_edges, dual_cells as _dual_cells
 
 import warnings
 
@@ -172,20 +189,22 @@ class Mesh(object):
         self._mask = [None, None]
         self._area = [None, None]
 
+        # the staged element and node arrays, which are only set for meshes
+        # created in memory, the connectivity of meshes created from file is
+        # read from ESMF on first access
+        self._element_count = None
+        self._element_ids = None
+        self._element_types = None
+        self._element_conn = None
+        self._element_mask = None
+        self._element_area = None
+        self._element_coords = None
+        self._node_count = None
+        self._node_ids = None
+        self._node_coords = None
+        self._node_owners = None
+
         if not fromfile:
-            # initialize not fromfile variables
-            self._element_count = None
-            self._element_ids = None
-            self._element_types = None
-            self._element_conn = None
-            self._element_mask = None
-            self._element_area = None
-            self._element_coords = None
-            self._node_count = None
-            self._node_ids = None
-            self._node_coords = None
-            self._node_owners = None
-            
             # call into ctypes layer
             self._struct = ESMP_MeshCreate(parametricDim=parametric_dim,
                                           spatialDim=spatial_dim,
@@ -212,6 +231,21 @@ class Mesh(object):
         # for arbitrary metadata
         self._meta = {}
 
+        # memoized digest of the mesh, see fingerprint()
+        self._fingerprint = None
+
+        # spatial index of the elements and the digest it was built for
+        self._spatial_index = None
+
+        # adjacency, boundary and dual of the elements, see get_adjacency()
+        self._topology = {}
+
+        # the number of nodes merged by from_arrays(weld=...)
+        self._welded_nodes = 0
+
+        # incremented when the mask values change, see Regrid.masks_changed
+        self._mask_version = 0
+
         # register with atexit
         import atexit; atexit.register(self.__del__)
         self._finalized = False
@@ -233,6 +267,7 @@ class Mesh(object):
         # size is "sliced" by taking the shape of the coords
         ret._size = [get_none_or_bound_list(get_none_or_slice(ret.coords, stagger), 0) for stagger in range(2)]
         ret._size_owned = ret.size
+        ret._fingerprint = None
 
         return ret
 
@@ -286,6 +321,17 @@ class Mesh(object):
 
     @property
     def element_conn(self):
+        """
+        :rtype: ndarray
+        :return: The node indices of the local elements, concatenated in the
+            order of the elements, see
+            :meth:`~ESMF.api.mesh.Mesh.get_connectivity`.  The connectivity of
+            a :class:`~ESMF.api.mesh.Mesh` created from file is retrieved
+            from ESMF on first access.
+        """
+        if self._element_conn is None and self.size[element] is not None:
+            self._element_types, self._element_conn = \
+                ESMP_MeshGetElemConn(self)
         return self._element_conn
 
     @property
@@ -306,6 +352,9 @@ class Mesh(object):
 
     @property
     def element_types(self):
+        if self._element_types is None and self.size[element] is not None:
+            self._element_types, self._element_conn = \
+                ESMP_MeshGetElemConn(self)
         return self._element_types
 
     @property
@@ -394,6 +443,16 @@ class Mesh(object):
         """
         return self._struct
 
+    @property
+    def welded_nodes(self):
+        """
+        :rtype: int
+        :return: The number of coincident nodes merged when the
+            :class:`~ESMF.api.mesh.Mesh` was created with
+            :meth:`from_arrays`.
+        """
+        return self._welded_nodes
+
     def add_elements(self, element_count,
                      element_ids,
                      element_types,
@@ -432,33 +491,41 @@ class Mesh(object):
         """
 
         # initialize not fromfile variables
+        self._fingerprint = None
+        self._topology = {}
         self._element_count = element_count
-        if element_ids.dtype is not np.int32:
+        if element_ids.dtype != np.int32:
             self._element_ids = np.array(element_ids, dtype=np.int32)
         else:
             self._element_ids = element_ids
-        if element_types.dtype is not np.int32:
+        if element_types.dtype != np.int32:
             self._element_types = np.array(element_types, dtype=np.int32)
         else:
             self._element_types = element_types
-        if element_conn.dtype is not np.int32:
+        if element_conn.dtype != np.int32:
             self._element_conn = np.array(element_conn, dtype=np.int32)
         else:
             self._element_conn = element_conn
         if element_mask is not None:
-            if element_mask.dtype is not np.int32:
+            if element_mask.dtype != np.int32:
                 self._element_mask = np.array(element_mask, dtype=np.int32)
             else:
                 self._element_mask = element_mask
             self._mask[1] = self._element_mask
+        # a mask set with mask_from() before the elements are added
+        elif self._element_mask is not None and \
+                self._element_mask.size != element_count:
+            raise MeshArgumentError("the element mask has {0} values but {1} "
+                                    "elements are added".format(
+                                    self._element_mask.size, element_count))
         if element_area is not None:
-            if element_area.dtype is not np.float64:
+            if element_area.dtype != np.float64:
                 self._element_area = np.array(element_area, dtype=np.float64)
             else:
                 self._element_area = element_area
             self._area = self._element_area
         if element_coords is not None:
-            if element_coords.dtype is not np.float64:
+            if element_coords.dtype != np.float64:
                 self._element_coords = np.array(element_coords, dtype=np.float64)
             else:
                 self._element_coords = element_coords
@@ -496,16 +563,17 @@ class Mesh(object):
             specify the rank of the processor that owns each node.
         """
 
+        self._fingerprint = None
         self._node_count = node_count
-        if node_ids.dtype is not np.int32:
+        if node_ids.dtype != np.int32:
             self._node_ids = np.array(node_ids, dtype=np.int32)
         else:
             self._node_ids = node_ids
-        if node_coords.dtype is not np.float64:
+        if node_coords.dtype != np.float64:
             self._node_coords = np.array(node_coords, dtype=np.float64)
         else:
             self._node_coords = node_coords
-        if node_owners.dtype is not np.int32:
+        if node_owners.dtype != np.int32:
             self._node_owners = np.array(node_owners, dtype=np.int32)
         else:
             self._node_owners = node_owners
@@ -538,6 +606,86 @@ class Mesh(object):
                 ESMP_MeshDestroy(self)
                 self._finalized = True
 
+    def dual(self):
+        """
+        Create the dual of a :class:`~ESMF.api.mesh.Mesh` with a parametric
+        dimension of 2 in memory.  The nodes of the dual are the centroids of
+        the elements, with the element ids, and the elements of the dual are
+        cells around every node inside the local elements, with the node ids,
+        whose nodes are the elements of the node in counterclockwise order.
+        Nodes on the boundary of the local elements have no dual cell.  The
+        centroids and dual cells are cached on the
+        :class:`~ESMF.api.mesh.Mesh`.
+
+        :return: A new :class:`~ESMF.api.mesh.Mesh`.
+        """
+
+        coord_sys = self.coord_sys
+        if coord_sys is None:
+            coord_sys = CoordSys.SPH_DEG
+
+        if "dual" not in self._topology:
+            offsets, node_indices = self._topology_connectivity_()
+            centroids = np.stack(self.get_cell_centroids(), axis=1)
+            self._topology["dual"] = (centroids,) + \
+                _dual_cells(self._node_coords_(), centroids, offsets,
+                            node_indices, coord_sys=coord_sys)
+        centroids, cells, offsets, elements = self._topology["dual"]
+
+        element_count = centroids.shape[0]
+        element_ids = self.element_ids
+        if element_ids is None:
+            element_ids = np.arange(1, element_count + 1, dtype=np.int32)
+        node_ids = self.node_ids
+        if node_ids is None:
+            node_ids = np.arange(1, self.size[node] + 1, dtype=np.int32)
+
+        element_ids = np.asarray(element_ids).reshape(-1)
+        return Mesh.from_arrays(centroids, (offsets, element_ids[elements]),
+                                node_ids=element_ids,
+                                element_ids=np.asarray(node_ids)[cells],
+                                parametric_dim=2, coord_sys=self.coord_sys)
+
+    def fingerprint(self, refresh=False):
+        """
+        Return a digest of the geometry, topology, masks and decomposition of
+        the :class:`~ESMF.api.mesh.Mesh`, suitable as a key when caching
+        anything computed from it (e.g. regridding weights or areas).  The
+        node and element coordinates, masks, areas, ids, owners and
+        connectivity are hashed together with the local and owned sizes, the
+        coordinate system and the number of PETs, so the digest describes the
+        part of the mesh on the current PET.
+
+        :note: The digest is memoized and recomputed after nodes or elements
+            are added.  Values written in place through the aliased arrays
+            cannot be detected, pass ``refresh=True`` after modifying them.
+
+        *OPTIONAL:*
+
+        :param bool refresh: Recompute the digest even if it was memoized.
+
+        :return: A hexadecimal digest string.
+        """
+
+        if self._fingerprint is None or refresh:
+            # connectivity is only known for meshes created in memory
+            topology = [getattr(self, attr, None) for attr in
+                        ("_node_ids", "_node_owners", "_element_ids",
+                         "_element_types", "_element_conn")]
+
+            coord_sys = self.coord_sys
+            if coord_sys is None:
+                coord_sys = CoordSys.SPH_DEG
+
+            self._fingerprint = _fingerprint("Mesh", self.parametric_dim,
+                                             self.spatial_dim, coord_sys,
+                                             pet_count(), local_pet(),
+                                             self.size, self.size_owned,
+                                             self.coords, self.mask,
+                                             self.area, topology)
+
+        return self._fingerprint
+
     def free_memory(self):
         """
         Free memory associated with the creation of a
@@ -547,6 +695,508 @@ class Mesh(object):
         # call into ctypes layer
         ESMP_MeshFreeMemory(self)
 
+    @staticmethod
+    def from_arrays(node_coords, faces, node_ids=None, element_ids=None,
+                    node_owners=None, element_mask=None, element_area=None,
+                    element_coords=None, parametric_dim=None, coord_sys=None,
+                    fill_value=None, partition=None, weld=None):
+        """
+        Create a :class:`~ESMF.api.mesh.Mesh` from arrays of node
+        coordinates and element connectivity, as found in UGRID-like files.
+        The node ids in the connectivity are mapped to node indices by
+        sorting the node ids once and searching all entries at once, and the
+        element types are inferred from the number of nodes of every
+        element.
+
+        *REQUIRED:*
+
+        :param node_coords: A numpy array of shape ``(node_count,
+            spatial_dim)`` of the node coordinates, or a list of numpy arrays
+            of the coordinates, one for each coordinate dimension.
+        :param faces: The nodes of every element in **COUNTERCLOCKWISE**
+            order, either a numpy array of shape ``(element_count,
+            max_nodes)`` padded with ``fill_value`` (or masked in a numpy
+            masked array) for elements with fewer nodes, or a tuple of a numpy
+            array of ``element_count + 1`` offsets and a numpy array of the
+            nodes of all elements (compressed sparse row form).  The nodes are
+            given by their ids in ``node_ids``, or by their 0 based indices if
+            ``node_ids`` is ``None``.
+
+        *OPTIONAL:*
+
+        :param node_ids: A numpy array of ``node_count`` unique node ids.  If
+            ``None``, the nodes are numbered from ``1``.
+        :param element_ids: A numpy array of ``element_count`` element ids.
+            If ``None``, the elements are numbered from ``1``.
+        :param node_owners: A numpy array of ``node_count`` PETs owning the
+            nodes.  If ``None``, the local PET owns all nodes.
+        :param element_mask: A numpy array of ``element_count`` element mask
+            values.
+        :param element_area: A numpy array of ``element_count`` element
+            areas.
+        :param element_coords: A numpy array of shape ``(element_count,
+            spatial_dim)`` of element coordinates, or a list of numpy arrays
+            of the coordinates, one for each coordinate dimension.
+        :param int parametric_dim: The parametric dimension of the
+            :class:`~ESMF.api.mesh.Mesh`.  If ``None``, defaults to the
+            spatial dimension of ``node_coords``.
+        :param CoordSys coord_sys: Coordinate system for the
+            :class:`~ESMF.api.mesh.Mesh`.  If ``None``, defaults to
+            :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+        :param fill_value: The value of the padding entries of ``faces``.
+            If ``None``, negative entries are padding.
+        :param partition: A :class:`~ESMF.util.partition.PartitionPlan` of
+            the arrays, e.g. from :meth:`plan_partition`, or ``True`` to plan
+            one over all PETs.  Every PET then passes the same global arrays
+            and adds only its elements and their nodes, with the node owners
+            of the plan.  If ``None``, all arrays are added on every PET.
+        :param float weld: Merge nodes which coincide within this distance,
+            in the units of the coordinates, as in polygons which each hold
+            their own copy of shared nodes.  All nodes closer than the
+            distance are merged, including chains of close nodes, on the
+            unit sphere for spherical coordinates.  Nodes are merged into
+            the first of them, and nodes repeated within an element are
+            dropped.  The
+            number of merged nodes is kept in :attr:`welded_nodes`.  If
+            ``None``, nodes are not merged.
+
+        :return: A new :class:`~ESMF.api.mesh.Mesh`.
+        """
+
+        try:
+            node_coords = _stack_coords(node_coords)
+            node_count, spatial_dim = node_coords.shape
+            if parametric_dim is None:
+                parametric_dim = spatial_dim
+            if element_coords is not None:
+                element_coords = _stack_coords(element_coords)
+
+            offsets, entries = _faces_to_csr(faces, fill_value=fill_value)
+            if node_ids is None:
+                node_ids = np.arange(1, node_count + 1, dtype=np.int32)
+                if entries.size and (entries.min() < 0 or
+                                     entries.max() >= node_count):
+                    raise ValueError("node indices must be between 0 and "
+                                     "{0}".format(node_count - 1))
+                conn = entries
+            else:
+                node_ids = np.asarray(node_ids).reshape(-1)
+                if node_ids.size != node_count:
+                    raise ValueError("node_ids must have an entry for every "
+                                     "node")
+                conn = _remap_ids(node_ids, entries)
+
+            welded_nodes = 0
+            if weld is not None:
+                kept, position = _weld_nodes(node_coords, weld,
+                                             coord_sys=coord_sys)
+                welded_nodes = node_count - kept.size
+                offsets, conn = _drop_repeated_nodes(offsets, position[conn])
+                node_coords = node_coords[kept]
+                node_ids = np.asarray(node_ids).reshape(-1)[kept]
+                if node_owners is not None:
+                    node_owners = np.asarray(node_owners).reshape(-1)[kept]
+                node_count = kept.size
+            element_count = offsets.size - 1
+            types = _element_types(np.diff(offsets), parametric_dim)
+        except ValueError as err:
+            raise MeshArgumentError(str(err))
+
+        if element_ids is None:
+            element_ids = np.arange(1, element_count + 1, dtype=np.int32)
+        if node_owners is None:
+            node_owners = np.full(node_count, local_pet(), dtype=np.int32)
+
+        # select the part of the arrays added on this PET
+        if partition is not None:
+            if partition is True:
+                partition = _plan_partition(node_coords, offsets, conn,
+                                            pet_count(), coord_sys=coord_sys)
+            nodes, elements, offsets, conn = _local_part(partition,
+                                                         local_pet(),
+                                                         offsets, conn)
+            node_count = nodes.size
+            node_coords = node_coords[nodes]
+            node_ids = np.asarray(node_ids).reshape(-1)[nodes]
+            node_owners = np.asarray(partition.node_owners)[nodes]
+            element_count = elements.size
+            element_ids = np.asarray(element_ids).reshape(-1)[elements]
+            types = types[elements]
+            if element_mask is not None:
+                element_mask = np.asarray(element_mask).reshape(-1)[elements]
+            if element_area is not None:
+                element_area = np.asarray(element_area).reshape(-1)[elements]
+            if element_coords is not None:
+                element_coords = element_coords[elements]
+
+        mesh = Mesh(parametric_dim=parametric_dim, spatial_dim=spatial_dim,
+                    coord_sys=coord_sys)
+        mesh.add_nodes(node_count, np.asarray(node_ids, dtype=np.int32),
+                       node_coords.reshape(-1),
+                       np.asarray(node_owners, dtype=np.int32))
+        mesh.add_elements(element_count,
+                          np.asarray(element_ids, dtype=np.int32), types,
+                          np.asarray(conn, dtype=np.int32),
+                          element_mask=None if element_mask is None else
+                          np.asarray(element_mask, dtype=np.int32),
+                          element_area=None if element_area is None else
+                          np.asarray(element_area, dtype=np.float64),
+                          element_coords=None if element_coords is None else
+                          element_coords.reshape(-1))
+        mesh._welded_nodes = welded_nodes
+
+        return mesh
+
+    @staticmethod
+    def from_chunks(node_chunks, element_chunks, parametric_dim, spatial_dim,
+                    coord_sys=None, node_count=None, element_count=None,
+                    fill_value=None):
+        """
+        Create a :class:`~ESMF.api.mesh.Mesh` from nodes and elements
+        streamed in chunks, e.g. by generators reading a large file piece by
+        piece.  Every chunk is converted into arrays of the types passed to
+        ESMF as it arrives, into arrays allocated once if ``node_count`` and
+        ``element_count`` are known.  The node arrays are released as soon as
+        ESMF has added the nodes, and the element arrays once ESMF has added
+        the elements, so the memory held on the Python side stays near the
+        size of the mesh in ESMF.  The connectivity is read back from ESMF
+        when it is needed.
+
+        *REQUIRED:*
+
+        :param node_chunks: An iterable of dicts of numpy arrays, each with
+            the ``node_coords`` of shape ``(nodes, spatial_dim)`` and
+            optionally the ``node_ids`` and ``node_owners`` of a chunk of
+            nodes.  Every chunk must hold the same arrays.
+        :param element_chunks: An iterable of dicts of numpy arrays, each
+            with the ``faces`` and optionally the ``element_ids``,
+            ``element_mask``, ``element_area`` and ``element_coords`` of a
+            chunk of elements, as in :meth:`from_arrays`.  The ``faces`` refer
+            to the ``node_ids`` if the nodes have ids, and to 0 based node
+            indices across all chunks otherwise.  Every chunk must hold the
+            same arrays.
+        :param int parametric_dim: The parametric dimension of the
+            :class:`~ESMF.api.mesh.Mesh`.
+        :param int spatial_dim: The spatial dimension of the
+            :class:`~ESMF.api.mesh.Mesh`.
+
+        *OPTIONAL:*
+
+        :param CoordSys coord_sys: Coordinate system for the
+            :class:`~ESMF.api.mesh.Mesh`.  If ``None``, defaults to
+            :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+        :param int node_count: The number of nodes of all chunks.  If
+            ``None``, the chunks are concatenated once all have arrived.
+        :param int element_count: The number of elements of all chunks.  If
+            ``None``, the chunks are concatenated once all have arrived.
+        :param fill_value: The value of the padding entries of ``faces``.
+            If ``None``, negative entries are padding.
+
+        :return: A new :class:`~ESMF.api.mesh.Mesh`.
+        """
+
+        node_layout = {"node_coords": (np.float64, spatial_dim),
+                       "node_ids": (np.int32, 1),
+                       "node_owners": (np.int32, 1)}
+        element_layout = {"element_types": (np.int32, 1),
+                          "element_ids": (np.int32, 1),
+                          "element_mask": (np.int32, 1),
+                          "element_area": (np.float64, 1),
+                          "element_coords": (np.float64, spatial_dim)}
+
+        try:
+            staged = {}
+            for chunk in node_chunks:
+                _stage_chunk(staged, chunk, node_layout, count=node_count)
+            nodes = dict((name, array.finish())
+                         for name, array in staged.items())
+            del staged
+            if "node_coords" not in nodes:
+                raise ValueError("the node chunks must hold node_coords")
+            node_count = nodes["node_coords"].shape[0]
+
+            # the ids are sorted once for the connectivity of all chunks
+            lookup = None
+            if "node_ids" in nodes:
+                lookup = _sort_ids(nodes["node_ids"])
+            else:
+                nodes["node_ids"] = np.arange(1, node_count + 1,
+                                              dtype=np.int32)
+            if "node_owners" not in nodes:
+                nodes["node_owners"] = np.full(node_count, local_pet(),
+                                               dtype=np.int32)
+        except ValueError as err:
+            raise MeshArgumentError(str(err))
+
+        mesh = Mesh(parametric_dim=parametric_dim, spatial_dim=spatial_dim,
+                    coord_sys=coord_sys)
+        mesh.add_nodes(node_count, nodes["node_ids"],
+                       nodes["node_coords"].reshape(-1),
+                       nodes["node_owners"])
+
+        # ESMF holds the nodes, the connectivity refers to them by index
+        mesh._node_ids = mesh._node_coords = mesh._node_owners = None
+        del nodes
+
+        try:
+            staged = {}
+            conn = _ChunkedArray(np.int32)
+            for chunk in element_chunks:
+                chunk = dict(chunk)
+                if chunk.get("faces") is None:
+                    raise ValueError("the element chunks must hold faces")
+                offsets, entries = _faces_to_csr(chunk.pop("faces"),
+                                                 fill_value=fill_value)
+                if lookup is None:
+                    if entries.size and (entries.min() < 0 or
+                                         entries.max() >= node_count):
+                        raise ValueError("node indices must be between 0 "
+                                         "and {0}".format(node_count - 1))
+                    conn.append(entries)
+                else:
+                    conn.append(_remap_ids(None, entries, lookup=lookup))
+                chunk["element_types"] = _element_types(np.diff(offsets),
+                                                        parametric_dim)
+                _stage_chunk(staged, chunk, element_layout,
+                             count=element_count)
+            if not staged:
+                staged["element_types"] = _ChunkedArray(np.int32, count=0)
+            elements = dict((name, array.finish())
+                            for name, array in staged.items())
+            del staged
+            element_conn = conn.finish()
+            del conn
+            element_count = elements["element_types"].size
+        except ValueError as err:
+            raise MeshArgumentError(str(err))
+
+        if "element_ids" not in elements:
+            elements["element_ids"] = np.arange(1, element_count + 1,
+                                                dtype=np.int32)
+        element_coords = elements.pop("element_coords", None)
+        mesh.add_elements(element_count, elements.pop("element_ids"),
+                          elements.pop("element_types"), element_conn,
+                          element_mask=elements.pop("element_mask", None),
+                          element_area=elements.pop("element_area", None),
+                          element_coords=None if element_coords is None else
+                          element_coords.reshape(-1))
+
+        # ESMF holds the elements, the mask and area stay referenced by the
+        # Mesh properties
+        del element_conn, element_coords
+        mesh._element_ids = mesh._element_types = mesh._element_conn = None
+        mesh._element_coords = None
+
+        return mesh
+
+    @staticmethod
+    def from_grid(grid, staggerloc=None):
+        """
+        Create a :class:`~ESMF.api.mesh.Mesh` from a 2D or 3D
+        :class:`~ESMF.api.grid.Grid`, with a node at every location of a
+        stagger location and an element between every two neighbouring
+        locations along all dimensions.  The nodes and elements are numbered
+        across the whole :class:`~ESMF.api.grid.Grid` and built from index
+        arithmetic on the local part of every PET, the locations beyond the
+        local part are taken from the PETs holding them.  Elements wrap
+        around the periodic dimension, and in spherical coordinates the nodes
+        of a stagger location at a pole are merged into a single node, so that
+        the elements at the pole are triangles.  The mask, area and
+        coordinates of the cell centers of the :class:`~ESMF.api.grid.Grid`
+        become the mask, area and coordinates of the elements when the nodes
+        are at the cell corners.
+
+        *REQUIRED:*
+
+        :param Grid grid: The :class:`~ESMF.api.grid.Grid` to convert.
+
+        *OPTIONAL:*
+
+        :param StaggerLoc staggerloc: The stagger location of the nodes.  If
+            ``None``, defaults to
+            :attr:`~ESMF.api.constants.StaggerLoc.CORNER` in 2D and
+            :attr:`~ESMF.api.constants.StaggerLoc.CORNER_VFACE` in 3D.
+
+        :return: A new :class:`~ESMF.api.mesh.Mesh`.
+        """
+
+        if grid.rank not in (2, 3):
+            raise MeshArgumentError("only 2D and 3D grids can be converted "
+                                    "to a Mesh")
+        if staggerloc is None:
+            staggerloc = StaggerLoc.CORNER if grid.rank == 2 \
+                else StaggerLoc.CORNER_VFACE
+        if not grid.staggerloc[staggerloc]:
+            raise MeshArgumentError("the grid has no coordinates at stagger "
+                                    "location {0}".format(staggerloc))
+        _require_mpi4py("Mesh.from_grid")
+
+        shape = grid._global_shape_(staggerloc)
+        periodic = [grid.num_peri_dims > 0 and dim == grid.periodic_dim
+                    for dim in range(grid.rank)]
+        elements, faces = _structured_elements(
+            shape, grid.lower_bounds[staggerloc],
+            grid.upper_bounds[staggerloc], periodic)
+
+        # the nodes at the poles are merged into the node at the first index
+        # along the periodic dimension
+        pole = grid.rank == 2 and any(periodic) and \
+            grid.coord_sys != CoordSys.CART
+        pole_dim = 1 - grid.periodic_dim
+        nodes = np.unique(faces)
+        if pole:
+            ends = [0, shape[pole_dim] - 1]
+            merged = [0, 0]
+            merged[pole_dim] = ends
+            nodes = np.union1d(nodes, np.ravel_multi_index(
+                merged, shape, order='F'))
+        index = np.unravel_index(nodes, shape, order='F')
+        coords = grid._stagger_values_(grid.coords[staggerloc], staggerloc,
+                                       index)
+
+        if pole:
+            pole_lat = np.pi / 2 if grid.coord_sys == CoordSys.SPH_RAD \
+                else 90.
+            at_pole = np.isin(index[pole_dim], ends) & \
+                np.isclose(np.abs(coords[1]), pole_lat)
+            merged = list(index)
+            merged[grid.periodic_dim] = np.zeros_like(nodes)
+            target = np.where(at_pole, np.ravel_multi_index(
+                merged, shape, order='F'), nodes)
+            faces = target[np.searchsorted(nodes, faces)]
+
+            # nodes which coincide at the pole are dropped from the elements
+            faces = np.where(faces == np.roll(faces, 1, axis=1), -1, faces)
+            pos = np.searchsorted(nodes, np.unique(faces[faces >= 0]))
+            nodes = nodes[pos]
+            index = tuple(idx[pos] for idx in index)
+            coords = [coord[pos] for coord in coords]
+
+        # the cell centers of a grid whose cells are the elements
+        element_mask = None
+        element_area = None
+        element_coords = None
+        center = StaggerLoc.CENTER
+        if int(staggerloc) == 2 ** grid.rank - 1 and \
+                grid.staggerloc[center] and \
+                np.prod(grid.upper_bounds[center] -
+                        grid.lower_bounds[center]) == elements.size:
+            element_coords = [np.asarray(coord).ravel(order='F')
+                              for coord in grid.coords[center]]
+            if grid.mask[center] is not None:
+                element_mask = grid.mask[center].ravel(order='F')
+            if grid.area[center] is not None:
+                element_area = grid.area[center].ravel(order='F')
+
+        return Mesh.from_arrays(coords, np.where(faces >= 0, faces + 1, -1),
+                                node_ids=nodes + 1, element_ids=elements + 1,
+                                node_owners=grid._stagger_owners_(staggerloc,
+                                                                  index),
+                                element_mask=element_mask,
+                                element_area=element_area,
+                                element_coords=element_coords,
+                                parametric_dim=grid.rank,
+                                coord_sys=grid.coord_sys)
+
+    def get_adjacency(self):
+        """
+        Return the elements sharing an edge with every local element of a
+        :class:`~ESMF.api.mesh.Mesh` with a parametric dimension of 2, in
+        compressed sparse row (CSR) form, the neighbours of element ``i`` are
+        ``neighbours[offsets[i]:offsets[i+1]]``.  The neighbours are found by
+        sorting the node pairs of all edges once, and are cached on the
+        :class:`~ESMF.api.mesh.Mesh`.
+
+        :return: A tuple of a numpy array of ``element_count + 1`` offsets and
+            a numpy array of the 0 based indices of the neighbours of every
+            element.
+        """
+
+        if "adjacency" not in self._topology:
+            self._topology["adjacency"] = _element_adjacency(
+                *self._topology_connectivity_())
+
+        return self._topology["adjacency"]
+
+    def get_boundary_edges(self):
+        """
+        Return the edges of the local elements of a
+        :class:`~ESMF.api.mesh.Mesh` with a parametric dimension of 2 which
+        belong to a single element, i.e. the boundary of the mesh and of the
+        part of the mesh on the local PET.  The edges are cached on the
+        :class:`~ESMF.api.mesh.Mesh`.
+
+        :return: A tuple of a numpy array of shape ``(edges, 2)`` of the 0
+            based indices of the nodes of every edge, in the counterclockwise
+            order of its element, and a numpy array of the 0 based index of
+            the element of every edge.
+        """
+
+        if "boundary" not in self._topology:
+            self._topology["boundary"] = _boundary_edges(
+                *self._topology_connectivity_())
+
+        return self._topology["boundary"]
+
+    def get_cell_areas(self, chunk_size=None):
+        """
+        Compute the areas of the elements of a
+        :class:`~ESMF.api.mesh.Mesh` with a parametric dimension of 2 from the
+        coordinates of their nodes, without creating a
+        :class:`~ESMF.api.field.Field`.  Elements are bounded by great circle
+        arcs on spherical meshes and the areas are given on the unit sphere,
+        as computed by ESMF.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of elements processed at once, this
+            bounds the temporary memory used for large meshes.
+
+        :return: A numpy array of element areas.
+        """
+
+        return self._cell_geometry_(polygon_areas, chunk_size)
+
+    def get_cell_centroids(self, chunk_size=None):
+        """
+        Compute the centroids of the elements of a
+        :class:`~ESMF.api.mesh.Mesh` with a parametric dimension of 2 from the
+        coordinates of their nodes.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of elements processed at once, this
+            bounds the temporary memory used for large meshes.
+
+        :return: A list of numpy arrays of element centroids, one for each
+            coordinate dimension.
+        """
+
+        return self._cell_geometry_(polygon_centroids, chunk_size)
+
+    def get_connectivity(self):
+        """
+        Return the connectivity of the local elements of the
+        :class:`~ESMF.api.mesh.Mesh` in compressed sparse row (CSR) form, the
+        node indices of element ``i`` are
+        ``node_indices[offsets[i]:offsets[i+1]]``.  For a
+        :class:`~ESMF.api.mesh.Mesh` created from file the connectivity is
+        retrieved from ESMF into arrays of exactly the queried sizes.
+
+        :return: A tuple of a numpy array of ``element_count + 1`` offsets
+            and a numpy array of the 0 based indices of the local nodes of
+            every element, both of type int32.
+        """
+
+        node_indices = self.element_conn
+        if node_indices is None:
+            raise MeshArgumentError("the elements have not been added to the Mesh")
+
+        offsets = np.zeros(self.element_types.size + 1, dtype=np.int32)
+        np.cumsum(self._element_nodes_(), out=offsets[1:])
+
+        return offsets, node_indices
+
     def get_coords(self, coord_dim, meshloc=MeshLoc.NODE):
         """
         Return a numpy array of coordinates at a specified Mesh 
@@ -576,13 +1226,226 @@ class Mesh(object):
 
         return ret
 
+    def locate(self, lons, lats, chunk_size=None):
+        """
+        Find the local elements of a :class:`~ESMF.api.mesh.Mesh` with a
+        parametric dimension of 2 which contain a set of points, with the
+        weights of the element nodes at the points.  Elements are bounded by
+        great circle arcs on spherical meshes.  A spatial index of the
+        elements is built on the first call and kept with the
+        :class:`~ESMF.api.mesh.Mesh` for later calls.
+
+        :note: The index is rebuilt when the
+            :meth:`~ESMF.api.mesh.Mesh.fingerprint` of the mesh changes, pass
+            ``refresh=True`` to it after modifying the nodes in place.  In
+            parallel only the elements of the local PET are searched.
+
+        *REQUIRED:*
+
+        :param lons: A numpy array of the longitudes (or ``x`` coordinates of
+            cartesian meshes) of the points.
+        :param lats: A numpy array of the latitudes (or ``y`` coordinates of
+            cartesian meshes) of the points.
+
+        *OPTIONAL:*
+
+        :param int chunk_size: The number of points located at once, this
+            bounds the temporary memory used for large queries.
+
+        :return: A tuple of a numpy array of the local index of the element
+            containing every point, ``-1`` for points outside all local
+            elements, and a numpy array of the weights of the nodes of that
+            element, in the order of ``element_conn``, with a last dimension
+            of the size of the largest element.  The weights are bilinear on
+            quadrilaterals and barycentric on a triangle of the other
+            elements.
+        """
+
+        digest = self.fingerprint()
+        if self._spatial_index is None or self._spatial_index[0] != digest:
+            cell, nodes = self._cell_vertices_()
+            self._spatial_index = (digest,
+                                   SpatialIndex(cell, coord_sys=self.coord_sys,
+                                                nverts=nodes))
+
+        return self._spatial_index[1].locate(lons, lats, chunk_size=chunk_size)
+
+    def mask_from(self, values, missing_value=None, nan=True, predicate=None):
+        """
+        Set the element mask of a :class:`~ESMF.api.mesh.Mesh` from data
+        values in a single vectorized pass.  Elements with missing values are
+        given a mask of ``1`` and the other elements a mask of ``0``, so the
+        mask is used in :class:`~ESMF.api.regrid.Regrid` with
+        ``src_mask_values`` or ``dst_mask_values`` of ``[1]``.
+
+        :note: ESMF copies the element mask when the elements are added, so
+            the mask must be set before
+            :meth:`~ESMF.api.mesh.Mesh.add_elements` is called, which then
+            uses it if no ``element_mask`` is passed.
+
+        *REQUIRED:*
+
+        :param values: A numpy array of the values of the elements, in the
+            order of ``element_ids``, optionally with leading (e.g.
+            ungridded) dimensions.  An element is masked if any of its values
+            is missing.  The masked values of a numpy masked array are
+            missing.
+
+        *OPTIONAL:*
+
+        :param missing_value: A value, or a list of values, which are
+            missing.
+        :param bool nan: Set to ``False`` to keep NaN values unmasked.
+            Defaults to ``True``.
+        :param predicate: A function of the data values which returns a
+            boolean numpy array that is ``True`` for missing values, e.g.
+            ``lambda data: data < 0``.
+
+        :return: ``True`` if the mask values changed.
+        """
+
+        if self.size[element] is not None:
+            raise MeshArgumentError("the element mask can only be set before "
+                                    "the elements are added to the Mesh")
+
+        mask = _masked_cells(values, 1, missing_value=missing_value, nan=nan,
+                             predicate=predicate).astype(np.int32)
+
+        old = self._element_mask
+        changed = old is None or old.shape != mask.shape or \
+            bool(np.any(old != mask))
+        if changed:
+            self._element_mask = mask
+            self._mask[element] = mask
+            self._mask_version += 1
+            self._fingerprint = None
+
+        return changed
+
+    @staticmethod
+    def plan_partition(node_coords, faces, pets=None, curve='hilbert',
+                       coord_sys=None, weights=None, node_ids=None,
+                       fill_value=None):
+        """
+        Plan the partition of a :class:`~ESMF.api.mesh.Mesh` over the PETs
+        by ordering the element centroids along a space filling curve and
+        cutting the curve into pieces of balanced weight, so that every PET
+        gets a compact region of elements.  Every node is owned by the lowest
+        PET of its elements.  Spherical coordinates are ordered on the unit
+        sphere, so that regions wrap across the periodic boundary and the
+        poles.  The returned plan can be passed as the ``partition``
+        argument of :meth:`from_arrays` to apply it.
+
+        *REQUIRED:*
+
+        :param node_coords: A numpy array of shape ``(node_count,
+            spatial_dim)`` of the node coordinates, or a list of numpy arrays
+            of the coordinates, one for each coordinate dimension.
+        :param faces: The nodes of every element, as in :meth:`from_arrays`.
+
+        *OPTIONAL:*
+
+        :param int pets: The number of PETs.  If ``None``, defaults to
+            ``pet_count()``.
+        :param str curve: The space filling curve, ``'hilbert'`` or
+            ``'morton'``.  Defaults to ``'hilbert'``.
+        :param CoordSys coord_sys: Coordinate system of ``node_coords``.  If
+            ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+        :param weights: A numpy array of the work of every element.  If
+            ``None``, all elements carry the same work.
+        :param node_ids: A numpy array of unique node ids used in ``faces``.
+            If ``None``, ``faces`` holds 0 based node indices.
+        :param fill_value: The value of the padding entries of ``faces``.
+            If ``None``, negative entries are padding.
+
+        :return: A :class:`~ESMF.util.partition.PartitionPlan` with the PET of
+            every element in ``element_owners`` and of every node in
+            ``node_owners``, the number of elements of every PET in
+            ``counts`` and the largest count over the mean in ``imbalance``.
+        """
+
+        if pets is None:
+            pets = pet_count()
+
+        try:
+            node_coords = _stack_coords(node_coords)
+            offsets, entries = _faces_to_csr(faces, fill_value=fill_value)
+            if node_ids is None:
+                conn = entries
+            else:
+                conn = _remap_ids(node_ids, entries)
+
+            return _plan_partition(node_coords, offsets, conn, pets,
+                                   curve=curve, coord_sys=coord_sys,
+                                   weights=weights)
+        except ValueError as err:
+            raise MeshArgumentError(str(err))
+
+    def _element_nodes_(self):
+        # the number of nodes of every element, given by the type of the
+        # element on 2D meshes
+        nodes = np.asarray(self.element_types, dtype=np.int64).reshape(-1)
+        if self.parametric_dim == 3:
+            nodes = np.where(nodes == MeshElemType.TETRA, 4,
+                             np.where(nodes == MeshElemType.HEX, 8, nodes))
+
+        return nodes
+
+    def _topology_connectivity_(self):
+        if self.parametric_dim != 2:
+            raise MeshArgumentError("the topology can only be computed for meshes with a parametric dimension of 2")
+
+        return self.get_connectivity()
+
+    def _node_coords_(self):
+        # the staged node coordinates are released by from_chunks, the
+        # coordinates linked from ESMF are in the same order
+        if self.node_coords is None:
+            return np.stack(self.coords[node][:self.spatial_dim], axis=1)
+
+        return self.node_coords.reshape(-1, self.spatial_dim)
+
+    def _padded_conn_(self):
+        # the number of nodes of each element is given by its type, pad the
+        # connectivity by repeating the last node of the smaller elements
+        nodes = self.element_types.astype(np.int64)
+        offsets = np.zeros(nodes.size, dtype=np.int64)
+        offsets[1:] = np.cumsum(nodes)[:-1]
+        vertex = np.minimum(np.arange(nodes.max()), nodes[:, np.newaxis] - 1)
+
+        return self.element_conn[offsets[:, np.newaxis] + vertex], nodes
+
+    def _cell_vertices_(self):
+        if self.parametric_dim != 2:
+            raise MeshArgumentError("cell geometry can only be computed for meshes with a parametric dimension of 2")
+        if self.element_conn is None:
+            raise MeshArgumentError("cell geometry requires the element connectivity")
+
+        conn, nodes = self._padded_conn_()
+        node_coords = self._node_coords_()
+        cell = [node_coords[:, xyz][conn] for xyz in range(self.spatial_dim)]
+
+        return cell, nodes
+
+    def _cell_geometry_(self, func, chunk_size):
+        coord_sys = self.coord_sys
+        if coord_sys is None:
+            coord_sys = CoordSys.SPH_DEG
+
+        cell, _ = self._cell_vertices_()
+
+        return func(cell, coord_sys=coord_sys, chunk_size=chunk_size)
+
     def _link_coords_(self):
         elemcoords = True
 
-        # get the pointer to the underlying ESMF data array for coordinates
-        coords_interleaved, num_nodes, num_dims = ESMP_MeshGetCoordPtr(self)
+        # get the pointer to the underlying ESMF data array for coordinates,
+        # the number of dimensions is only known up front in memory
+        coords_interleaved, num_nodes, num_dims = \
+            ESMP_MeshGetCoordPtr(self, num_dims=self.spatial_dim)
         try:
-            coords_elem, num_elems, num_dims_e = ESMP_MeshGetElemCoordPtr(self)
+            coords_elem, num_elems, num_dims_e = \
+                ESMP_MeshGetElemCoordPtr(self, num_dims=num_dims)
             assert num_dims == num_dims_e
         except:
             warnings.warn("Mesh element coordinates are not available")
@@ -590,6 +1453,8 @@ class Mesh(object):
 
         if not self.parametric_dim:
             self._parametric_dim = num_dims
+        if not self.spatial_dim:
+            self._spatial_dim = num_dims
 
         try:
             pass
@@ -606,17 +1471,17 @@ class Mesh(object):
         self._coords = [[None for a in range(num_dims)] \
                         for b in range(2)]
 
-        # alias the coordinates to the mesh
-        self._coords[node][0] = np.array([coords_interleaved[2*i] for i in range(num_nodes)])
-        self._coords[node][1] = np.array([coords_interleaved[2*i+1] for i in range(num_nodes)])
-        if num_dims == 3:
-            self._coords[node][2] = np.array([coords_interleaved[2*i+2] for i in range(num_nodes)])
+        # the coordinates are strided views of the interleaved buffers
+        coords = coords_interleaved[:num_nodes * num_dims].reshape(
+            num_nodes, num_dims)
+        for xyz in range(num_dims):
+            self._coords[node][xyz] = coords[:, xyz]
 
         if elemcoords:
-            self._coords[element][0] = np.array([coords_elem[2 * i] for i in range(num_elems)])
-            self._coords[element][1] = np.array([coords_elem[2 * i + 1] for i in range(num_elems)])
-            if num_dims == 3:
-                self._coords[element][2] = np.array([coords_elem[2 * i + 2] for i in range(num_elems)])
+            coords = coords_elem[:num_elems * num_dims].reshape(num_elems,
+                                                                num_dims)
+            for xyz in range(num_dims):
+                self._coords[element][xyz] = coords[:, xyz]
 
     def _write_(self, filename):
         """
@@ -12,7 +12,38 @@ from ESMF.util.decorators import initialize
 from ESMF.api.esmpymanager import *
 from ESMF.api.grid import *
 from ESMF.api.mesh import *
+from ESMF.api.locstream import *
 from ESMF.api.field import *
+from ESMF.util.parallel import allgather as _allgather, \
+    require_mpi4py as _require_mpi4py
+from ESMF.util.partition import curve_order as _curve_order
+from ESMF.util.spatial_index import SpatialIndex, PointIndex
+
+# memory available to the weight computation of one chunk of a ChunkedRegrid
+_CHUNK_MEMORY = 64 * 2 ** 20
+
+# rough estimate of the memory used per destination point while the weights
+# of a chunk are computed: the location stream keys, the Field data, and
+# every factor of the sparse matrix with its indices, both while it is
+# computed and in the route handle
+_POINT_BYTES = 64
+_FACTOR_BYTES = 48
+_FACTORS = {RegridMethod.BILINEAR: 4,
+            RegridMethod.PATCH: 16,
+            RegridMethod.NEAREST_STOD: 1,
+            RegridMethod.NEAREST_DTOS: 1}
+
+def _copy_out_(dstfield, out):
+    # copy the regridded data into a caller array, in the original order of
+    # the points of a reordered location stream
+    if out is None:
+        return
+    if out.shape != dstfield.data.shape:
+        raise ValueError("out must be of shape " + str(dstfield.data.shape))
+    if isinstance(dstfield.grid, LocStream):
+        dstfield.grid.unpermute(dstfield.data, out=out)
+    else:
+        out[...] = dstfield.data
 
 #### Regrid class ##############################################################
 
@@ -140,6 +171,10 @@ class Regrid(object):
         self._src_frac_field = src_frac_field
         self._dst_frac_field = dst_frac_field
 
+        # versions of the masks the weights were computed with
+        self._mask_versions = (getattr(srcfield.grid, '_mask_version', 0),
+                               getattr(dstfield.grid, '_mask_version', 0))
+
         # for arbitrary metadata
         self._meta = {}
 
@@ -147,7 +182,7 @@ class Regrid(object):
         import atexit; atexit.register(self.__del__)
         self._finalized = False
 
-    def __call__(self, srcfield, dstfield, zero_region=None):
+    def __call__(self, srcfield, dstfield, zero_region=None, out=None):
         """
         Call a regridding operation from srcfield to dstfield.
 
@@ -162,6 +197,11 @@ class Regrid(object):
             will be zeroed out before adding the values resulting from the
             interpolation.  If ``None``, defaults to
             :attr:`~ESMF.api.constants.Region.TOTAL`.
+        :param ndarray out: A numpy array of the shape of the data of
+            dstfield to receive a copy of the regridded data, in the
+            original order of the points if dstfield is on a
+            :class:`~ESMF.api.locstream.LocStream` whose points were
+            reordered along a space filling curve.
 
         :return: dstfield
         """
@@ -169,6 +209,8 @@ class Regrid(object):
         # call into the ctypes layer
         ESMP_FieldRegrid(srcfield, dstfield,
                          self._routehandle, zeroregion=zero_region)
+        _copy_out_(dstfield, out)
+
         return dstfield
 
     def __del__(self):
@@ -233,6 +275,24 @@ class Regrid(object):
 
         return self._meta
 
+    @property
+    def masks_changed(self):
+        """
+        :rtype: bool
+        :return: ``True`` if the mask of the source or destination
+            :class:`~ESMF.api.field.Field` was changed with ``mask_from`` or
+            ``set_item`` since the :class:`~ESMF.api.regrid.Regrid` was
+            created with ``src_mask_values`` or ``dst_mask_values``.  The
+            regridding weights still use the previous mask, create a new
+            :class:`~ESMF.api.regrid.Regrid` to take the change into account.
+        """
+
+        src, dst = self._mask_versions
+        return (self.src_mask_values is not None and
+                getattr(self.srcfield.grid, '_mask_version', 0) != src) or \
+               (self.dst_mask_values is not None and
+                getattr(self.dstfield.grid, '_mask_version', 0) != dst)
+
     @property
     def norm_type(self):
         return self._norm_type
@@ -302,3 +362,516 @@ class Regrid(object):
             if not self._finalized:
                 ESMP_FieldRegridRelease(self.routehandle)
                 self._finalized = True
+
+#### ChunkedRegrid class #######################################################
+
+class ChunkedRegrid(object):
+    """
+    The ChunkedRegrid object regrids a Field to a very large set of points,
+    e.g. observations, in chunks of points of bounded size instead of through
+    a single :class:`~ESMF.api.locstream.LocStream`.  The points are ordered
+    along a space filling curve and cut into chunks of consecutive points,
+    so every chunk covers a compact region and the search for its source
+    cells stays local.  For every chunk a
+    :class:`~ESMF.api.locstream.LocStream`, a destination
+    :class:`~ESMF.api.field.Field` and a :class:`~ESMF.api.regrid.Regrid`
+    are created, and the results are streamed into a single numpy array in
+    the original order of the points.
+
+    By default the objects of a chunk are destroyed as soon as the chunk is
+    regridded, so the ESMF memory used at any time is that of one chunk and
+    the weights are recomputed on every call.  With ``reuse=True`` the
+    objects of all chunks are kept and reused by later calls, trading the
+    memory of all weights for the time of computing them.
+
+    In parallel every PET gives its own points, which are cut into the same
+    number of chunks on all PETs.
+
+    *REQUIRED:*
+
+    :param Field srcfield: source Field associated with an underlying Grid
+        or Mesh.
+    :param lons: A numpy array of the longitudes (or ``x`` coordinates in
+        Cartesian coordinates) of the points.
+    :param lats: A numpy array of the latitudes (or ``y`` coordinates in
+        Cartesian coordinates) of the points.
+
+    *OPTIONAL:*
+
+    :param mask: A numpy array of the mask values of the points, used with
+        ``dst_mask_values``.
+    :param CoordSys coord_sys: The coordinate system of the points.  If
+        ``None``, defaults to the coordinate system of the source Field.
+    :param int memory: The number of bytes available to the weight
+        computation of a chunk, which bounds the number of points of a
+        chunk.  If ``None``, defaults to 64 MiB.
+    :param int chunk_size: The largest number of points of a chunk on a PET,
+        overrides ``memory``.
+    :param bool reuse: Keep the regridding objects of all chunks for later
+        calls.  Defaults to ``False``.
+    :param str curve: The space filling curve ordering the points,
+        ``'hilbert'`` or ``'morton'``.
+
+    The other arguments are passed to every
+    :class:`~ESMF.api.regrid.Regrid`, see there.
+    """
+
+    @initialize
+    def __init__(self, srcfield, lons, lats,
+                 mask=None,
+                 coord_sys=None,
+                 memory=None,
+                 chunk_size=None,
+                 reuse=False,
+                 curve='hilbert',
+                 src_mask_values=None,
+                 dst_mask_values=None,
+                 regrid_method=None,
+                 pole_method=None,
+                 regrid_pole_npoints=None,
+                 line_type=None,
+                 unmapped_action=None,
+                 ignore_degenerate=None):
+        lons = np.asarray(lons).reshape(-1)
+        lats = np.asarray(lats).reshape(-1)
+        if lats.size != lons.size:
+            raise ValueError("lons and lats must have the same number of "
+                             "points")
+        if mask is not None:
+            mask = np.asarray(mask).reshape(-1)
+            if mask.size != lons.size:
+                raise ValueError("mask must be of length " + str(lons.size))
+        if coord_sys is None:
+            coord_sys = getattr(srcfield.grid, 'coord_sys', None)
+        if coord_sys is None:
+            coord_sys = CoordSys.SPH_DEG
+
+        ndbounds = srcfield.ndbounds
+        levels = int(np.prod(ndbounds)) if ndbounds else 1
+        if chunk_size is None:
+            if memory is None:
+                memory = _CHUNK_MEMORY
+            method = RegridMethod.BILINEAR if regrid_method is None \
+                else regrid_method
+            point_bytes = _POINT_BYTES + 8 * levels + \
+                _FACTOR_BYTES * _FACTORS.get(method, 4)
+            chunk_size = int(memory) // point_bytes
+        chunk_size = max(int(chunk_size), 1)
+
+        # all PETs take part in the weight computation of every chunk
+        _require_mpi4py("ChunkedRegrid")
+        chunks = max(_allgather(-(-lons.size // chunk_size)))
+
+        self._lons = lons
+        self._lats = lats
+        self._mask = mask
+        self._coord_sys = coord_sys
+        self._ndbounds = ndbounds
+        self._chunk_size = chunk_size
+        self._reuse = reuse
+        self._order = _curve_order(np.stack((lons, lats), axis=1),
+                                   coord_sys=coord_sys, curve=curve)
+        self._offsets = np.arange(chunks + 1) * lons.size // max(chunks, 1)
+        self._operators = [None] * chunks
+        self._regrid_args = dict(src_mask_values=src_mask_values,
+                                 dst_mask_values=dst_mask_values,
+                                 regrid_method=regrid_method,
+                                 pole_method=pole_method,
+                                 regrid_pole_npoints=regrid_pole_npoints,
+                                 line_type=line_type,
+                                 unmapped_action=unmapped_action,
+                                 ignore_degenerate=ignore_degenerate)
+        self._srcfield = srcfield
+
+    def __call__(self, srcfield, out=None, zero_region=None):
+        """
+        Regrid srcfield to the points, one chunk at a time.
+
+        *REQUIRED:*
+
+        :param Field srcfield: the Field of source data to regrid.
+
+        *OPTIONAL:*
+
+        :param ndarray out: A numpy array of the ungridded shape of the
+            source Field followed by the number of points to hold the
+            regridded data.  Its values are copied into the destination
+            Field of every chunk before regridding, so ``zero_region``
+            applies as in :class:`~ESMF.api.regrid.Regrid`.  If ``None``, a
+            new array is returned.
+        :param Region zero_region: specify which region of the field indices
+            will be zeroed out before adding the values resulting from the
+            interpolation.  If ``None``, defaults to
+            :attr:`~ESMF.api.constants.Region.TOTAL`.
+
+        :return: out
+        """
+
+        shape = tuple(self._ndbounds or ()) + (self._lons.size,)
+        if out is None:
+            out = np.zeros(shape, dtype=np.float64)
+        elif out.shape != shape:
+            raise ValueError("out must be of shape " + str(shape))
+
+        for chunk in range(self.chunks):
+            points = self._points_(chunk)
+            _, dstfield, regrid = self._operator_(chunk)
+            dstfield.data[...] = out[..., points]
+            regrid(srcfield, dstfield, zero_region=zero_region)
+            out[..., points] = dstfield.data
+            if not self._reuse:
+                self._release_(chunk)
+
+        return out
+
+    def __del__(self):
+        self.destroy()
+
+    @property
+    def chunks(self):
+        """
+        :rtype: int
+        :return: The number of chunks of points, the same on all PETs.
+        """
+
+        return len(self._operators)
+
+    @property
+    def chunk_size(self):
+        """
+        :rtype: int
+        :return: The largest number of points of a chunk on a PET.
+        """
+
+        return self._chunk_size
+
+    @property
+    def coord_sys(self):
+        return self._coord_sys
+
+    @property
+    def reuse(self):
+        return self._reuse
+
+    @property
+    def srcfield(self):
+        return self._srcfield
+
+    def destroy(self):
+        """
+        Release the memory of the regridding objects kept for all chunks.
+        """
+
+        if hasattr(self, '_operators'):
+            for chunk in range(self.chunks):
+                self._release_(chunk)
+
+    def _points_(self, chunk):
+        return self._order[self._offsets[chunk]:self._offsets[chunk + 1]]
+
+    def _operator_(self, chunk):
+        # create the location stream, destination Field and Regrid of a chunk
+        if self._operators[chunk] is None:
+            points = self._points_(chunk)
+            if self._coord_sys == CoordSys.CART:
+                coords = dict(x=self._lons[points], y=self._lats[points])
+            else:
+                coords = dict(lon=self._lons[points], lat=self._lats[points])
+            mask = None if self._mask is None else self._mask[points]
+
+            locstream = LocStream.from_arrays(mask=mask,
+                                              coord_sys=self._coord_sys,
+                                              location_count=points.size,
+                                              **coords)
+            dstfield = Field(locstream, ndbounds=self._ndbounds)
+            regrid = Regrid(self._srcfield, dstfield, **self._regrid_args)
+            self._operators[chunk] = (locstream, dstfield, regrid)
+
+        return self._operators[chunk]
+
+    def _release_(self, chunk):
+        if self._operators[chunk] is not None:
+            locstream, dstfield, regrid = self._operators[chunk]
+            regrid.destroy()
+            dstfield.destroy()
+            locstream.destroy()
+            self._operators[chunk] = None
+
+#### IncrementalRegrid class ###################################################
+
+class IncrementalRegrid(object):
+    """
+    The IncrementalRegrid object interpolates a Field to the points of a
+    :class:`~ESMF.api.locstream.LocStream` which move, e.g. drifting buoys
+    or aircraft tracks, without recomputing all weights when the points
+    move.  The weights are computed in numpy from a spatial index of the
+    source cells and are updated with
+    :meth:`~ESMF.api.regrid.IncrementalRegrid.update` after the coordinates
+    of the points are modified in place: the points which stayed inside
+    their previous source cell get their weights recomputed in that cell,
+    and only the points which left it are searched again.
+
+    For :attr:`~ESMF.api.constants.RegridMethod.BILINEAR` the source cells
+    are formed by neighbouring points of the stagger location of a
+    :class:`~ESMF.api.grid.Grid` Field, or are the elements of a
+    :class:`~ESMF.api.mesh.Mesh` Field on its nodes.  Cells with a masked
+    vertex are left out.  Points outside all cells are not mapped, as with
+    :attr:`~ESMF.api.constants.UnmappedAction.IGNORE`, and no artificial
+    poles are constructed.
+
+    For :attr:`~ESMF.api.constants.RegridMethod.NEAREST_STOD` every point is
+    mapped to the closest unmasked source point, as in ESMF, whether or not
+    it is inside a source cell.  Distances are measured along the chord
+    between the points on the unit sphere, which orders them as great circle
+    distances, or in the plane for Cartesian coordinates.  A point is
+    searched again only once it moved by more than half the difference
+    between the distances to its closest and second closest source point,
+    until then its closest source point cannot have changed.  Of two source
+    points at the same distance either may be chosen.
+
+    :note: This is a serial method, the cells of the source Field must all
+        be on the PET.
+
+    *REQUIRED:*
+
+    :param Field srcfield: source Field associated with an underlying Grid
+        or Mesh.
+    :param Field dstfield: destination Field associated with an underlying
+        LocStream, whose coordinates are in the coordinate system of the
+        source.
+
+    *OPTIONAL:*
+
+    :param ndarray src_mask_values: a numpy array of values that should be
+        considered masked value on the source Field.
+    :param ndarray dst_mask_values: a numpy array of values that should be
+        considered masked value on the destination Field.
+    :param RegridMethod regrid_method: specifies which
+        :attr:`~ESMF.api.constants.RegridMethod` to use, either
+        :attr:`~ESMF.api.constants.RegridMethod.BILINEAR` or
+        :attr:`~ESMF.api.constants.RegridMethod.NEAREST_STOD`, which maps
+        every point to the closest source point.  If ``None``, defaults to
+        :attr:`~ESMF.api.constants.RegridMethod.BILINEAR`.
+    :param int chunk_size: The number of points located at once, this
+        bounds the temporary memory used for large sets of points.
+    """
+
+    @initialize
+    def __init__(self, srcfield, dstfield,
+                 src_mask_values=None,
+                 dst_mask_values=None,
+                 regrid_method=None,
+                 chunk_size=None):
+        if pet_count() > 1:
+            raise SerialMethod
+
+        if regrid_method is None:
+            regrid_method = RegridMethod.BILINEAR
+        if regrid_method not in (RegridMethod.BILINEAR,
+                                 RegridMethod.NEAREST_STOD):
+            raise ValueError("regrid_method must be BILINEAR or NEAREST_STOD")
+        if not isinstance(dstfield.grid, LocStream):
+            raise ValueError("the destination Field must be on a LocStream")
+
+        grid = srcfield.grid
+        if isinstance(grid, Mesh) and srcfield.staggerloc != node:
+            raise ValueError("the source Field must be on the nodes of the "
+                             "Mesh")
+        mask = grid.mask[srcfield.staggerloc]
+        if src_mask_values is not None:
+            src_mask_values = np.array(src_mask_values, dtype=np.int32)
+        if dst_mask_values is not None:
+            dst_mask_values = np.array(dst_mask_values, dtype=np.int32)
+
+        coord_sys = grid.coord_sys
+        if coord_sys is None:
+            coord_sys = CoordSys.SPH_DEG
+
+        if regrid_method == RegridMethod.NEAREST_STOD:
+            # the unmasked source points, every point is mapped to one of
+            # them with a weight of one
+            if isinstance(grid, Mesh):
+                coords = grid._node_coords_()
+                coords = [coords[:, xyz] for xyz in range(2)]
+            else:
+                if grid.rank != 2:
+                    raise GridArgumentError("the closest points can only be found on 2D grids")
+                if not grid.staggerloc[srcfield.staggerloc]:
+                    raise GridArgumentError("the coordinates of the stagger location are required to find the closest points")
+                coords = [np.ravel(coord) for coord in
+                          grid.coords[srcfield.staggerloc][:2]]
+            points = np.arange(coords[0].size)
+            if src_mask_values is not None and mask is not None:
+                points = points[~np.isin(np.ravel(mask), src_mask_values)]
+            conn = points[:, np.newaxis]
+            index = PointIndex([coord[points] for coord in coords],
+                               coord_sys=coord_sys)
+        else:
+            # the vertices of the source cells and their indices into the
+            # data
+            if isinstance(grid, Mesh):
+                conn, nverts = grid._padded_conn_()
+                coords = grid._node_coords_()
+                cell = [coords[:, xyz][conn] for xyz in range(2)]
+            else:
+                cell, conn = grid._stagger_cells_(srcfield.staggerloc)
+                nverts = None
+
+            if src_mask_values is not None and mask is not None:
+                keep = ~np.any(np.isin(np.ravel(mask)[conn], src_mask_values),
+                               axis=1)
+                cell = [c[keep] for c in cell]
+                conn = conn[keep]
+                if nverts is not None:
+                    nverts = nverts[keep]
+            index = SpatialIndex(cell, coord_sys=coord_sys, nverts=nverts)
+
+        self._srcfield = srcfield
+        self._dstfield = dstfield
+        self._src_mask_values = src_mask_values
+        self._dst_mask_values = dst_mask_values
+        self._regrid_method = regrid_method
+        self._chunk_size = chunk_size
+        self._coord_sys = coord_sys
+        self._conn = conn
+        self._index = index
+        self._cells = np.full(dstfield.grid.size, -1, dtype=np.int64)
+        self._weights = None
+        # the positions the points had when they were last searched for their
+        # closest source point, and how far they can move from them
+        self._origin = None
+        self._radius = None
+        self._searched = 0
+
+        self.update()
+
+    def __call__(self, srcfield, dstfield, zero_region=None, out=None):
+        """
+        Interpolate srcfield to the points of dstfield with the current
+        weights.
+
+        *REQUIRED:*
+
+        :param Field srcfield: the Field of source data to regrid.
+        :param Field dstfield: the Field to hold the regridded data.
+
+        *OPTIONAL:*
+
+        :param Region zero_region: specify which region of the field indices
+            will be zeroed out before adding the values resulting from the
+            interpolation.  If ``None``, defaults to
+            :attr:`~ESMF.api.constants.Region.TOTAL`.
+        :param ndarray out: A numpy array of the shape of the data of
+            dstfield to receive a copy of the regridded data, in the
+            original order of the points if dstfield is on a
+            :class:`~ESMF.api.locstream.LocStream` whose points were
+            reordered along a space filling curve.
+
+        :return: dstfield
+        """
+
+        data = srcfield.data
+        data = data.reshape(data.shape[:srcfield.xd] + (-1,))
+
+        mapped = np.where(self._cells >= 0)[0]
+        mask = dstfield.grid.mask
+        if self._dst_mask_values is not None and mask is not None:
+            mapped = mapped[~np.isin(mask[mapped], self._dst_mask_values)]
+
+        vertices = self._conn[self._cells[mapped]]
+        values = np.einsum('...nk,nk->...n', data[..., vertices],
+                           self._weights[mapped])
+
+        if zero_region is None or zero_region == Region.TOTAL:
+            dstfield.data[...] = 0
+        elif zero_region == Region.SELECT:
+            dstfield.data[..., mapped] = 0
+        dstfield.data[..., mapped] += values
+        _copy_out_(dstfield, out)
+
+        return dstfield
+
+    @property
+    def dstfield(self):
+        return self._dstfield
+
+    @property
+    def dst_mask_values(self):
+        return self._dst_mask_values
+
+    @property
+    def regrid_method(self):
+        return self._regrid_method
+
+    @property
+    def searched(self):
+        """
+        :rtype: int
+        :return: The number of points which were searched by the last
+            :meth:`~ESMF.api.regrid.IncrementalRegrid.update`, all points on
+            creation.
+        """
+
+        return self._searched
+
+    @property
+    def srcfield(self):
+        return self._srcfield
+
+    @property
+    def src_mask_values(self):
+        return self._src_mask_values
+
+    @property
+    def unmapped(self):
+        """
+        :rtype: int
+        :return: The number of points which are not mapped, the points
+            outside all source cells, or with
+            :attr:`~ESMF.api.constants.RegridMethod.NEAREST_STOD` all points
+            if there are no unmasked source points.
+        """
+
+        return int(np.count_nonzero(self._cells < 0))
+
+    def update(self):
+        """
+        Recompute the weights after the coordinates of the points of the
+        :class:`~ESMF.api.locstream.LocStream` were modified in place.  The
+        points which are still inside their previous source cell, or with
+        :attr:`~ESMF.api.constants.RegridMethod.NEAREST_STOD` which cannot
+        have a different closest source point, are not searched.
+
+        :return: The number of points which were searched.
+        """
+
+        locstream = self._dstfield.grid
+        if self._coord_sys == CoordSys.CART:
+            lons, lats = locstream["ESMF:X"], locstream["ESMF:Y"]
+        else:
+            lons, lats = locstream["ESMF:Lon"], locstream["ESMF:Lat"]
+
+        if self._regrid_method == RegridMethod.NEAREST_STOD:
+            lons = np.array(lons, dtype=np.float64)
+            lats = np.array(lats, dtype=np.float64)
+            if self._origin is None:
+                searched = np.ones(lons.shape, dtype=bool)
+                self._origin = (lons, lats)
+                self._radius = np.zeros(lons.shape)
+                self._weights = np.ones(lons.shape + (1,))
+            else:
+                moved = self._index.distance(self._origin[0], self._origin[1],
+                                             lons, lats)
+                searched = (self._cells < 0) | (moved > self._radius)
+                self._origin[0][searched] = lons[searched]
+                self._origin[1][searched] = lats[searched]
+            self._cells[searched], self._radius[searched] = \
+                self._index.nearest(lons[searched], lats[searched],
+                                    chunk_size=self._chunk_size)
+        else:
+            self._cells, self._weights, searched = \
+                self._index.relocate(self._cells, lons, lats,
+                                     chunk_size=self._chunk_size)
+        self._searched = int(np.count_nonzero(searched))
+
+        return self._searched
@@ -9,6 +9,7 @@ import numpy as np
 
 import ESMF.api.constants as constants
 from ESMF.util.decorators import deprecated, netcdf
+from ESMF.util.exceptions import MethodNotImplemented
 from ESMF.interface.loadESMF import _ESMF
 
 def copy_struct(src):
@@ -407,7 +408,7 @@ def ESMP_GridCreateNoPeriDim(maxIndex, coordSys=None, coordTypeKind=None):
 
 _ESMF.ESMC_GridCreateFromFile.restype = ESMP_GridStruct
 _ESMF.ESMC_GridCreateFromFile.argtypes = [Py3Char, ct.c_int,
-                                          ct.POINTER(ct.c_int),
+                                          OptionalNumpyArrayInt32,
                                           OptionalNumpyArrayInt32,
                                           OptionalNamedConstant,
                                           OptionalNamedConstant,
@@ -447,8 +448,14 @@ def ESMP_GridCreateFromFile(filename, fileTypeFlag, regDecomp,
     # dummy value to correspond to ESMF_INDEX_GLOBAL = 1 for global indexing
     indexflag = 1
 
+    # the decomposition is passed as int32 arrays
+    if regDecomp is not None:
+        regDecomp = np.array(regDecomp, dtype=np.int32)
+    if decompflag is not None:
+        decompflag = np.array(decompflag, dtype=np.int32)
+
     gridstruct = _ESMF.ESMC_GridCreateFromFile(filename, fileTypeFlag,
-                                               None, decompflag,
+                                               regDecomp, decompflag,
                                                isSphere, addCornerStagger,
                                                addUserArea, indexflag, addMask, varname,
                                                coordNames, ct.byref(lrc))
@@ -818,11 +825,11 @@ def ESMP_MeshAddNodes(mesh, nodeCount,
     """
     lnc = ct.c_int(nodeCount)
 
-    # copy the numpy arrays to a specific type
-    nodeIdsD = np.array(nodeIds, dtype=np.int32)
-    nodeCoordsD = np.array(nodeCoords, dtype=np.float64)
-    # this variant uses the ndarray.astype casting function
-    nodeOwnersD = np.ndarray.astype(nodeOwners, np.int32)
+    # convert the numpy arrays to a specific type, arrays which already have
+    # it are passed without a copy
+    nodeIdsD = np.ascontiguousarray(nodeIds, dtype=np.int32)
+    nodeCoordsD = np.ascontiguousarray(nodeCoords, dtype=np.float64)
+    nodeOwnersD = np.ascontiguousarray(nodeOwners, dtype=np.int32)
 
     rc = _ESMF.ESMC_MeshAddNodes(mesh.struct.ptr, lnc,
                                  nodeIdsD, nodeCoordsD, nodeOwnersD)
@@ -952,7 +959,7 @@ _ESMF.ESMC_MeshGetCoord.argtypes = [ct.c_void_p,
                                     ct.POINTER(ct.c_int),
                                     ct.POINTER(ct.c_int), ct.POINTER(ct.c_int)]
 @deprecated
-def ESMP_MeshGetCoordPtr(mesh):
+def ESMP_MeshGetCoordPtr(mesh, num_dims=None):
     """
     Preconditions: An ESMP_Mesh has been created with coordinates 
                    specified.\n
@@ -964,12 +971,19 @@ def ESMP_MeshGetCoordPtr(mesh):
         :RETURN: int             :: num_nodes\n
         :RETURN: int             :: num_dims\n
         ESMP_Mesh                :: mesh\n
+        integer (optional)       :: num_dims\n
     """
     lrc = ct.c_int(0)
     lnum_nodes = ct.c_int(0)
     lnum_dims = ct.c_int(0)
     num_nodes = ESMP_MeshGetLocalNodeCount(mesh)
-    nodeCoords = np.array(np.zeros(num_nodes*3),dtype=np.float64)
+    # the buffer holds the coordinates interleaved, 3 per location when the
+    # number of dimensions is not known yet
+    if num_dims is None:
+        size = num_nodes*3
+    else:
+        size = num_nodes*num_dims
+    nodeCoords = np.zeros(size, dtype=np.float64)
     _ESMF.ESMC_MeshGetCoord(mesh.struct.ptr, nodeCoords,
                             ct.byref(lnum_nodes), 
                             ct.byref(lnum_dims), ct.byref(lrc))
@@ -979,6 +993,10 @@ def ESMP_MeshGetCoordPtr(mesh):
     if rc != constants._ESMP_SUCCESS:
         raise ValueError('ESMC_MeshGetCoord() failed with rc = '+str(rc)+'.    '+
                         constants._errmsg)
+    # trim the buffer to the coordinates that were written, a view keeps
+    # the peak memory at the size of the buffer
+    if nodeCoords.size > num_nodes*num_dims:
+        nodeCoords = nodeCoords[:num_nodes*num_dims]
     return nodeCoords, num_nodes, num_dims
 
 _ESMF.ESMC_MeshGetElemCoord.restype = None
@@ -986,7 +1004,7 @@ _ESMF.ESMC_MeshGetElemCoord.argtypes = [ct.c_void_p,
                                     np.ctypeslib.ndpointer(dtype=np.float64),
                                     ct.POINTER(ct.c_int),
                                     ct.POINTER(ct.c_int), ct.POINTER(ct.c_int)]
-def ESMP_MeshGetElemCoordPtr(mesh):
+def ESMP_MeshGetElemCoordPtr(mesh, num_dims=None):
     """
     Preconditions: An ESMP_Mesh has been created with element coordinates 
                    specified.\n
@@ -998,12 +1016,19 @@ def ESMP_MeshGetElemCoordPtr(mesh):
         :RETURN: int             :: num_elems\n
         :RETURN: int             :: num_dims\n
         ESMP_Mesh                :: mesh\n
+        integer (optional)       :: num_dims\n
     """
     lrc = ct.c_int(0)
     lnum_elems = ct.c_int(0)
     lnum_dims = ct.c_int(0)
     num_elems = ESMP_MeshGetLocalElementCount(mesh)
-    elemCoords = np.array(np.zeros(num_elems*3),dtype=np.float64)
+    # the buffer holds the coordinates interleaved, 3 per location when the
+    # number of dimensions is not known yet
+    if num_dims is None:
+        size = num_elems*3
+    else:
+        size = num_elems*num_dims
+    elemCoords = np.zeros(size, dtype=np.float64)
     _ESMF.ESMC_MeshGetElemCoord(mesh.struct.ptr, elemCoords,
                             ct.byref(lnum_elems), 
                             ct.byref(lnum_dims), ct.byref(lrc))
@@ -1013,6 +1038,10 @@ def ESMP_MeshGetElemCoordPtr(mesh):
     if rc != constants._ESMP_SUCCESS:
         raise ValueError('ESMC_MeshGetElemCoord() failed with rc = '+str(rc)+'.    '+
                         constants._errmsg)
+    # trim the buffer to the coordinates that were written, a view keeps
+    # the peak memory at the size of the buffer
+    if elemCoords.size > num_elems*num_dims:
+        elemCoords = elemCoords[:num_elems*num_dims]
     return elemCoords, num_elems, num_dims
 
 _ESMF.ESMC_MeshGetConnectivity.restype = None
@@ -1044,6 +1073,76 @@ def ESMP_MeshGetConnectivityPtr(mesh):
                         constants._errmsg)
     return connCoord, nodesPerElem
 
+# the exact size connectivity is only exported by recent ESMF libraries, the
+# bindings are declared when it is available
+_HAS_ELEM_CONN = hasattr(_ESMF, "ESMC_MeshGetElemConnCount") and \
+                 hasattr(_ESMF, "ESMC_MeshGetElemCreateInfo")
+if _HAS_ELEM_CONN:
+    _ESMF.ESMC_MeshGetElemConnCount.restype = None
+    _ESMF.ESMC_MeshGetElemConnCount.argtypes = [ct.c_void_p,
+                                                ct.POINTER(ct.c_int),
+                                                ct.POINTER(ct.c_int)]
+    _ESMF.ESMC_MeshGetElemCreateInfo.restype = None
+    _ESMF.ESMC_MeshGetElemCreateInfo.argtypes = [ct.c_void_p,
+                                                 OptionalNumpyArrayInt32,
+                                                 OptionalNumpyArrayInt32,
+                                                 OptionalNumpyArrayInt32,
+                                                 OptionalNumpyArrayInt32,
+                                                 OptionalNumpyArrayFloat64,
+                                                 OptionalNumpyArrayFloat64,
+                                                 ct.POINTER(ct.c_int)]
+
+def ESMP_MeshGetElemConnCount(mesh):
+    """
+    Preconditions: An ESMP_Mesh has been created.\n
+    Postconditions: The number of entries in the connectivity of the local
+                    elements of 'mesh' has been returned.\n
+    Arguments:\n
+        :RETURN: integer :: elemConnCount\n
+        ESMP_Mesh        :: mesh\n
+    """
+    if not _HAS_ELEM_CONN:
+        raise MethodNotImplemented('the ESMF library does not export '
+                                   'ESMC_MeshGetElemConnCount()')
+    lrc = ct.c_int(0)
+    lcount = ct.c_int(0)
+    _ESMF.ESMC_MeshGetElemConnCount(mesh.struct.ptr, ct.byref(lcount),
+                                    ct.byref(lrc))
+    rc = lrc.value
+    if rc != constants._ESMP_SUCCESS:
+        raise ValueError('ESMC_MeshGetElemConnCount() failed with rc = '+
+                         str(rc)+'.    '+constants._errmsg)
+    return lcount.value
+
+def ESMP_MeshGetElemConn(mesh):
+    """
+    Preconditions: An ESMP_Mesh has been created.\n
+    Postconditions: The types and the connectivity of the local elements of
+                    'mesh' have been returned into arrays of exactly the
+                    sizes queried from ESMF, the connectivity holds 0 based
+                    indices into the local nodes.\n
+    Arguments:\n
+        :RETURN: Numpy.array(dtype=int32) :: elemTypes\n
+        :RETURN: Numpy.array(dtype=int32) :: elemConn\n
+        ESMP_Mesh                         :: mesh\n
+    """
+    num_elems = ESMP_MeshGetLocalElementCount(mesh)
+    num_conn = ESMP_MeshGetElemConnCount(mesh)
+    elemTypes = np.zeros(num_elems, dtype=np.int32)
+    elemConn = np.zeros(num_conn, dtype=np.int32)
+    lrc = ct.c_int(0)
+    _ESMF.ESMC_MeshGetElemCreateInfo(mesh.struct.ptr, None, elemTypes,
+                                     elemConn, None, None, None,
+                                     ct.byref(lrc))
+    rc = lrc.value
+    if rc != constants._ESMP_SUCCESS:
+        raise ValueError('ESMC_MeshGetElemCreateInfo() failed with rc = '+
+                         str(rc)+'.    '+constants._errmsg)
+    # ESMC returns the connectivity 1 based, negative entries mark polygon
+    # breaks
+    elemConn[elemConn > 0] -= 1
+    return elemTypes, elemConn
+
 _ESMF.ESMC_MeshGetLocalElementCount.restype = ct.c_int
 _ESMF.ESMC_MeshGetLocalElementCount.argtypes = [ct.c_void_p, 
                                                 ct.POINTER(ct.c_int)]
@@ -1621,6 +1720,40 @@ def ESMP_FieldRead(field, filename, variablename, timeslice, iofmt=1):
         raise ValueError('ESMC_FieldRead() failed with rc = '+str(rc)+'.    '+
                         constants._errmsg)
 
+_ESMF.ESMC_FieldWrite.restype = ct.c_int
+_ESMF.ESMC_FieldWrite.argtypes = [ct.c_void_p,
+                                  Py3Char,
+                                  Py3Char,
+                                  ct.c_int,
+                                  ct.c_uint,
+                                  ct.c_int,
+                                  ct.c_uint]
+def ESMP_FieldWrite(field, filename, variablename, overwrite=False,
+                    status=constants.FileStatus.UNKNOWN, timeslice=0, iofmt=1):
+    """
+    Preconditions: An ESMP_Field has been created.\n
+    Postconditions: The contents of 'field' have been written to file, each
+                    PET writes the data in its local bounds.\n
+    Arguments:\n
+        ESMP_Field           :: field\n
+        string               :: filename\n
+        string               :: variablename\n
+        boolean (optional)   :: overwrite\n
+        FileStatus (optional):: status\n
+            Argument Values:\n
+                (default) FileStatus.UNKNOWN\n
+                FileStatus.OLD\n
+                FileStatus.NEW\n
+                FileStatus.REPLACE\n
+        integer (optional)   :: timeslice\n
+        IOFmt (optional)     :: iofmt\n
+    """
+    rc = _ESMF.ESMC_FieldWrite(field.struct.ptr, filename, variablename,
+                               int(overwrite), status, timeslice, iofmt)
+    if rc != constants._ESMP_SUCCESS:
+        raise ValueError('ESMC_FieldWrite() failed with rc = '+str(rc)+'.    '+
+                        constants._errmsg)
+
 
 
 _ESMF.ESMC_FieldRegridGetArea.restype = ct.c_int
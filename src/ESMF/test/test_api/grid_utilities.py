@@ -45,31 +45,13 @@ def grid_create(xdom, ydom, nx, ny, corners=False, domask=False, doarea=False, c
     grid = ESMF.Grid(max_index, staggerloc=[ESMF.StaggerLoc.CENTER], coord_sys=ESMF.CoordSys.CART, coord_typekind=ctk)
 
     # set the grid coordinates using numpy arrays, parallel case is handled using grid bounds
-    gridXCenter = grid.get_coords(x)
-    x_par = xcenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER][x]:grid.upper_bounds[ESMF.StaggerLoc.CENTER][x]]
-    gridXCenter[...] = x_par.reshape((x_par.size, 1))
+    gridXCenter = grid.set_coords(x, xcenter)
+    gridYCenter = grid.set_coords(y, ycenter)
 
-    gridYCenter = grid.get_coords(y)
-    y_par = ycenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER][y]:grid.upper_bounds[ESMF.StaggerLoc.CENTER][y]]
-    gridYCenter[...] = y_par.reshape((1, y_par.size))
-
-    # create grid corners in a slightly different manner to account for the bounds format common in CF-like files
+    # create grid corners from the bounds format common in CF-like files
     if corners:
-        grid.add_coords([ESMF.StaggerLoc.CORNER])
-        lbx = grid.lower_bounds[ESMF.StaggerLoc.CORNER][x]
-        ubx = grid.upper_bounds[ESMF.StaggerLoc.CORNER][x]
-        lby = grid.lower_bounds[ESMF.StaggerLoc.CORNER][y]
-        uby = grid.upper_bounds[ESMF.StaggerLoc.CORNER][y]
-
-        gridXCorner = grid.get_coords(x, staggerloc=ESMF.StaggerLoc.CORNER)
-        for i0 in range(ubx - lbx - 1):
-            gridXCorner[i0, :] = xcorner[i0+lbx, 0]
-        gridXCorner[i0 + 1, :] = xcorner[i0+lbx, 1]
-
-        gridYCorner = grid.get_coords(y, staggerloc=ESMF.StaggerLoc.CORNER)
-        for i1 in range(uby - lby - 1):
-            gridYCorner[:, i1] = ycorner[i1+lby, 0]
-        gridYCorner[:, i1 + 1] = ycorner[i1+lby, 1]
+        grid.set_coords(x, xcorner, staggerloc=ESMF.StaggerLoc.CORNER)
+        grid.set_coords(y, ycorner, staggerloc=ESMF.StaggerLoc.CORNER)
 
     # add an arbitrary mask
     if domask:
@@ -111,31 +93,13 @@ def grid_create_periodic(nlon, nlat, corners=False, domask=False):
     grid = ESMF.Grid(max_index, num_peri_dims=1, staggerloc=[ESMF.StaggerLoc.CENTER])
 
     # set the grid coordinates using numpy arrays, parallel case is handled using grid bounds
-    gridXCenter = grid.get_coords(lon)
-    lon_par = loncenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER][lon]:grid.upper_bounds[ESMF.StaggerLoc.CENTER][lon]]
-    gridXCenter[...] = lon_par.reshape((lon_par.size, 1))
-
-    gridYCenter = grid.get_coords(lat)
-    lat_par = latcenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER][lat]:grid.upper_bounds[ESMF.StaggerLoc.CENTER][lat]]
-    gridYCenter[...] = lat_par.reshape((1, lat_par.size))
+    gridXCenter = grid.set_coords(lon, loncenter)
+    gridYCenter = grid.set_coords(lat, latcenter)
 
-    # create grid corners in a slightly different manner to account for the bounds format common in CF-like files
+    # create grid corners from the bounds format common in CF-like files
     if corners:
-        grid.add_coords([ESMF.StaggerLoc.CORNER])
-        lbx = grid.lower_bounds[ESMF.StaggerLoc.CORNER][lon]
-        ubx = grid.upper_bounds[ESMF.StaggerLoc.CORNER][lon]
-        lby = grid.lower_bounds[ESMF.StaggerLoc.CORNER][lat]
-        uby = grid.upper_bounds[ESMF.StaggerLoc.CORNER][lat]
-
-        gridXCorner = grid.get_coords(lon, staggerloc=ESMF.StaggerLoc.CORNER)
-        for i0 in range(ubx - lbx - 1):
-            gridXCorner[i0, :] = loncorner[i0+lbx, 0]
-        gridXCorner[i0 + 1, :] = loncorner[i0+lbx, 1]
-
-        gridYCorner = grid.get_coords(lat, staggerloc=ESMF.StaggerLoc.CORNER)
-        for i1 in range(uby - lby - 1):
-            gridYCorner[:, i1] = latcorner[i1+lby, 0]
-        gridYCorner[:, i1 + 1] = latcorner[i1+lby, 1]
+        grid.set_coords(lon, loncorner, staggerloc=ESMF.StaggerLoc.CORNER)
+        grid.set_coords(lat, latcorner, staggerloc=ESMF.StaggerLoc.CORNER)
 
     # add an arbitrary mask
     if domask:
@@ -146,6 +110,32 @@ def grid_create_periodic(nlon, nlat, corners=False, domask=False):
 
     return grid
 
+def grid_create_periodic_rectilinear(nlon, nlat):
+    """
+    :param nlon: number of longitude cells, the first starting at 0 degrees
+    :param nlat: number of latitude cells
+    :return: grid, lon_corner, lat_corner
+    Create a global periodic grid with center and corner coordinates set from
+    global values on every PET, the 1D corner values are returned to compute
+    expected values
+    """
+    [lon, lat] = [0, 1]
+
+    lon_corner = np.linspace(0, 360, nlon + 1)[:-1]
+    lat_corner = np.linspace(-90, 90, nlat + 1)
+
+    max_index = np.array([nlon, nlat])
+    grid = ESMF.Grid(max_index, num_peri_dims=1,
+                     staggerloc=[ESMF.StaggerLoc.CENTER,
+                                 ESMF.StaggerLoc.CORNER])
+
+    grid.set_coords(lon, lon_corner + 180. / nlon)
+    grid.set_coords(lat, (lat_corner[:-1] + lat_corner[1:]) / 2)
+    grid.set_coords(lon, lon_corner, staggerloc=ESMF.StaggerLoc.CORNER)
+    grid.set_coords(lat, lat_corner, staggerloc=ESMF.StaggerLoc.CORNER)
+
+    return grid, lon_corner, lat_corner
+
 def grid_create_3d(xdom, ydom, zdom, nx, ny, nz, corners=False, domask=False, doarea=False):
     """
     :param xdom: 2,1 list containing the x domain
@@ -183,42 +173,15 @@ def grid_create_3d(xdom, ydom, zdom, nx, ny, nz, corners=False, domask=False, do
     grid = ESMF.Grid(max_index, staggerloc=[ESMF.StaggerLoc.CENTER_VCENTER], coord_sys=ESMF.CoordSys.CART)
 
     # set the grid coordinates using numpy arrays, parallel case is handled using grid bounds
-    gridXCenter = grid.get_coords(x)
-    x_par = xcenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER_VCENTER][x]:grid.upper_bounds[ESMF.StaggerLoc.CENTER_VCENTER][x]]
-    gridXCenter[...] = x_par.reshape(x_par.size, 1, 1)
-
-    gridYCenter = grid.get_coords(y)
-    y_par = ycenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER_VCENTER][y]:grid.upper_bounds[ESMF.StaggerLoc.CENTER_VCENTER][y]]
-    gridYCenter[...] = y_par.reshape(1, y_par.size, 1)
-
-    gridZCenter = grid.get_coords(z)
-    z_par = zcenter[grid.lower_bounds[ESMF.StaggerLoc.CENTER_VCENTER][z]:grid.upper_bounds[ESMF.StaggerLoc.CENTER_VCENTER][z]]
-    gridZCenter[...] = z_par.reshape(1, 1, z_par.size)
+    gridXCenter = grid.set_coords(x, xcenter, staggerloc=ESMF.StaggerLoc.CENTER_VCENTER)
+    gridYCenter = grid.set_coords(y, ycenter, staggerloc=ESMF.StaggerLoc.CENTER_VCENTER)
+    gridZCenter = grid.set_coords(z, zcenter, staggerloc=ESMF.StaggerLoc.CENTER_VCENTER)
 
-    # create grid corners in a slightly different manner to account for the bounds format common in CF-like files
+    # create grid corners from the bounds format common in CF-like files
     if corners:
-        grid.add_coords([ESMF.StaggerLoc.CORNER_VFACE])
-        lbx = grid.lower_bounds[ESMF.StaggerLoc.CORNER_VFACE][x]
-        ubx = grid.upper_bounds[ESMF.StaggerLoc.CORNER_VFACE][x]
-        lby = grid.lower_bounds[ESMF.StaggerLoc.CORNER_VFACE][y]
-        uby = grid.upper_bounds[ESMF.StaggerLoc.CORNER_VFACE][y]
-        lbz = grid.lower_bounds[ESMF.StaggerLoc.CORNER_VFACE][z]
-        ubz = grid.upper_bounds[ESMF.StaggerLoc.CORNER_VFACE][z]
-
-        gridXCorner = grid.get_coords(x, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
-        for i0 in range(ubx - lbx - 1):
-            gridXCorner[i0, :, :] = xcorner[i0+lbx, 0]
-        gridXCorner[i0 + 1, :, :] = xcorner[i0+lbx, 1]
-
-        gridYCorner = grid.get_coords(y, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
-        for i1 in range(uby - lby - 1):
-            gridYCorner[:, i1, :] = ycorner[i1+lby, 0]
-        gridYCorner[:, i1 + 1, :] = ycorner[i1+lby, 1]
-
-        gridZCorner = grid.get_coords(z, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
-        for i2 in range(ubz - lbz - 1):
-            gridZCorner[:, :, i2] = zcorner[i2+lbz, 0]
-        gridZCorner[:, :, i2 + 1] = zcorner[i2+lbz, 1]
+        grid.set_coords(x, xcorner, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
+        grid.set_coords(y, ycorner, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
+        grid.set_coords(z, zcorner, staggerloc=ESMF.StaggerLoc.CORNER_VFACE)
 
     # add an arbitrary mask
     if domask:
@@ -2,10 +2,14 @@
 field unit test file
 """
 
+import os
+
 from ESMF import *
+import ESMF.api.constants as constants
 from ESMF.interface.cbindings import *
 from ESMF.test.base import TestBase, attr
 from ESMF.test.test_api.mesh_utilities import mesh_create_50, mesh_create_50_parallel
+from ESMF.test.test_api.grid_utilities import grid_create_periodic_rectilinear
 
 
 class TestField(TestBase):
@@ -525,6 +529,100 @@ class TestField(TestBase):
         assert field2.data.shape == (1, 2, 5)
         assert field3.data.shape == (1, 1, 2)
 
+    def test_field_write(self):
+        # field.write does not work if ESMF is built with MPIUNI
+        if constants._ESMF_COMM == constants._ESMF_COMM_MPIUNI:
+            return
+
+        field = self.make_field(np.array([10, 10], dtype=np.int32), ndbounds=False)
+        field.data[...] = 4
+
+        filename = "test_field_write.nc"
+        field.write(filename, "data", status=FileStatus.REPLACE)
+
+        # append two time slices
+        field.write(filename, "timedata", timeslice=1)
+        field.data[...] = 5
+        field.write(filename, "timedata", timeslice=2)
+
+        field2 = Field(field.grid)
+        field2.read(filename, "data")
+        assert np.all(field2.data == 4)
+
+        # the appended time slices read back
+        field2.read(filename, "timedata", timeslice=1)
+        assert np.all(field2.data == 4)
+        field2.read(filename, "timedata", timeslice=2)
+        assert np.all(field2.data == 5)
+
+        if local_pet() == 0:
+            os.remove(filename)
+
+    @attr('serial')
+    def test_field_write_original_order(self):
+        # field.write does not work if ESMF is built with MPIUNI
+        if constants._ESMF_COMM == constants._ESMF_COMM_MPIUNI:
+            return
+
+        np.random.seed(5)
+        lon = np.random.uniform(-180, 180, 50)
+        lat = np.random.uniform(-90, 90, 50)
+        values = np.arange(50.)
+        locstream = LocStream.from_arrays(lon=lon, lat=lat, curve='hilbert')
+        field = Field(locstream)
+        field.data[...] = locstream.permute(values)
+
+        filename = "test_field_write_original_order.nc"
+        field.write(filename, "data", status=FileStatus.REPLACE,
+                    original_order=True)
+        # the data stays in the order of the points in memory
+        assert np.all(field.data == values[locstream.order])
+
+        field2 = Field(LocStream.from_arrays(lon=lon, lat=lat))
+        field2.read(filename, "data")
+        assert np.all(field2.data == values)
+
+        if local_pet() == 0:
+            os.remove(filename)
+
+    def test_field_read_timeslices(self):
+        # field.read does not work if ESMF is built with MPIUNI
+        if constants._ESMF_COMM == constants._ESMF_COMM_MPIUNI:
+            return
+
+        field = self.make_field(np.array([10, 10], dtype=np.int32), ndbounds=False)
+
+        filename = "test_field_read_timeslices.nc"
+        for ts in range(1, 4):
+            field.data[...] = ts
+            field.write(filename, "timedata", timeslice=ts,
+                        status=FileStatus.REPLACE if ts == 1 else None)
+            field.data[...] = 10 * ts
+            field.write(filename, "timedata2", timeslice=ts)
+
+        field2 = Field(field.grid, ndbounds=[3])
+        field2.read(filename, "timedata", timeslice=range(1, 4))
+        for ts in range(3):
+            assert np.all(field2.data[ts, ...] == ts + 1)
+
+        field3 = Field(field.grid, ndbounds=[2, 2])
+        field3.read(filename, ["timedata", "timedata2"], timeslice=[3, 1])
+        assert np.all(field3.data[0, 0, ...] == 3)
+        assert np.all(field3.data[0, 1, ...] == 1)
+        assert np.all(field3.data[1, 0, ...] == 30)
+        assert np.all(field3.data[1, 1, ...] == 10)
+
+        self.assertRaises(ValueError, field2.read, filename, "timedata",
+                          timeslice=[1, 2])
+        # ndbounds cannot be combined with timeslice
+        self.assertRaises(ValueError, field2.read, filename, "timedata",
+                          ndbounds=2, timeslice=1)
+        self.assertRaises(ValueError, field2.read, filename, "timedata",
+                          ndbounds=2, timeslice=range(1, 4))
+
+        if local_pet() == 0:
+            os.remove(filename)
+
     @attr('serial')
     def test_field_reshape(self):
         field = self.make_field(np.array([10, 10], dtype=np.int32), ndbounds=False)
@@ -536,3 +634,51 @@ class TestField(TestBase):
         assert type(field2) == np.ndarray
         assert field2.shape == (5,20)
         # self.examine_field_attributes(field2)
+
+    @attr('serial')
+    def test_field_coarsen(self):
+        grid, _, _ = grid_create_periodic_rectilinear(36, 18)
+        [x, y] = [0, 1]
+
+        field = Field(grid, name="srcfield", ndbounds=[2])
+        field.data[0, ...] = 1.
+        field.data[1, ...] = grid.get_coords(y)
+
+        coarse = field.coarsen([4, 3])
+        assert coarse.grid.max_index.tolist() == [9, 6]
+        assert np.allclose(coarse.data[0, ...], 1.)
+
+        # the block averages are weighted by the cell areas
+        areas = grid.get_cell_areas()
+        lat = grid.get_coords(y)
+        lb = coarse.grid.lower_bounds[StaggerLoc.CENTER]
+        ub = coarse.grid.upper_bounds[StaggerLoc.CENTER]
+        expected = np.add.reduceat(areas[0] * lat[0], np.arange(0, 18, 3)) / \
+            np.add.reduceat(areas[0], np.arange(0, 18, 3))
+        assert np.allclose(coarse.data[1, ...],
+                           expected[lb[y]:ub[y]].reshape(1, -1))
+
+        self.assertRaises(RequiredArgs, field.coarsen)
+
+    def test_field_coarsen_no_area(self):
+        # the cell areas are not set, in parallel they cannot be computed
+        # from the local corners alone
+        grid, _, lat_corner = grid_create_periodic_rectilinear(36, 18)
+        [x, y] = [0, 1]
+        center = StaggerLoc.CENTER
+        assert grid.area[center] is None
+
+        field = Field(grid, name="srcfield", ndbounds=[2])
+        field.data[0, ...] = 1.
+        field.data[1, ...] = grid.get_coords(y)
+
+        coarse = field.coarsen([4, 3])
+        assert coarse.grid.max_index.tolist() == [9, 6]
+        assert np.allclose(coarse.data[0, ...], 1.)
+
+        # every average lies within the latitudes of its block
+        lb = coarse.grid.lower_bounds[center]
+        ub = coarse.grid.upper_bounds[center]
+        rows = np.arange(lb[y], ub[y])
+        assert np.all(coarse.data[1, ...] > lat_corner[3 * rows])
+        assert np.all(coarse.data[1, ...] < lat_corner[3 * rows + 3])
@@ -7,6 +7,7 @@ import ESMF
 from ESMF import *
 from ESMF.interface.cbindings import *
 from ESMF.test.base import TestBase, attr
+from ESMF.test.test_api.grid_utilities import grid_create_periodic_rectilinear
 
 import numpy as np
 import os
@@ -396,6 +397,36 @@ class TestGrid(TestBase):
         assert grid2.coords[0][0].shape == (5, 5)
         assert grid2.upper_bounds[0].tolist() == [5, 5]
 
+    @attr('data')
+    @attr('serial')
+    def test_slice_grid_rectilinear(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        grid = Grid(filename=os.path.join(esmfdir, "test/data/gridspec1Dcoords.nc"),
+                    filetype=FileFormat.GRIDSPEC, add_corner_stagger=True,
+                    coord_names=["longitude", "latitude"])
+        assert grid.rectilinear
+
+        lon = {}
+        lat = {}
+        for stagger in [StaggerLoc.CENTER, StaggerLoc.CORNER]:
+            lon[stagger] = grid.get_coords_1d(0, staggerloc=stagger).copy()
+            lat[stagger] = grid.get_coords_1d(1, staggerloc=stagger).copy()
+
+        grid2 = grid[1:4, 1:3]
+
+        # corners have one more value than centers along every dimension
+        for stagger, extra in [(StaggerLoc.CENTER, 0), (StaggerLoc.CORNER, 1)]:
+            gridlon = grid2.coords[stagger][0]
+            gridlat = grid2.coords[stagger][1]
+            assert gridlon.shape == (3 + extra, 2 + extra)
+            assert np.all(gridlon == lon[stagger][1:4 + extra, np.newaxis])
+            assert np.all(gridlat == lat[stagger][np.newaxis, 1:3 + extra])
+
+            lon1d, lat1d = grid2._coords_1d[stagger]
+            assert np.all(lon1d == lon[stagger][1:4 + extra])
+            assert np.all(lat1d == lat[stagger][1:3 + extra])
+            assert np.all(grid2.get_coords_1d(0, staggerloc=stagger) == lon1d)
+
     def test_grid_copy(self):
         grid = self.make_grid_2d()
         self.examine_grid_attributes(grid)
@@ -405,6 +436,43 @@ class TestGrid(TestBase):
 
         assert np.all(grid.coords == grid2.coords)
 
+    def test_grid_fingerprint(self):
+        grid, _, _ = self.make_grid_periodic()
+        grid2, _, _ = self.make_grid_periodic()
+
+        fp = grid.fingerprint()
+        assert fp == grid.fingerprint()
+        assert fp == grid2.fingerprint()
+
+        # in place modifications are only seen on refresh
+        grid.get_coords(0)[...] += 1.
+        assert grid.fingerprint() == fp
+        assert grid.fingerprint(refresh=True) != fp
+
+        # adding items invalidates the digest
+        grid2.add_item(GridItem.MASK)
+        assert grid2.fingerprint() != fp
+
+    @attr('serial')
+    def test_grid_cell_areas(self):
+        grid, nlon, nlat = self.make_grid_periodic()
+
+        field = Field(grid, staggerloc=StaggerLoc.CENTER)
+        field.get_area()
+
+        areas = grid.get_cell_areas(chunk_size=1000)
+        assert areas.shape == field.data.shape
+        assert np.allclose(areas, field.data, rtol=1e-8, atol=1e-14)
+        assert np.isclose(areas.sum(), 4 * np.pi)
+
+        # the cells are symmetric about their central meridian
+        lon, lat = grid.get_cell_centroids()
+        corner_lon = grid.get_coords(0, staggerloc=StaggerLoc.CORNER)
+        corner_lat = grid.get_coords(1, staggerloc=StaggerLoc.CORNER)
+        assert np.allclose(lon, corner_lon[:, :-1] + 360. / nlon / 2.)
+        assert np.all(lat <= corner_lat[:, :-1])
+        assert np.all(lat >= corner_lat[:, 1:])
+
     def test_grid_coords(self):
 
         max_index = np.array([12, 20])
@@ -446,6 +514,269 @@ class TestGrid(TestBase):
             for j in range(gridYCoord_check.shape[y]):
                 assert(gridYCoord_check[i, j] == float(j))
 
+    def test_grid_coords_no_init(self):
+
+        max_index = np.array([12, 20])
+
+        grid = Grid(max_index)
+
+        # add coordinates and items without initializing them
+        grid.add_coords(staggerloc=[StaggerLoc.CENTER, StaggerLoc.CORNER],
+                        init_values=False)
+        grid.add_item(GridItem.MASK, init_values=False)
+        grid.add_item(GridItem.AREA, init_values=False)
+        assert grid.has_corners
+
+        self.assertRaises(GridItemAlreadyLinked, grid.add_item, GridItem.MASK)
+
+        [x, y] = [0, 1]
+        for stagger in [StaggerLoc.CENTER, StaggerLoc.CORNER]:
+            gridXCoord = grid.get_coords(x, staggerloc=stagger)
+            gridYCoord = grid.get_coords(y, staggerloc=stagger)
+            assert gridXCoord.shape == tuple(grid.size[stagger])
+
+            gridXCoord[...] = np.arange(gridXCoord.shape[x]).reshape(-1, 1)
+            gridYCoord[...] = np.arange(gridYCoord.shape[y]).reshape(1, -1)
+
+            assert np.all(grid.coords[stagger][x][:, 0] ==
+                          np.arange(gridXCoord.shape[x]))
+            assert np.all(grid.coords[stagger][y][0, :] ==
+                          np.arange(gridYCoord.shape[y]))
+
+        mask = grid.get_item(GridItem.MASK)
+        mask[...] = 1
+        assert mask.shape == tuple(grid.size[StaggerLoc.CENTER])
+        assert np.all(grid.mask[StaggerLoc.CENTER] == 1)
+
+    def test_grid_locate(self):
+        grid, nlon, nlat = self.make_grid_periodic()
+
+        # the centroids of the cells are located in the cells
+        lon, lat = grid.get_cell_centroids()
+        (i, j), weights = grid.locate(lon, lat, chunk_size=1000)
+        assert np.all(i == np.arange(lon.shape[0]).reshape(-1, 1))
+        assert np.all(j == np.arange(lon.shape[1]).reshape(1, -1))
+        assert weights.shape == lon.shape + (4,)
+        assert np.allclose(weights.sum(axis=-1), 1)
+        assert np.all(weights >= 0)
+
+        # the index is reused until the grid changes
+        index = grid._spatial_index
+        grid.locate(lon[0, 0], lat[0, 0])
+        assert grid._spatial_index is index
+
+    def test_grid_plan_decomp(self):
+        max_index = [360, 180]
+
+        # without a mask the default strips are balanced
+        plan = Grid.plan_decomp(max_index, pets=4, reg_decomp=[4, 1])
+        assert plan.imbalance == 1
+        assert np.all(plan.counts == 90 * 180)
+
+        # with the active cells in one part of the grid the strips are not
+        mask = np.zeros(max_index, dtype=np.int32)
+        mask[:90, :] = 1
+        mask[200:260, 40:140] = 1
+        default = Grid.plan_decomp(max_index, mask=mask, pets=4,
+                                   reg_decomp=[4, 1])
+        assert default.counts.sum() == mask.sum()
+        assert default.imbalance > 1.5
+
+        plan = Grid.plan_decomp(max_index, mask=mask, pets=4)
+        assert np.prod(plan.reg_decomp) == 4
+        assert plan.counts.shape == tuple(plan.reg_decomp)
+        assert plan.counts.sum() == mask.sum()
+        assert plan.imbalance < default.imbalance
+        assert plan.imbalance < 1.25
+
+        # heavily masked grids are only divided into contiguous blocks
+        mask = np.zeros([97, 61], dtype=np.int32)
+        mask[:7, :] = 1
+        mask[90:, 50:] = 1
+        mask[::13, ::5] = 1
+        contiguous = [DecompFlag.BALANCED, DecompFlag.RESTFIRST,
+                      DecompFlag.RESTLAST]
+        for pets in [3, 4, 6, 8, 12]:
+            plan = Grid.plan_decomp([97, 61], mask=mask, pets=pets)
+            assert np.prod(plan.reg_decomp) == pets
+            assert all(flag in contiguous for flag in plan.decompflag)
+
+        self.assertRaises(GridArgumentError, Grid.plan_decomp, max_index,
+                          pets=4, reg_decomp=[4, 1],
+                          decompflag=[DecompFlag.CYCLIC, DecompFlag.BALANCED])
+
+    @attr('data')
+    def test_grid_create_from_file_scrip_decomp_plan(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        filename = os.path.join(esmfdir, "test/data/T42_grid.nc")
+
+        plan = Grid.plan_decomp(filename=filename, filetype=FileFormat.SCRIP)
+        assert np.prod(plan.reg_decomp) == pet_count()
+
+        grid = Grid(filename=filename, filetype=FileFormat.SCRIP,
+                    reg_decomp=plan)
+        size = grid.size[StaggerLoc.CENTER]
+        assert np.prod(size) == plan.counts.ravel(order='F')[local_pet()]
+
+    def test_grid_set_coords(self):
+
+        max_index = np.array([12, 20])
+
+        grid = Grid(max_index, num_peri_dims=1, staggerloc=[StaggerLoc.CENTER])
+
+        # CF-style bounds of the cells
+        lons = np.linspace(-180, 180, max_index[0] + 1)
+        lats = np.linspace(-90, 90, max_index[1] + 1)
+        lon_bnds = np.array([lons[:-1], lons[1:]]).T
+        lat_bnds = np.array([lats[:-1], lats[1:]]).T
+
+        [x, y] = [0, 1]
+        center = StaggerLoc.CENTER
+        corner = StaggerLoc.CORNER
+        grid.set_coords(x, lon_bnds)
+        grid.set_coords(y, lat_bnds.mean(axis=1))
+        grid.set_coords(x, lon_bnds, staggerloc=corner)
+        grid.set_coords(y, lat_bnds, staggerloc=corner)
+        assert grid.has_corners
+
+        lb, ub = grid.lower_bounds[center], grid.upper_bounds[center]
+        assert np.allclose(grid.get_coords(x)[:, 0],
+                           lon_bnds.mean(axis=1)[lb[x]:ub[x]])
+        assert np.allclose(grid.get_coords(y)[0, :],
+                           lat_bnds.mean(axis=1)[lb[y]:ub[y]])
+
+        # the corners wrap around the periodic dimension
+        lb, ub = grid.lower_bounds[corner], grid.upper_bounds[corner]
+        assert np.allclose(grid.get_coords(x, staggerloc=corner)[:, 0],
+                           lons[:-1][lb[x]:ub[x]])
+        assert np.allclose(grid.get_coords(y, staggerloc=corner)[0, :],
+                           lats[lb[y]:ub[y]])
+
+        # global item values
+        mask = np.ones(max_index, dtype=np.int32)
+        mask[:, 0] = 0
+        grid.set_item(GridItem.MASK, mask)
+        lb, ub = grid.lower_bounds[center], grid.upper_bounds[center]
+        assert np.all(grid.get_item(GridItem.MASK) ==
+                      mask[lb[x]:ub[x], lb[y]:ub[y]])
+
+        grid.set_item(GridItem.AREA, 5.0)
+        assert np.all(grid.get_item(GridItem.AREA) == 5.0)
+
+        self.assertRaises(GridArgumentError, grid.set_coords, x,
+                          np.zeros(max_index[0] + 5))
+
+    def test_grid_subset(self):
+        max_index = np.array([36, 18])
+        grid, lon_corner, lat_corner = grid_create_periodic_rectilinear(36, 18)
+        lon_center = lon_corner + 5.
+        lat_center = lat_corner[:-1] + 5.
+
+        [x, y] = [0, 1]
+        center = StaggerLoc.CENTER
+        corner = StaggerLoc.CORNER
+        mask = np.ones(max_index, dtype=np.int32)
+        mask[::2, :] = 0
+        grid.set_item(GridItem.MASK, mask)
+
+        # a box across the dateline selects the cells 34, 35, 0 and 1 in
+        # longitude and 6 to 11 in latitude, plus a halo of one cell
+        sub = grid.subset(bbox=[[340, 20], [-30, 30]])
+        assert np.all(sub.max_index == [6, 8])
+        assert sub.num_peri_dims == 0
+        assert sub.has_corners
+
+        ilon = np.arange(33, 39) % 36
+        ilat = np.arange(5, 13)
+        lb, ub = sub.lower_bounds[center], sub.upper_bounds[center]
+        assert np.allclose(sub.get_coords(x)[:, 0],
+                           lon_center[ilon][lb[x]:ub[x]])
+        assert np.allclose(sub.get_coords(y)[0, :],
+                           lat_center[ilat][lb[y]:ub[y]])
+        assert np.all(sub.get_item(GridItem.MASK) ==
+                      mask[np.ix_(ilon, ilat)][lb[x]:ub[x], lb[y]:ub[y]])
+
+        lb, ub = sub.lower_bounds[corner], sub.upper_bounds[corner]
+        assert np.allclose(sub.get_coords(x, staggerloc=corner)[:, 0],
+                           lon_corner[np.arange(33, 40) % 36][lb[x]:ub[x]])
+        assert np.allclose(sub.get_coords(y, staggerloc=corner)[0, :],
+                           lat_corner[5:14][lb[y]:ub[y]])
+
+        # a subset over the whole periodic dimension stays periodic
+        sub = grid.subset(index_ranges=[None, [0, 4]], halo=0)
+        assert np.all(sub.max_index == [36, 4])
+        assert sub.num_peri_dims == 1
+
+        self.assertRaises(GridArgumentError, grid.subset)
+
+    def test_grid_mask_from(self):
+        max_index = np.array([12, 6])
+        grid = Grid(max_index, staggerloc=[StaggerLoc.CENTER])
+
+        data = np.ones([2] + max_index.tolist())
+        data[0, 1, 1] = np.nan
+        data[1, 2, 2] = -999.
+        data[0, 3, 3] = -1.
+
+        # the mask is added and set from global values on every PET
+        assert grid.mask_from(data, missing_value=-999.)
+        expected = np.zeros(max_index, dtype=np.int32)
+        expected[1, 1] = 1
+        expected[2, 2] = 1
+        lb = grid.lower_bounds[StaggerLoc.CENTER]
+        ub = grid.upper_bounds[StaggerLoc.CENTER]
+        assert np.all(grid.get_item(GridItem.MASK) ==
+                      expected[lb[0]:ub[0], lb[1]:ub[1]])
+
+        # an unchanged mask is not rewritten
+        fp = grid.fingerprint()
+        assert not grid.mask_from(data, missing_value=-999.)
+        assert grid.fingerprint() == fp
+
+        assert grid.mask_from(data, nan=False,
+                              predicate=lambda values: values < 0)
+        expected[1, 1] = 0
+        expected[3, 3] = 1
+        assert np.all(grid.get_item(GridItem.MASK) ==
+                      expected[lb[0]:ub[0], lb[1]:ub[1]])
+        assert grid.fingerprint() != fp
+
+        self.assertRaises(GridArgumentError, grid.mask_from, np.ones([3, 3]))
+
+    def test_grid_coarsen(self):
+        max_index = np.array([36, 18])
+        grid, lon_corner, lat_corner = grid_create_periodic_rectilinear(36, 18)
+
+        [x, y] = [0, 1]
+        center = StaggerLoc.CENTER
+        corner = StaggerLoc.CORNER
+        mask = np.zeros(max_index, dtype=np.int32)
+        mask[:4, :] = 1
+        mask[4, :] = 1
+        grid.set_item(GridItem.MASK, mask)
+
+        coarse = grid.coarsen([4, 3], mask_values=[1])
+        assert np.all(coarse.max_index == [9, 6])
+        assert coarse.num_peri_dims == 1
+
+        lb, ub = coarse.lower_bounds[center], coarse.upper_bounds[center]
+        assert np.allclose(coarse.get_coords(x)[:, 0],
+                           (np.arange(9) * 40. + 20.)[lb[x]:ub[x]])
+        assert np.allclose(coarse.get_coords(y)[0, :],
+                           (np.arange(6) * 30. - 75.)[lb[y]:ub[y]])
+        coarse_mask = np.zeros([9, 6], dtype=np.int32)
+        coarse_mask[0, :] = 1
+        assert np.all(coarse.get_item(GridItem.MASK) ==
+                      coarse_mask[lb[x]:ub[x], lb[y]:ub[y]])
+
+        lb, ub = coarse.lower_bounds[corner], coarse.upper_bounds[corner]
+        assert np.allclose(coarse.get_coords(x, staggerloc=corner)[:, 0],
+                           lon_corner[::4][lb[x]:ub[x]])
+        assert np.allclose(coarse.get_coords(y, staggerloc=corner)[0, :],
+                           lat_corner[::3][lb[y]:ub[y]])
+
+        self.assertRaises(GridArgumentError, grid.coarsen, 5)
+
     def test_grid_coords_3D(self):
 
         max_index = np.array([10, 20, 30])
@@ -582,6 +913,31 @@ class TestGrid(TestBase):
 
         self.examine_grid_attributes(grid)
 
+    @attr('data')
+    def test_grid_create_from_file_gridspec1D_rectilinear(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        grid = Grid(filename=os.path.join(esmfdir, "test/data/gridspec1Dcoords.nc"),
+                    filetype=FileFormat.GRIDSPEC, add_corner_stagger=True,
+                    coord_names=["longitude", "latitude"])
+
+        assert grid.rectilinear
+        for stagger in [StaggerLoc.CENTER, StaggerLoc.CORNER]:
+            lon = grid.get_coords_1d(0, staggerloc=stagger)
+            lat = grid.get_coords_1d(1, staggerloc=stagger)
+            assert lon.shape == (grid.size[stagger][0],)
+            assert lat.shape == (grid.size[stagger][1],)
+
+            # the full coordinates are views of the 1D vectors
+            gridlon = grid.get_coords(0, staggerloc=stagger)
+            gridlat = grid.get_coords(1, staggerloc=stagger)
+            assert gridlon.shape == tuple(grid.size[stagger])
+            assert np.all(gridlon == lon[:, np.newaxis])
+            assert np.all(gridlat == lat[np.newaxis, :])
+            assert np.may_share_memory(gridlon, lon)
+
+            lon[0] = 1234.
+            assert np.all(gridlon[0, :] == 1234.)
+
     @attr('data')
     def test_grid_create_from_file_scrip(self):
         reg_decomp = [pet_count(), 1]
@@ -593,6 +949,65 @@ class TestGrid(TestBase):
         except:
             raise NameError('grid_create_from_file_scrip failed!')
 
+    @attr('data')
+    def test_grid_create_from_file_scrip_cache(self):
+        import shutil
+        import tempfile
+
+        cachedir = None
+        if local_pet() == 0:
+            cachedir = tempfile.mkdtemp()
+        if pet_count() > 1:
+            from mpi4py import MPI
+            cachedir = MPI.COMM_WORLD.bcast(cachedir, root=0)
+
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        filename = os.path.join(esmfdir, "test/data/T42_grid.nc")
+        grid = Grid(filename=filename, filetype=FileFormat.SCRIP,
+                    add_corner_stagger=True, cache=cachedir)
+        assert len(os.listdir(cachedir)) >= 1
+
+        # the second grid is created from the cache
+        grid2 = Grid(filename=filename, filetype=FileFormat.SCRIP,
+                     add_corner_stagger=True, cache=cachedir)
+
+        self.examine_grid_attributes(grid2)
+        assert np.all(grid.max_index == grid2.max_index)
+        for stagger in [StaggerLoc.CENTER, StaggerLoc.CORNER]:
+            assert np.all(grid.lower_bounds[stagger] == grid2.lower_bounds[stagger])
+            assert np.all(grid.upper_bounds[stagger] == grid2.upper_bounds[stagger])
+            for xyz in range(grid.rank):
+                assert np.all(grid.coords[stagger][xyz] == grid2.coords[stagger][xyz])
+        assert grid.fingerprint() == grid2.fingerprint()
+
+        # with the cache of a single PET missing all PETs read the file
+        if pet_count() > 1:
+            MPI.COMM_WORLD.barrier()
+        if local_pet() == 0:
+            os.remove(os.path.join(cachedir, sorted(os.listdir(cachedir))[0]))
+        if pet_count() > 1:
+            MPI.COMM_WORLD.barrier()
+        grid3 = Grid(filename=filename, filetype=FileFormat.SCRIP,
+                     add_corner_stagger=True, cache=cachedir)
+        assert grid.fingerprint() == grid3.fingerprint()
+
+        # other decompositions than the default one are not cached
+        if pet_count() > 1:
+            MPI.COMM_WORLD.barrier()
+        cached = sorted(os.listdir(cachedir))
+        if pet_count() > 1:
+            MPI.COMM_WORLD.barrier()
+        grid4 = Grid(filename=filename, filetype=FileFormat.SCRIP,
+                     add_corner_stagger=True, cache=cachedir,
+                     reg_decomp=[1, pet_count()])
+        assert sorted(os.listdir(cachedir)) == cached
+        assert np.all(grid4.max_index == grid.max_index)
+
+        if pet_count() > 1:
+            MPI.COMM_WORLD.barrier()
+        if local_pet() == 0:
+            shutil.rmtree(cachedir)
+
     @attr('data')
     def test_grid_create_from_file_scrip_decomp_balanced_balanced(self):
         reg_decomp = [pet_count(), 1]
@@ -50,6 +50,139 @@ class TestLocStream(TestBase):
         assert np.all(l2["ESMF:X"] == [0, 1, 2, 3, 4])
 
 
+    def test_locstream_from_arrays(self):
+        lon = np.arange(5, dtype=np.float32)
+        lat = np.arange(5)
+        locstream = LocStream.from_arrays(lon=lon, lat=lat,
+                                          mask=np.array([0, 1, 0, 1, 0],
+                                                        dtype=bool),
+                                          keys={"Depth": np.ones(5)})
+        assert locstream.size == 5
+        assert locstream["ESMF:Lon"].dtype == np.float64
+        assert locstream["ESMF:Lat"].dtype == np.float64
+        assert locstream["ESMF:Mask"].dtype == np.int32
+        assert np.all(locstream["ESMF:Lat"] == lat)
+        assert np.all(locstream.mask == [0, 1, 0, 1, 0])
+        assert np.all(locstream["Depth"] == 1.)
+
+        # keys given as data types are filled in place
+        locstream = LocStream.from_arrays(x=np.float64, y=np.float64,
+                                          location_count=3)
+        assert locstream.coord_sys == CoordSys.CART
+        locstream["ESMF:X"][...] = [1., 2., 3.]
+        assert np.all(locstream["ESMF:X"] == [1., 2., 3.])
+
+        self.assertRaises(ValueError, LocStream.from_arrays, lon=np.ones(3),
+                          lat=np.ones(4))
+
+    def test_locstream_unsigned_keys(self):
+        # unsigned 4 and 8 byte ids are widened to I8 without wrapping
+        ids = np.array([1, 2, 3000000000])
+        locstream = LocStream.from_arrays(x=np.zeros(3), y=np.zeros(3),
+                                          keys={"Id32": ids.astype(np.uint32),
+                                                "Id64": ids.astype(np.uint64)})
+        assert locstream["Id32"].dtype == np.int64
+        assert locstream["Id64"].dtype == np.int64
+        assert np.all(locstream["Id32"] == ids)
+        assert np.all(locstream["Id64"] == ids)
+
+        locstream["Id"] = ids.astype(np.uint32)
+        assert np.all(locstream["Id"] == ids)
+
+        # values beyond I8 raise
+        big = np.array([1, 2, 2 ** 63], dtype=np.uint64)
+        self.assertRaises(ValueError, LocStream.from_arrays, x=np.zeros(3),
+                          y=np.zeros(3), keys={"Id": big})
+        self.assertRaises(ValueError, locstream.__setitem__, "Big", big)
+
+    def test_locstream_from_arrays_curve(self):
+        np.random.seed(7)
+        lon = np.random.uniform(-180, 180, 100)
+        lat = np.random.uniform(-90, 90, 100)
+        depth = np.arange(100.)
+        locstream = LocStream.from_arrays(lon=lon, lat=lat,
+                                          keys={"Depth": depth},
+                                          curve='hilbert')
+        order = locstream.order
+        assert np.all(np.sort(order) == np.arange(100))
+        assert np.all(locstream["ESMF:Lon"] == lon[order])
+        assert np.all(locstream["Depth"] == order)
+
+        # values are converted between both orders
+        assert np.all(locstream.unpermute(locstream["ESMF:Lat"]) == lat)
+        assert np.all(locstream.permute(depth) == locstream["Depth"])
+        field = Field(locstream, ndbounds=2)
+        field.data[...] = locstream.permute(np.stack((depth, -depth)))
+        out = np.empty((2, 100))
+        assert locstream.unpermute(field, out=out) is out
+        assert np.all(out == [depth, -depth])
+        assert np.all(field.get_data(original_order=True) == [depth, -depth])
+        assert field.get_data() is field.data
+        assert np.all(locstream.copy().order == order)
+
+        # keys set later are given in the original order
+        locstream["Other"] = depth
+        assert np.all(locstream["Other"] == order)
+
+        # the constructor reorders the points once the coordinates are set
+        locstream2 = LocStream(100, curve='hilbert')
+        locstream2["Depth"] = depth
+        locstream2["ESMF:Lon"] = lon
+        assert locstream2.order is None
+        locstream2["ESMF:Lat"] = lat
+        assert np.all(locstream2.order == order)
+        assert np.all(locstream2["ESMF:Lon"] == lon[order])
+        assert np.all(locstream2["Depth"] == order)
+
+        # points which keep their order pass through
+        locstream = LocStream.from_arrays(lon=lon, lat=lat)
+        assert locstream.order is None
+        assert np.all(locstream.unpermute(lat) == lat)
+
+        self.assertRaises(ValueError, LocStream.from_arrays, lon=np.float64,
+                          lat=np.float64, location_count=3, curve='hilbert')
+
+    def test_fingerprint(self):
+        locstream = LocStream(5, name="Test LocStream")
+        locstream["ESMF:X"] = [0., 1., 2., 3., 4.]
+        locstream["ESMF:Y"] = [7., 7., 7., 7., 7.]
+
+        locstream2 = LocStream(5, name="Test LocStream 2")
+        locstream2["ESMF:Y"] = [7., 7., 7., 7., 7.]
+        locstream2["ESMF:X"] = [0., 1., 2., 3., 4.]
+
+        fp = locstream.fingerprint()
+        assert fp == locstream.fingerprint()
+        assert fp == locstream2.fingerprint()
+        assert fp == locstream.copy().fingerprint()
+
+        # setting a key invalidates the digest
+        locstream2["ESMF:Mask"] = [0, 0, 1, 1, 1]
+        assert locstream2.fingerprint() != fp
+
+        # in place modifications are only seen on refresh
+        locstream["ESMF:X"][...] += 1.
+        assert locstream.fingerprint() == fp
+        assert locstream.fingerprint(refresh=True) != fp
+
+    def test_locstream_mask_from(self):
+        locstream = LocStream(5, name="Test LocStream")
+        locstream["ESMF:X"] = [0., 1., 2., 3., 4.]
+
+        assert locstream.mask_from(np.array([1., np.nan, 3., -1., 5.]),
+                                   missing_value=-1.)
+        assert np.all(locstream["ESMF:Mask"] == [0, 1, 0, 1, 0])
+
+        # the mask key is overwritten in place
+        mask = locstream["ESMF:Mask"]
+        values = np.ma.masked_array([1., 2., 3., 4., 5.],
+                                    mask=[0, 0, 0, 0, 1])
+        assert locstream.mask_from(values)
+        assert np.all(mask == [0, 0, 0, 0, 1])
+        assert not locstream.mask_from(values)
+
+        self.assertRaises(ValueError, locstream.mask_from, np.ones(3))
+
     @attr('serial')
     def test_slice(self):
         locstream = LocStream(5, name="Test LocStream")
@@ -10,6 +10,7 @@ import ESMF
 from ESMF import *
 from ESMF.test.base import TestBase, attr
 from ESMF.test.test_api.mesh_utilities import *
+from ESMF.test.test_api.grid_utilities import *
 
 class TestMesh(TestBase):
     Manager(debug=True)
@@ -150,6 +151,275 @@ class TestMesh(TestBase):
         except:
             raise NameError('mesh_create_from_file_scrip failed!')
 
+    @attr('serial')
+    def test_mesh_get_connectivity(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn = \
+            mesh_create_5_pentahexa()
+
+        offsets, node_indices = mesh.get_connectivity()
+        assert offsets.dtype == np.int32
+        assert np.all(offsets == [0, 4, 7, 10, 15, 21])
+        assert np.all(node_indices == elemConn)
+
+    @attr('data')
+    @attr('serial')
+    def test_mesh_get_connectivity_from_file(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        mesh = Mesh(filename=os.path.join(esmfdir, "test/data/ne4np4-esmf.nc"),
+                    filetype=FileFormat.ESMFMESH)
+
+        # the connectivity is sized exactly and indexes the local nodes
+        offsets, node_indices = mesh.get_connectivity()
+        assert offsets.size == mesh.size[element] + 1
+        assert offsets[-1] == node_indices.size
+        assert np.all(node_indices >= 0)
+        assert np.all(node_indices < mesh.size[node])
+
+    @attr('data')
+    @attr('serial')
+    def test_mesh_cell_areas_from_file(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        mesh = Mesh(filename=os.path.join(esmfdir, "test/data/ne4np4-esmf.nc"),
+                    filetype=FileFormat.ESMFMESH)
+
+        # the areas are computed from the coordinates linked from ESMF
+        field = Field(mesh, meshloc=MeshLoc.ELEMENT)
+        field.get_area()
+        areas = mesh.get_cell_areas(chunk_size=100)
+        assert areas.shape == (936,)
+        assert np.allclose(areas, field.data, rtol=1e-8, atol=1e-14)
+        # the mesh covers the sphere
+        assert np.isclose(areas.sum(), 4 * np.pi, rtol=1e-6)
+
+        lon, lat = mesh.get_cell_centroids(chunk_size=100)
+        assert lon.shape == (936,)
+        assert np.all(np.abs(lat) <= 90)
+
+    @attr('data')
+    @attr('serial')
+    def test_mesh_locate_from_file(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        mesh = Mesh(filename=os.path.join(esmfdir, "test/data/ne4np4-esmf.nc"),
+                    filetype=FileFormat.ESMFMESH)
+
+        # the centroids of the elements are located in the elements
+        lon, lat = mesh.get_cell_centroids()
+        elements, weights = mesh.locate(lon, lat, chunk_size=100)
+        assert np.all(elements == np.arange(936))
+        assert np.allclose(weights.sum(axis=1), 1)
+
+    @attr('data')
+    @attr('serial')
+    def test_mesh_topology_from_file(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        mesh = Mesh(filename=os.path.join(esmfdir, "test/data/ne4np4-esmf.nc"),
+                    filetype=FileFormat.ESMFMESH)
+
+        # the mesh covers the sphere, so every node has a dual cell
+        dual = mesh.dual()
+        assert dual.size[node] == 936
+        assert dual.size[element] == 866
+        assert np.isclose(dual.get_cell_areas().sum(), 4 * np.pi, rtol=1e-6)
+        # the centroids are cached with the dual cells
+        centroids = mesh._topology["dual"][0]
+        mesh.dual()
+        assert mesh._topology["dual"][0] is centroids
+
+    @attr('serial')
+    def test_mesh_from_arrays(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn = \
+            mesh_create_5_pentahexa()
+        coords = nodeCoord.reshape(-1, 2)
+
+        # padded faces which refer to arbitrary node ids
+        node_ids = np.arange(1, 13) * 10
+        faces = np.full((5, 6), -1, dtype=np.int32)
+        offsets = np.array([0, 4, 7, 10, 15, 21])
+        for i in range(5):
+            faces[i, :offsets[i+1]-offsets[i]] = \
+                node_ids[elemConn[offsets[i]:offsets[i+1]]]
+
+        mesh2 = Mesh.from_arrays(coords, faces, node_ids=node_ids)
+        assert mesh2.size[node] == 12
+        assert mesh2.size[element] == 5
+        assert np.all(mesh2.element_types == elemType)
+        offsets2, node_indices = mesh2.get_connectivity()
+        assert np.all(offsets2 == offsets)
+        assert np.all(node_indices == elemConn)
+
+        # compressed sparse row faces of 0-based node indices
+        mesh3 = Mesh.from_arrays([coords[:, 0], coords[:, 1]],
+                                 (offsets, elemConn))
+        assert np.all(mesh3.get_connectivity()[1] == elemConn)
+
+        faces[0, 0] = 5
+        self.assertRaises(MeshArgumentError, Mesh.from_arrays, coords, faces,
+                          node_ids=node_ids)
+
+    @attr('serial')
+    def test_mesh_from_arrays_weld(self):
+        # two quads and a triangle, each with its own copy of shared nodes
+        coords = np.array([[0, 0], [1, 0], [1, 1], [0, 1],
+                           [1, 0], [2, 0], [2, 1], [1, 1 + 1e-12],
+                           [1, 1], [2, 1], [1.5, 2]])
+        faces = np.array([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, -1]])
+
+        mesh = Mesh.from_arrays(coords, faces, coord_sys=CoordSys.CART,
+                                weld=1e-6)
+        assert mesh.welded_nodes == 4
+        assert mesh.size[node] == 7
+        offsets, node_indices = mesh.get_connectivity()
+        assert np.all(offsets == [0, 4, 8, 11])
+        assert np.all(node_indices == [0, 1, 2, 3, 1, 4, 5, 2, 2, 5, 6])
+
+        # copies on both sides of a boundary between lattice cells of the
+        # tolerance are merged
+        coords = np.array([[0, 0], [1 - 3e-7, 0], [1 - 3e-7, 1 + 3e-7],
+                           [0, 1],
+                           [1 + 3e-7, 0], [2, 0], [2, 1],
+                           [1 + 3e-7, 1 + 7e-7]])
+        faces = np.array([[0, 1, 2, 3], [4, 5, 6, 7]])
+        mesh = Mesh.from_arrays(coords, faces, coord_sys=CoordSys.CART,
+                                weld=1e-6)
+        assert mesh.welded_nodes == 2
+        assert mesh.size[node] == 6
+        assert np.all(mesh.get_connectivity()[1] == [0, 1, 2, 3, 1, 4, 5, 2])
+
+        # the nodes of an element which coincide are dropped
+        coords = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [1, 0]])
+        faces = np.array([[0, 1, 4, 2, 3]])
+        mesh = Mesh.from_arrays(coords[:5], faces, coord_sys=CoordSys.CART,
+                                weld=1e-6)
+        assert mesh.size[element] == 1
+        assert np.all(mesh.get_connectivity()[0] == [0, 4])
+
+    @attr('serial')
+    def test_mesh_from_chunks(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn = \
+            mesh_create_5_pentahexa()
+        coords = nodeCoord.reshape(-1, 2)
+        node_ids = np.arange(1, 13) * 10
+        offsets = np.array([0, 4, 7, 10, 15, 21])
+
+        def nodes():
+            for start in range(0, 12, 5):
+                yield {"node_ids": node_ids[start:start + 5],
+                       "node_coords": coords[start:start + 5]}
+
+        def elements():
+            for first, last in [(0, 3), (3, 5)]:
+                yield {"faces": (offsets[first:last + 1] - offsets[first],
+                                 node_ids[elemConn[offsets[first]:
+                                                   offsets[last]]]),
+                       "element_mask": np.arange(first, last) % 2}
+
+        for count in [None, 12]:
+            mesh2 = Mesh.from_chunks(nodes(), elements(), 2, 2,
+                                     node_count=count,
+                                     element_count=None if count is None
+                                     else 5)
+            assert mesh2.size[node] == 12
+            assert mesh2.size[element] == 5
+            assert np.all(mesh2.mask[element] == [0, 1, 0, 1, 0])
+            # the staged arrays are released
+            assert mesh2.node_coords is None
+            assert mesh2._element_conn is None
+            offsets2, node_indices = mesh2.get_connectivity()
+            assert np.all(offsets2 == offsets)
+            assert np.allclose(mesh2.get_coords(0)[node_indices],
+                               coords[elemConn, 0])
+
+        self.assertRaises(MeshArgumentError, Mesh.from_chunks, nodes(),
+                          elements(), 2, 2, node_count=10)
+
+    @attr('serial')
+    def test_mesh_from_grid(self):
+        grid = grid_create([0, 4], [0, 3], 4, 3, corners=True, doarea=True)
+        mask = grid.add_item(GridItem.MASK)
+        mask[:] = 0
+        mask[1, 2] = 1
+
+        mesh = Mesh.from_grid(grid)
+        assert mesh.size[node] == 20
+        assert mesh.size[element] == 12
+        assert np.all(mesh.element_types == MeshElemType.QUAD)
+        offsets, node_indices = mesh.get_connectivity()
+        assert np.all(node_indices[:8] == [0, 1, 6, 5, 1, 2, 7, 6])
+        assert np.allclose(mesh.get_coords(0), np.tile(np.arange(5), 4))
+        assert np.allclose(mesh.get_coords(1), np.repeat(np.arange(4), 5))
+        assert np.all(mesh.mask[element] == mask.ravel(order='F'))
+        assert mesh.mask[element][9] == 1
+
+        # the periodic dimension wraps around and the poles are single nodes
+        grid = grid_create_periodic(8, 4, corners=True)
+
+        mesh = Mesh.from_grid(grid)
+        assert mesh.size[node] == 26
+        assert mesh.size[element] == 32
+        nodes = np.diff(mesh.get_connectivity()[0])
+        assert np.all(nodes[:8] == 3)
+        assert np.all(nodes[8:24] == 4)
+        assert np.all(nodes[24:] == 3)
+
+        # nodes at the cell centers
+        mesh = Mesh.from_grid(grid, staggerloc=StaggerLoc.CENTER)
+        assert mesh.size[node] == 32
+        assert mesh.size[element] == 24
+
+    def test_mesh_plan_partition(self):
+        # a 10x10 quad mesh
+        x, y = np.meshgrid(np.arange(11.), np.arange(11.), indexing='ij')
+        i, j = [a.ravel(order='F') for a in
+                np.meshgrid(np.arange(10), np.arange(10), indexing='ij')]
+        faces = np.stack((i + j * 11, i + 1 + j * 11, i + 1 + (j + 1) * 11,
+                          i + (j + 1) * 11), axis=1)
+        coords = [x.ravel(order='F'), y.ravel(order='F')]
+
+        plan = Mesh.plan_partition(coords, faces, pets=4,
+                                   coord_sys=CoordSys.CART)
+        assert np.all(plan.counts == 25)
+        assert plan.imbalance == 1.
+        # every PET gets a compact block of cells
+        assert np.all(plan.element_owners.reshape(10, 10)[:5, :5] ==
+                      plan.element_owners[0])
+        # nodes are owned by the lowest PET of their elements
+        owners = np.full(121, 4)
+        np.minimum.at(owners, faces.ravel(),
+                      np.repeat(plan.element_owners, 4))
+        assert np.all(plan.node_owners == owners)
+
+        mesh = Mesh.from_arrays(coords, faces, coord_sys=CoordSys.CART,
+                                partition=True)
+        plan = Mesh.plan_partition(coords, faces, coord_sys=CoordSys.CART)
+        assert mesh.size[element] == plan.counts[local_pet()]
+        assert mesh.size_owned[node] == \
+            np.count_nonzero(plan.node_owners == local_pet())
+
+    @attr('serial')
+    def test_mesh_topology(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn = \
+            mesh_create_5_pentahexa(coord_sys=CoordSys.CART)
+
+        offsets, neighbours = mesh.get_adjacency()
+        assert np.all(offsets == [0, 2, 4, 6, 8, 10])
+        assert np.all(neighbours == [1, 3, 0, 2, 1, 4, 0, 4, 2, 3])
+        # the topology is cached
+        assert mesh.get_adjacency() is mesh.get_adjacency()
+
+        edges, elements = mesh.get_boundary_edges()
+        assert edges.shape == (11, 2)
+        assert np.all(np.bincount(elements) == [2, 1, 1, 3, 4])
+        assert [0, 1] in edges.tolist()
+        assert [1, 0] not in edges.tolist()
+
+        # node 5 is the only node inside the mesh
+        dual = mesh.dual()
+        assert dual.size[node] == 5
+        assert dual.size[element] == 1
+        offsets, node_indices = dual.get_connectivity()
+        assert np.all(offsets == [0, 5])
+        assert np.all(node_indices == [0, 1, 2, 4, 3])
+
     def test_mesh_copy(self):
         parallel = False
         if pet_count() > 1:
@@ -169,6 +439,108 @@ class TestMesh(TestBase):
         mesh2 = mesh.copy()
         self.check_mesh(mesh2, nodeCoord, nodeOwner)
 
+    @attr('serial')
+    def test_mesh_cell_areas(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn, elemCoord = \
+            mesh_create_50()
+
+        field = Field(mesh, meshloc=MeshLoc.ELEMENT)
+        field.get_area()
+
+        areas = mesh.get_cell_areas(chunk_size=7)
+        assert areas.shape == field.data.shape
+        assert np.allclose(areas, field.data, rtol=1e-8, atol=1e-14)
+
+        # the centroids of the small quads are close to the mean of their nodes
+        xcentroid, ycentroid = mesh.get_cell_centroids()
+        quads = np.where(elemType == MeshElemType.QUAD)[0]
+        conn = elemConn[:4 * quads.size].reshape(-1, 4)
+        assert np.allclose(xcentroid[quads], nodeCoord[0::2][conn].mean(axis=1), atol=1e-3)
+        assert np.allclose(ycentroid[quads], nodeCoord[1::2][conn].mean(axis=1), atol=1e-3)
+
+    @attr('serial')
+    def test_mesh_locate(self):
+        mesh, nodeCoord, nodeOwner, elemType, elemConn, elemCoord = \
+            mesh_create_50()
+
+        # the centroids of the elements are located in the elements
+        xcentroid, ycentroid = mesh.get_cell_centroids()
+        elements, weights = mesh.locate(np.append(xcentroid, 10.),
+                                        np.append(ycentroid, 10.))
+        assert np.all(elements[:-1] == np.arange(xcentroid.size))
+        assert elements[-1] == -1
+        assert np.allclose(weights[:-1].sum(axis=1), 1)
+        assert np.all(weights[-1] == 0)
+
+        # the weights interpolate the node coordinates to the points
+        quads = np.where(elemType == MeshElemType.QUAD)[0]
+        conn = elemConn[:4 * quads.size].reshape(-1, 4)
+        x = (weights[quads, :4] * nodeCoord[0::2][conn]).sum(axis=1)
+        y = (weights[quads, :4] * nodeCoord[1::2][conn]).sum(axis=1)
+        assert np.allclose(x, xcentroid[quads], atol=1e-3)
+        assert np.allclose(y, ycentroid[quads], atol=1e-3)
+
+    @attr('serial')
+    def test_mesh_coords_3d(self):
+        mesh = Mesh(parametric_dim=3, spatial_dim=3, coord_sys=CoordSys.CART)
+        nodeId = np.arange(1, 9)
+        nodeCoord = np.array([[x, y, z] for z in (0., 1.) for y in (0., 2.)
+                              for x in (0., 3.)]).reshape(-1)
+        nodeOwner = np.zeros(8)
+        elemId = np.array([1])
+        elemType = np.array([MeshElemType.HEX])
+        elemConn = np.array([0, 1, 3, 2, 4, 5, 7, 6])
+        elemCoord = np.array([1.5, 1., 0.5])
+
+        mesh.add_nodes(8, nodeId, nodeCoord, nodeOwner)
+        mesh.add_elements(1, elemId, elemType, elemConn,
+                          element_coords=elemCoord)
+
+        # the coordinates are views with a stride of the spatial dimension
+        for xyz in range(3):
+            assert np.all(mesh.get_coords(xyz) == nodeCoord[xyz::3])
+            assert np.all(mesh.get_coords(xyz, meshloc=MeshLoc.ELEMENT) ==
+                          elemCoord[xyz])
+        assert mesh.get_coords(0).base is mesh.get_coords(2).base
+
+    @attr('serial')
+    def test_mesh_mask_from(self):
+        mesh = Mesh(parametric_dim=2, spatial_dim=2)
+        nodeId = np.array([11, 12, 13, 21, 22, 23])
+        nodeCoord = np.array([0., 0., 2., 0., 4., 0., 0., 2., 2., 2., 4., 2.])
+        nodeOwner = np.zeros(6)
+        elemId = np.array([11, 12])
+        elemType = np.array([MeshElemType.QUAD, MeshElemType.QUAD])
+        elemConn = np.array([0, 1, 4, 3, 1, 2, 5, 4])
+
+        # the mask is set before the elements are added
+        assert mesh.mask_from(np.array([[1., np.nan], [1., 1.]]))
+        mesh.add_nodes(6, nodeId, nodeCoord, nodeOwner)
+        mesh.add_elements(2, elemId, elemType, elemConn)
+        assert np.all(mesh.mask[element] == [0, 1])
+
+        self.assertRaises(MeshArgumentError, mesh.mask_from, np.ones(2))
+
+    def test_mesh_fingerprint(self):
+        if pet_count() > 1:
+            mesh = mesh_create_50_ngons_parallel()[0]
+            mesh2 = mesh_create_50_ngons_parallel()[0]
+            mesh3 = mesh_create_50_parallel()[0]
+        else:
+            mesh = mesh_create_50_ngons()[0]
+            mesh2 = mesh_create_50_ngons()[0]
+            mesh3 = mesh_create_50()[0]
+
+        fp = mesh.fingerprint()
+        assert fp == mesh.fingerprint()
+        assert fp == mesh2.fingerprint()
+        assert fp != mesh3.fingerprint()
+
+        # in place modifications are only seen on refresh
+        mesh.get_coords(0)[...] += 1.
+        assert mesh.fingerprint() == fp
+        assert mesh.fingerprint(refresh=True) != fp
+
     @attr('serial')
     def test_mesh_slicing(self):
         parallel = False
@@ -2,6 +2,9 @@
 regrid unit test file
 """
 
+import os
+import inspect
+
 from ESMF import *
 from ESMF.test.base import TestBase, attr
 from ESMF.test.test_api.mesh_utilities import *
@@ -765,3 +768,186 @@ class TestRegrid(TestBase):
         meanrel, _ = compare_fields_grid(dstfield, exactfield, 80E-1, 10E-16, parallel=parallel)
 
         self.assertAlmostEqual(meanrel, 0)
+
+    @attr('serial')
+    def test_grid_locstream_chunked_regrid(self):
+        # create a global grid with an analytic field
+        grid = grid_create_periodic(60, 30, corners=True)
+        srcfield = ESMF.Field(grid, name='srcfield')
+        srcfield = initialize_field_grid_periodic(srcfield)
+
+        # random points away from the poles
+        np.random.seed(42)
+        lons = np.random.uniform(-180, 180, 1000)
+        lats = np.random.uniform(-80, 80, 1000)
+
+        # regrid to all points at once
+        locstream = ESMF.LocStream.from_arrays(lon=lons, lat=lats)
+        dstfield = ESMF.Field(locstream, name='dstfield')
+        regrid = ESMF.Regrid(srcfield, dstfield,
+                             regrid_method=ESMF.RegridMethod.BILINEAR,
+                             unmapped_action=ESMF.UnmappedAction.ERROR)
+        dstfield = regrid(srcfield, dstfield)
+
+        # regrid in chunks of at most 128 points
+        chunked = ESMF.ChunkedRegrid(srcfield, lons, lats, chunk_size=128,
+                                     regrid_method=ESMF.RegridMethod.BILINEAR,
+                                     unmapped_action=ESMF.UnmappedAction.ERROR)
+        self.assertEqual(chunked.chunks, 8)
+        out = chunked(srcfield)
+        self.assertEqual(out.shape, (1000,))
+        self.assertNumpyAllClose(out, dstfield.data)
+
+        # the kept operators give the same results on later calls
+        chunked = ESMF.ChunkedRegrid(srcfield, lons, lats,
+                                     memory=64 * 1024, reuse=True)
+        self.assertTrue(chunked.chunks > 1)
+        first = chunked(srcfield)
+        srcfield.data[...] *= 2
+        second = chunked(srcfield, out=np.empty(1000))
+        self.assertNumpyAllClose(first, dstfield.data)
+        self.assertNumpyAllClose(second, 2 * dstfield.data)
+        chunked.destroy()
+
+    @attr('serial')
+    def test_grid_locstream_incremental_regrid(self):
+        # create a global grid with an analytic field
+        grid = grid_create_periodic(60, 30, corners=True)
+        srcfield = ESMF.Field(grid, name='srcfield')
+        srcfield = initialize_field_grid_periodic(srcfield)
+
+        # random points away from the poles
+        np.random.seed(11)
+        lons = np.random.uniform(-180, 180, 500)
+        lats = np.random.uniform(-80, 80, 500)
+        locstream = ESMF.LocStream.from_arrays(lon=lons, lat=lats)
+        dstfield = ESMF.Field(locstream, name='dstfield')
+        exactfield = ESMF.Field(locstream, name='exactfield')
+
+        regrid = ESMF.IncrementalRegrid(srcfield, dstfield)
+        self.assertEqual(regrid.searched, 500)
+        self.assertEqual(regrid.unmapped, 0)
+        dstfield = regrid(srcfield, dstfield)
+
+        # compare with the weights computed by ESMF
+        esmf_regrid = ESMF.Regrid(srcfield, exactfield,
+                                  regrid_method=ESMF.RegridMethod.BILINEAR,
+                                  unmapped_action=ESMF.UnmappedAction.ERROR)
+        exactfield = esmf_regrid(srcfield, exactfield)
+        self.assertTrue(np.abs(dstfield.data - exactfield.data).max() < 5e-2)
+
+        # move the points a little, only the points which left their cell
+        # are searched
+        locstream["ESMF:Lon"][...] += 0.5
+        locstream["ESMF:Lat"][...] -= 0.5
+        searched = regrid.update()
+        self.assertTrue(0 < searched < 500)
+        dstfield = regrid(srcfield, dstfield)
+
+        moved = ESMF.IncrementalRegrid(srcfield, exactfield)
+        exactfield = moved(srcfield, exactfield)
+        self.assertNumpyAllClose(dstfield.data, exactfield.data)
+
+        # nearest neighbour values are the values of the closest source
+        # points, as computed by ESMF
+        nearest = ESMF.IncrementalRegrid(
+            srcfield, dstfield, regrid_method=ESMF.RegridMethod.NEAREST_STOD)
+        dstfield = nearest(srcfield, dstfield)
+        esmf_nearest = ESMF.Regrid(srcfield, exactfield,
+                                   regrid_method=ESMF.RegridMethod.NEAREST_STOD,
+                                   unmapped_action=ESMF.UnmappedAction.ERROR)
+        exactfield = esmf_nearest(srcfield, exactfield)
+        self.assertNumpyAllClose(dstfield.data, exactfield.data)
+
+        # only the points which may have a different closest source point
+        # are searched
+        locstream["ESMF:Lon"][...] += 0.1
+        searched = nearest.update()
+        self.assertTrue(0 < searched < 500)
+        dstfield = nearest(srcfield, dstfield)
+        moved = ESMF.IncrementalRegrid(
+            srcfield, exactfield, regrid_method=ESMF.RegridMethod.NEAREST_STOD)
+        exactfield = moved(srcfield, exactfield)
+        self.assertNumpyAllClose(dstfield.data, exactfield.data)
+
+    @attr('serial')
+    def test_grid_locstream_regrid_original_order(self):
+        grid = grid_create_periodic(60, 30, corners=True)
+        srcfield = ESMF.Field(grid, name='srcfield')
+        srcfield = initialize_field_grid_periodic(srcfield)
+
+        np.random.seed(17)
+        lons = np.random.uniform(-180, 180, 300)
+        lats = np.random.uniform(-80, 80, 300)
+        exactfield = ESMF.Field(ESMF.LocStream.from_arrays(lon=lons, lat=lats),
+                                name='exactfield')
+        exactfield = ESMF.Regrid(srcfield, exactfield)(srcfield, exactfield)
+
+        # the results of points reordered along a curve are handed back in
+        # the original order of the points
+        locstream = ESMF.LocStream.from_arrays(lon=lons, lat=lats,
+                                               curve='hilbert')
+        dstfield = ESMF.Field(locstream, name='dstfield')
+        out = np.empty(300)
+        regrid = ESMF.Regrid(srcfield, dstfield)
+        dstfield = regrid(srcfield, dstfield, out=out)
+        self.assertNumpyAllClose(out, exactfield.data)
+        self.assertNumpyAllClose(dstfield.data,
+                                 exactfield.data[locstream.order])
+
+        out[...] = 0
+        incremental = ESMF.IncrementalRegrid(srcfield, dstfield)
+        dstfield = incremental(srcfield, dstfield, out=out)
+        self.assertTrue(np.abs(out - exactfield.data).max() < 5e-2)
+
+    @attr('serial')
+    def test_grid_locstream_incremental_regrid_nearest_outside(self):
+        # a regional grid in Cartesian coordinates
+        grid = ESMF.Grid(np.array([4, 3]), coord_sys=ESMF.CoordSys.CART,
+                         staggerloc=[ESMF.StaggerLoc.CENTER])
+        x = grid.get_coords(0)
+        y = grid.get_coords(1)
+        x[...] = np.arange(4).reshape(4, 1)
+        y[...] = np.arange(3).reshape(1, 3)
+        srcfield = ESMF.Field(grid, name='srcfield')
+        srcfield.data[...] = 10 * x + y
+
+        # points outside all source cells are mapped to the closest source
+        # point
+        locstream = ESMF.LocStream.from_arrays(
+            x=np.array([-5., 1.2, 2.9, 10.]), y=np.array([-5., 0.6, 1.4, 1.]),
+            coord_sys=ESMF.CoordSys.CART)
+        dstfield = ESMF.Field(locstream, name='dstfield')
+        nearest = ESMF.IncrementalRegrid(
+            srcfield, dstfield, regrid_method=ESMF.RegridMethod.NEAREST_STOD)
+        self.assertEqual(nearest.unmapped, 0)
+        dstfield = nearest(srcfield, dstfield)
+        self.assertNumpyAllClose(dstfield.data, np.array([0., 11., 31., 31.]))
+
+    @attr('data')
+    @attr('serial')
+    def test_mesh_locstream_incremental_regrid_from_file(self):
+        esmfdir = os.path.dirname(inspect.getfile(ESMF))
+        mesh = ESMF.Mesh(filename=os.path.join(esmfdir,
+                                               "test/data/ne4np4-esmf.nc"),
+                         filetype=ESMF.FileFormat.ESMFMESH)
+        srcfield = ESMF.Field(mesh, name='srcfield', meshloc=ESMF.MeshLoc.NODE)
+        lat = np.radians(mesh.get_coords(1))
+        srcfield.data[...] = 2. + np.sin(lat) ** 2
+
+        np.random.seed(13)
+        locstream = ESMF.LocStream.from_arrays(
+            lon=np.random.uniform(-180, 180, 200),
+            lat=np.random.uniform(-80, 80, 200))
+        dstfield = ESMF.Field(locstream, name='dstfield')
+        exactfield = ESMF.Field(locstream, name='exactfield')
+
+        # the elements of a Mesh read from file are the source cells
+        regrid = ESMF.IncrementalRegrid(srcfield, dstfield)
+        self.assertEqual(regrid.unmapped, 0)
+        dstfield = regrid(srcfield, dstfield)
+        esmf_regrid = ESMF.Regrid(srcfield, exactfield,
+                                  regrid_method=ESMF.RegridMethod.BILINEAR,
+                                  unmapped_action=ESMF.UnmappedAction.ERROR)
+        exactfield = esmf_regrid(srcfield, exactfield)
+        self.assertTrue(np.abs(dstfield.data - exactfield.data).max() < 5e-2)
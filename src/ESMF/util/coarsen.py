@@ -0,0 +1,111 @@
+# $Id$
+
+"""
+block coarsening
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+#### BLOCK COARSENING #########################################################
+
+def block_sum(array, lower, factor):
+    """
+    Sum the values of the local part of a distributed array over blocks of
+    ``factor`` global indices.  Blocks which are only partially local are
+    summed over their local part, so the partial sums of all PETs add up to
+    the sums over the whole blocks.
+
+    :param array: a numpy array, the last ``len(factor)`` dimensions of which
+        are the distributed dimensions.
+    :param list lower: the global index of the first local value along each
+        distributed dimension.
+    :param list factor: the number of indices of a block along each
+        distributed dimension.
+    :return: a tuple of the global index of the first block along each
+        distributed dimension and a numpy array of the block sums.
+    """
+    array = np.asarray(array)
+    rank = len(factor)
+    lead = array.ndim - rank
+
+    # pad the array to whole blocks
+    pad = [(0, 0)] * lead
+    start = []
+    for dim, (lb, f) in enumerate(zip(lower, factor)):
+        before = int(lb) % f
+        after = -(before + array.shape[lead + dim]) % f
+        pad.append((before, after))
+        start.append(int(lb) // f)
+    if any(p != (0, 0) for p in pad[lead:]):
+        array = np.pad(array, pad, mode='constant')
+
+    shape = array.shape[:lead]
+    for dim, f in enumerate(factor):
+        shape += (array.shape[lead + dim] // f, f)
+    axes = tuple(lead + 2 * dim + 1 for dim in range(rank))
+
+    return start, array.reshape(shape).sum(axis=axes)
+
+def add_blocks(parts, lower, upper):
+    """
+    Add the partial block sums of all PETs within the local bounds of a
+    distributed array of blocks.
+
+    :param list parts: a list of the ``(start, sums)`` tuples returned by
+        :func:`block_sum` on every PET.
+    :param list lower: the global index of the first local block along each
+        distributed dimension.
+    :param list upper: the global index after the last local block along each
+        distributed dimension.
+    :return: a numpy array of the sums over the local blocks.
+    """
+    rank = len(lower)
+    lead_shape = parts[0][1].shape[:-rank] if rank else parts[0][1].shape
+    ret = np.zeros(lead_shape + tuple(int(u) - int(l)
+                                      for l, u in zip(lower, upper)),
+                   dtype=np.float64)
+
+    for start, sums in parts:
+        src = []
+        dst = []
+        for dim in range(rank):
+            lo = max(start[dim], lower[dim])
+            hi = min(start[dim] + sums.shape[sums.ndim - rank + dim],
+                     upper[dim])
+            if hi <= lo:
+                break
+            src.append(slice(lo - start[dim], hi - start[dim]))
+            dst.append(slice(lo - lower[dim], hi - lower[dim]))
+        else:
+            ret[(Ellipsis,) + tuple(dst)] += sums[(Ellipsis,) + tuple(src)]
+
+    return ret
+
+def coarsen_vector(vector, factor, faces, period=None):
+    """
+    Coarsen a 1D coordinate vector of a rectilinear grid by an integer
+    factor.
+
+    :param vector: a numpy array of the coordinates along a dimension.
+    :param int factor: the number of cells merged into one coarse cell.
+    :param bool faces: ``True`` if the coordinates are on the cell faces
+        along the dimension, every ``factor``-th face is then kept, otherwise
+        the coordinates are averaged over every ``factor`` cells.
+    :param float period: the period of longitudes, which are averaged
+        relative to the first cell of every coarse cell so that coarse cells
+        across the dateline are placed correctly.
+    :return: a numpy array of the coarse coordinates.
+    """
+    vector = np.asarray(vector, dtype=np.float64)
+    if faces:
+        return vector[::factor].copy()
+
+    blocks = vector.reshape(-1, factor)
+    if period is None:
+        return blocks.mean(axis=1)
+
+    first = blocks[:, :1]
+    offset = np.mod(blocks - first + period / 2., period) - period / 2.
+    return first[:, 0] + offset.mean(axis=1)
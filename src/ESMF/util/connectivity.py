@@ -0,0 +1,298 @@
+# $Id$
+
+"""
+connectivity
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import itertools
+import numpy as np
+
+from ESMF.api.constants import CoordSys, MeshElemType
+from ESMF.util.partition import cartesian_coords
+from ESMF.util.topology import element_edges
+
+#### CONNECTIVITY #############################################################
+
+def stack_coords(coords):
+    """
+    Stack coordinates into an array with one row per location.
+
+    :param coords: a numpy array of shape ``(n, dims)``, or a list of numpy
+        arrays of ``n`` coordinates, one for each coordinate dimension.
+    :return: a numpy array of float64 of shape ``(n, dims)``.
+    """
+    if isinstance(coords, (list, tuple)):
+        coords = np.stack([np.asarray(c, dtype=np.float64).reshape(-1)
+                           for c in coords], axis=1)
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.ndim != 2:
+        raise ValueError("coordinates must be of shape (n, dims)")
+
+    return coords
+
+def faces_to_csr(faces, fill_value=None):
+    """
+    Convert the connectivity of elements to compressed sparse row (CSR)
+    form.
+
+    :param faces: either a numpy array of shape ``(nelem, maxnodes)`` of the
+        nodes of every element, padded with ``fill_value`` (or masked in a
+        numpy masked array) for elements with fewer nodes, or a tuple of a
+        numpy array of ``nelem + 1`` offsets and a numpy array of the nodes of
+        all elements.
+    :param fill_value: the value of the padding entries.  If ``None``,
+        negative entries are padding.
+    :return: a tuple of a numpy array of ``nelem + 1`` int64 offsets and a
+        numpy array of the nodes of all elements.
+    """
+    if isinstance(faces, tuple):
+        offsets, entries = faces
+        offsets = np.asarray(offsets, dtype=np.int64).reshape(-1)
+        entries = np.asarray(entries).reshape(-1)
+        if offsets.size == 0 or offsets[0] != 0 or \
+                offsets[-1] != entries.size or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must increase from 0 to the number of "
+                             "connectivity entries")
+        return offsets, entries
+
+    if np.ndim(faces) != 2:
+        raise ValueError("padded faces must be of shape (nelem, maxnodes)")
+    valid = ~np.ma.getmaskarray(faces)
+    data = np.ma.getdata(faces)
+    if fill_value is None:
+        valid &= (data >= 0)
+    else:
+        valid &= (data != fill_value)
+
+    offsets = np.zeros(data.shape[0] + 1, dtype=np.int64)
+    np.cumsum(valid.sum(axis=1), out=offsets[1:])
+
+    return offsets, data[valid]
+
+def sort_ids(ids):
+    """
+    Sort an array of unique ids for :func:`remap_ids`.
+
+    :param ids: a numpy array of unique ids.
+    :return: a tuple of the sorted ids and the indices which sort ``ids``.
+    """
+    ids = np.asarray(ids).reshape(-1)
+    order = np.argsort(ids, kind='mergesort')
+    sorted_ids = ids[order]
+    if np.any(sorted_ids[1:] == sorted_ids[:-1]):
+        raise ValueError("ids must be unique")
+
+    return sorted_ids, order
+
+def remap_ids(ids, values, lookup=None):
+    """
+    Find the indices of values in an array of unique ids, by sorting the ids
+    once and searching all values at once.
+
+    :param ids: a numpy array of unique ids.
+    :param values: a numpy array of ids to look up.
+    :param lookup: the result of :func:`sort_ids` for ``ids``, to look up
+        several arrays of values without sorting the ids again.
+    :return: a numpy array of the shape of ``values`` of the indices into
+        ``ids``.
+    """
+    if lookup is None:
+        lookup = sort_ids(ids)
+    sorted_ids, order = lookup
+    values = np.asarray(values)
+    if sorted_ids.size == 0:
+        if values.size:
+            raise ValueError("ids are looked up in an empty array")
+        return np.zeros(values.shape, dtype=np.int64)
+
+    pos = np.minimum(np.searchsorted(sorted_ids, values), sorted_ids.size - 1)
+    missing = (sorted_ids[pos] != values)
+    if np.any(missing):
+        raise ValueError("{0} entries refer to unknown ids, e.g. {1}".format(
+                         int(missing.sum()), values[missing].flat[0]))
+
+    return order[pos]
+
+def element_types(nodes, parametric_dim):
+    """
+    Get the :attr:`~ESMF.api.constants.MeshElemType` of elements from their
+    numbers of nodes.
+
+    :param nodes: a numpy array of the number of nodes of every element.
+    :param int parametric_dim: the parametric dimension of the mesh, the
+        polygons of 2D meshes have the type of their number of nodes, 3D
+        elements are tetrahedra or hexahedra.
+    :return: a numpy array of int32 element types.
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    if parametric_dim == 3:
+        types = np.where(nodes == 4, MeshElemType.TETRA,
+                         np.where(nodes == 8, MeshElemType.HEX, -1))
+        if np.any(types < 0):
+            raise ValueError("3D elements must have 4 or 8 nodes")
+    else:
+        if np.any(nodes < 3):
+            raise ValueError("2D elements must have at least 3 nodes")
+        types = nodes
+
+    return types.astype(np.int32)
+
+def structured_elements(shape, lower, upper, periodic):
+    """
+    Get the nodes of the elements of a block of a logically rectangular grid
+    of nodes.  Nodes and elements are numbered in Fortran order across the
+    whole grid, and the element of the nodes ``i`` to ``i + 1`` along every
+    dimension is held with node ``i``.
+
+    :param shape: the global number of nodes along every dimension.
+    :param lower: the lower bounds of the block of nodes.
+    :param upper: the upper bounds of the block of nodes.
+    :param periodic: a bool for every dimension, ``True`` if the nodes wrap
+        around along the dimension.
+    :return: a tuple of a numpy array of the global indices of the elements
+        held with the block, and a numpy array of shape ``(elements,
+        2**rank)`` of the global indices of their nodes in
+        **COUNTERCLOCKWISE** order (the bottom face first in 3D).
+    """
+    rank = len(shape)
+    if rank not in (2, 3):
+        raise ValueError("only 2D and 3D grids of nodes are supported")
+
+    first = []
+    second = []
+    element_shape = []
+    for n, l, u, p in zip(shape, lower, upper, periodic):
+        index = np.arange(l, u if p else min(u, n - 1), dtype=np.int64)
+        first.append(index)
+        second.append((index + 1) % n)
+        element_shape.append(n if p else n - 1)
+
+    def flat(indices, shape):
+        strides = np.cumprod([1] + list(shape[:-1]), dtype=np.int64)
+        return sum(i * s for i, s in
+                   zip(np.ix_(*indices), strides)).ravel(order='F')
+
+    # counterclockwise in index space, repeated on the top face in 3D
+    square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    vertices = [v + (k,) for k in range(rank - 1) for v in square] \
+        if rank == 3 else square
+    nodes = np.stack([flat([second[d] if v[d] else first[d]
+                            for d in range(rank)], shape)
+                      for v in vertices], axis=1)
+
+    return flat(first, element_shape), nodes
+
+def _cell_keys_(cells):
+    # hash the integer lattice cells of the rows into 64 bit keys, keys of
+    # different cells may collide
+    keys = np.zeros(cells.shape[0], dtype=np.uint64)
+    for column in cells.T:
+        keys = (keys ^ column.astype(np.uint64)) * np.uint64(0x100000001b3)
+
+    return keys
+
+def _close_pairs_(coords, tolerance):
+    # find all pairs of points closer than tolerance: the lattice cells of
+    # spacing tolerance are hashed, and every point is compared with the
+    # points of its own and of the neighbouring cells
+    n, dims = coords.shape
+    cells = np.floor(coords / tolerance)
+    if cells.size and np.abs(cells).max() >= 2 ** 62:
+        raise ValueError("the weld tolerance is too small for the "
+                         "coordinates")
+    cells = cells.astype(np.int64)
+    keys = _cell_keys_(cells)
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+
+    first, second = [], []
+    for offset in itertools.product((0, 1, -1), repeat=dims):
+        # every pair of neighbouring cells is visited from one side only
+        nonzero = [o for o in offset if o != 0]
+        if nonzero and nonzero[0] < 0:
+            continue
+        query = _cell_keys_(cells + np.array(offset, dtype=np.int64))
+        lo = np.searchsorted(keys, query, side='left')
+        counts = np.searchsorted(keys, query, side='right') - lo
+
+        a = np.repeat(np.arange(n), counts)
+        start = np.zeros(n, dtype=np.int64)
+        start[1:] = np.cumsum(counts)[:-1]
+        b = order[lo[a] + np.arange(a.size) - start[a]]
+
+        # drop hash collisions and points which are too far apart
+        delta = coords[a] - coords[b]
+        keep = np.all(cells[b] - cells[a] == offset, axis=1) & \
+            (np.einsum('nd,nd->n', delta, delta) <= tolerance ** 2)
+        if not nonzero:
+            keep &= (a < b)
+        first.append(a[keep])
+        second.append(b[keep])
+
+    return np.concatenate(first), np.concatenate(second)
+
+def weld_nodes(coords, tolerance, coord_sys=None):
+    """
+    Find coincident nodes: nodes closer than ``tolerance`` are coincident,
+    and so are nodes connected by a chain of coincident nodes.  The close
+    pairs of nodes are found by hashing the cells of a lattice of spacing
+    ``tolerance`` and comparing the nodes of neighbouring cells, so nodes on
+    both sides of a cell boundary are merged, and all nodes are compared at
+    once.  Spherical coordinates are compared on the unit sphere, so that
+    nodes across the periodic boundary and at the poles coincide.
+
+    :param coords: a numpy array of shape ``(n, dims)`` of node coordinates.
+    :param float tolerance: the largest distance of coincident nodes, in the
+        units of the coordinates.
+    :param CoordSys coord_sys: the coordinate system of ``coords``.  If
+        ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :return: a tuple of a numpy array of the indices of the nodes which are
+        kept, the first of every set of coincident nodes in their original
+        order, and a numpy array of the position in the kept nodes of every
+        node.
+    """
+    if tolerance <= 0:
+        raise ValueError("the weld tolerance must be positive")
+    coords = np.asarray(coords, dtype=np.float64)
+    if coord_sys != CoordSys.CART:
+        # the chord length of the tolerance on the unit sphere
+        if coord_sys != CoordSys.SPH_RAD:
+            tolerance = np.radians(tolerance)
+        coords = cartesian_coords(coords[:, :2], coord_sys)
+
+    # label every set of coincident nodes with its first node, by
+    # propagating the smallest label over the pairs and pointer jumping
+    a, b = _close_pairs_(coords, tolerance)
+    labels = np.arange(coords.shape[0])
+    while a.size:
+        update = labels.copy()
+        np.minimum.at(update, a, labels[b])
+        np.minimum.at(update, b, labels[a])
+        update = update[update]
+        if np.array_equal(update, labels):
+            break
+        labels = update
+
+    kept = np.unique(labels)
+
+    return kept, np.searchsorted(kept, labels)
+
+def drop_repeated_nodes(offsets, conn):
+    """
+    Drop the nodes of elements which repeat the following node, e.g. after
+    coincident nodes were welded.
+
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the node indices of all elements.
+    :return: a tuple of the offsets and node indices of the elements.
+    """
+    edges, elements = element_edges(offsets, conn)
+    keep = edges[:, 0] != edges[:, 1]
+
+    ret = np.zeros(np.asarray(offsets).size, dtype=np.int64)
+    np.cumsum(np.bincount(elements[keep], minlength=ret.size - 1),
+              out=ret[1:])
+
+    return ret, np.asarray(conn)[keep]
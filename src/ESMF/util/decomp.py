@@ -0,0 +1,176 @@
+# $Id$
+
+"""
+decomposition planning
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+from collections import namedtuple
+import numpy as np
+
+from ESMF.api.constants import DecompFlag
+
+#### DECOMPOSITION ############################################################
+
+# the decomposition flags which divide a dimension into contiguous blocks,
+# the only ones ESMF supports when creating a Grid
+CONTIGUOUS_DECOMPFLAGS = (DecompFlag.BALANCED, DecompFlag.RESTFIRST,
+                          DecompFlag.RESTLAST)
+
+DecompPlan = namedtuple('DecompPlan', ['reg_decomp', 'decompflag', 'counts',
+                                       'imbalance'])
+DecompPlan.__doc__ = """
+A regular decomposition of a 2D grid over the PETs.
+
+:param list reg_decomp: the number of DEs along each dimension.
+:param decompflag: a numpy array of the
+    :attr:`~ESMF.api.constants.DecompFlag` of each dimension.
+:param counts: a numpy array of the shape ``reg_decomp`` with the number of
+    active cells of every DE, ``counts.ravel(order='F')`` is in the order of
+    the PETs.
+:param float imbalance: the largest number of active cells of a DE over the
+    mean number.
+"""
+
+def decomp_owners(n, parts, decompflag=DecompFlag.BALANCED):
+    """
+    Get the DE owning every index along a dimension of a regular
+    decomposition, following the rules of the ESMF decomposition flags.
+
+    :param int n: the number of indices along the dimension.
+    :param int parts: the number of DEs along the dimension.
+    :param DecompFlag decompflag: how the indices are divided over the DEs,
+        one of :data:`CONTIGUOUS_DECOMPFLAGS`.
+    :return: a numpy array of ``n`` DE indices.
+    """
+    if decompflag not in CONTIGUOUS_DECOMPFLAGS:
+        raise ValueError("only the BALANCED, RESTFIRST and RESTLAST "
+                         "decomposition flags divide a Grid into contiguous "
+                         "blocks")
+
+    base, rest = divmod(n, parts)
+    sizes = np.full(parts, base, dtype=np.int64)
+    if decompflag == DecompFlag.RESTFIRST:
+        sizes[0] += rest
+    elif decompflag == DecompFlag.RESTLAST:
+        sizes[-1] += rest
+    else:
+        sizes[:rest] += 1
+
+    return np.repeat(np.arange(parts), sizes)
+
+def _reduce_(values, owners, parts, axis):
+    # sum values along an axis over the indices owned by every DE
+    order = np.argsort(owners, kind='mergesort')
+    starts = np.searchsorted(owners[order], np.arange(parts))
+    ret = np.add.reduceat(np.take(values, order, axis=axis), starts,
+                          axis=axis)
+    # DEs without any index own nothing
+    empty = (np.bincount(owners, minlength=parts) == 0)
+    if np.any(empty):
+        index = [slice(None)] * values.ndim
+        index[axis] = empty
+        ret[tuple(index)] = 0
+
+    return ret
+
+def decomp_counts(max_index, reg_decomp, decompflag=None, mask=None):
+    """
+    Count the active cells of every DE of a regular decomposition of a 2D
+    grid.
+
+    :param list max_index: the number of cells along each dimension.
+    :param list reg_decomp: the number of DEs along each dimension.
+    :param decompflag: the :attr:`~ESMF.api.constants.DecompFlag` of each
+        dimension.  If ``None``, defaults to
+        :attr:`~ESMF.api.constants.DecompFlag.BALANCED`.
+    :param mask: a numpy array of shape ``max_index`` which is non zero for
+        the active cells.  If ``None``, all cells are active.
+    :return: a numpy array of shape ``reg_decomp`` of active cell counts.
+    """
+    max_index = [int(n) for n in max_index]
+    reg_decomp = [int(p) for p in reg_decomp]
+    if decompflag is None:
+        decompflag = [DecompFlag.BALANCED] * len(max_index)
+
+    if mask is None:
+        counts = np.ones(1, dtype=np.int64)
+        for n, parts, flag in zip(max_index, reg_decomp, decompflag):
+            sizes = np.bincount(decomp_owners(n, parts, flag),
+                                minlength=parts)
+            counts = np.multiply.outer(counts, sizes)
+        return counts.reshape(reg_decomp)
+
+    active = (np.asarray(mask) != 0).astype(np.int64)
+    if active.shape != tuple(max_index):
+        raise ValueError("mask of shape {0} does not match the grid of shape "
+                         "{1}".format(active.shape, tuple(max_index)))
+    for axis, (n, parts, flag) in enumerate(zip(max_index, reg_decomp,
+                                                decompflag)):
+        active = _reduce_(active, decomp_owners(n, parts, flag), parts, axis)
+
+    return active
+
+def plan_decomp(max_index, pets, mask=None, tolerance=0.05,
+                decompflags=CONTIGUOUS_DECOMPFLAGS):
+    """
+    Find a regular decomposition of a 2D grid which balances the active
+    cells over the PETs.  Every factorization of the number of PETs into two
+    DE counts and every combination of decomposition flags is evaluated, the
+    decompositions within ``tolerance`` of the best balance are then ranked by
+    the length of the cuts between the DEs, so square blocks are preferred,
+    and by the number of dimensions which are not evenly balanced.
+
+    :param list max_index: the number of cells along each dimension.
+    :param int pets: the number of PETs.
+    :param mask: a numpy array of shape ``max_index`` which is non zero for
+        the active cells.  If ``None``, all cells are active.
+    :param float tolerance: the relative imbalance traded for contiguity.
+    :param decompflags: the :attr:`~ESMF.api.constants.DecompFlag` values to
+        consider along each dimension, a subset of
+        :data:`CONTIGUOUS_DECOMPFLAGS`.
+    :return: a :class:`DecompPlan`.
+    """
+    max_index = [int(n) for n in max_index]
+    if len(max_index) != 2:
+        raise ValueError("decompositions can only be planned for 2D grids")
+    pets = int(pets)
+    if mask is not None:
+        mask = np.asarray(mask)
+    if any(flag not in CONTIGUOUS_DECOMPFLAGS for flag in decompflags):
+        raise ValueError("only the BALANCED, RESTFIRST and RESTLAST "
+                         "decomposition flags divide a Grid into contiguous "
+                         "blocks")
+
+    candidates = []
+    for p0 in range(1, pets + 1):
+        if pets % p0:
+            continue
+        reg_decomp = [p0, pets // p0]
+        if reg_decomp[0] > max_index[0] or reg_decomp[1] > max_index[1]:
+            continue
+        for f0 in decompflags:
+            for f1 in decompflags:
+                decompflag = np.array([f0, f1], dtype=np.int32)
+                counts = decomp_counts(max_index, reg_decomp, decompflag,
+                                       mask=mask)
+                mean = counts.mean()
+                imbalance = float(counts.max() / mean) if mean > 0 else 1.
+                uneven = int(f0 != DecompFlag.BALANCED) + \
+                    int(f1 != DecompFlag.BALANCED)
+                cuts = (reg_decomp[0] - 1) * max_index[1] + \
+                    (reg_decomp[1] - 1) * max_index[0]
+                candidates.append((imbalance, cuts, uneven,
+                                   DecompPlan(reg_decomp, decompflag, counts,
+                                              imbalance)))
+
+    if not candidates:
+        raise ValueError("the grid of shape {0} cannot be decomposed over {1} "
+                         "PETs".format(tuple(max_index), pets))
+
+    best = min(candidate[0] for candidate in candidates)
+    candidates = [c for c in candidates if c[0] <= best * (1. + tolerance)]
+    candidates.sort(key=lambda c: (c[1], c[2], c[0]))
+
+    return candidates[0][3]
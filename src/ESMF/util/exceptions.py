@@ -18,6 +18,10 @@ class NetCDFMissing(ESMPyException):
     """ESMF was not built with the NetCDF package."""
     pass
 
+class MPI4PyMissing(ESMPyException):
+    """mpi4py is required to run this method on more than one PET."""
+    pass
+
 class MethodNotImplemented(ESMPyException):
     """Raised when an unimplemented method is called."""
     pass
@@ -0,0 +1,94 @@
+# $Id$
+
+"""
+file cache
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import os
+import hashlib
+import warnings
+import numpy as np
+
+#### FILE CACHE ###############################################################
+
+# bump this when the layout of the cached arrays changes
+_CACHE_VERSION = 2
+
+def cache_path(filename, cache, options):
+    """
+    Get the path of the sidecar cache file of a grid or mesh file.
+
+    :param str filename: path to the grid or mesh file
+    :param cache: ``True`` to keep the cache next to the file, or the path of
+        a directory to keep the cache in
+    :param options: any (repr-able) options which change the object created
+        from the file, e.g. decomposition flags and the PET layout
+    :return: the path of the cache file, or ``None`` if the file does not
+        exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+
+    filename = os.path.abspath(filename)
+    key = repr((_CACHE_VERSION, filename, stat.st_mtime, stat.st_size,
+                options))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    if cache is True:
+        cachedir = os.path.join(os.path.dirname(filename), ".esmpy_cache")
+    else:
+        cachedir = cache
+
+    return os.path.join(cachedir, "{0}.{1}.npz".format(
+        os.path.basename(filename), digest))
+
+def read_cache(path):
+    """
+    Read the arrays of a cache file.
+
+    :param str path: the path of the cache file
+    :return: a dictionary of numpy arrays, or ``None`` if the cache file does
+        not exist or cannot be read
+    """
+    if path is None or not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return dict((key, npz[key]) for key in npz.files)
+    except Exception as err:
+        warnings.warn("could not read cache file {0}: {1}".format(path, err))
+        return None
+
+def write_cache(path, arrays):
+    """
+    Write arrays to a cache file, the file is written to a temporary name
+    first so concurrent readers never see a partial file.
+
+    :param str path: the path of the cache file
+    :param dict arrays: a dictionary of numpy arrays
+    """
+    if path is None:
+        return
+
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        cachedir = os.path.dirname(path)
+        if cachedir and not os.path.isdir(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except OSError:
+                # another process may have created it in the meantime
+                if not os.path.isdir(cachedir):
+                    raise
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.rename(tmp, path)
+    except (IOError, OSError) as err:
+        warnings.warn("could not write cache file {0}: {1}".format(path, err))
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,74 @@
+# $Id$
+
+"""
+fingerprint
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import hashlib
+import numpy as np
+
+#### FINGERPRINT ##############################################################
+
+# bytes hashed per update when an array has to be made contiguous
+_CHUNK_BYTES = 2**24
+
+def _new_hash_():
+    try:
+        return hashlib.blake2b(digest_size=20)
+    except AttributeError:
+        return hashlib.sha1()
+
+def _update_array_(h, arr):
+    arr = np.asanyarray(arr)
+    if isinstance(arr, np.ma.MaskedArray):
+        arr = arr.data
+    h.update(("%s%r" % (arr.dtype.str, arr.shape)).encode())
+    if arr.size == 0:
+        return
+
+    # arrays are hashed in Fortran order, the native layout of ESMF buffers,
+    # so the digest does not depend on the memory layout of the values
+    arrt = arr.T
+    if arrt.flags.c_contiguous:
+        h.update(memoryview(arrt.reshape(-1)).cast('B'))
+    # otherwise copy the array in bounded chunks along the last dimension
+    else:
+        arrt = arrt.reshape((arrt.shape[0], -1))
+        rows = max(1, _CHUNK_BYTES // max(1, arrt.itemsize * arrt.shape[1]))
+        for start in range(0, arrt.shape[0], rows):
+            chunk = np.ascontiguousarray(arrt[start:start + rows])
+            h.update(memoryview(chunk.reshape(-1)).cast('B'))
+
+def fingerprint(*items):
+    """
+    Compute a digest of a sequence of items with a streaming hash.
+
+    :param items: numpy arrays, scalars, strings, ``None`` or (nested) lists
+        and tuples of these.  Arrays are hashed from their buffers without
+        copying wherever the memory layout allows, together with their
+        dtype and shape.
+    :return: A hexadecimal digest string.
+    """
+    h = _new_hash_()
+
+    def _update_(item):
+        if item is None:
+            h.update(b'N')
+        elif isinstance(item, np.ndarray):
+            h.update(b'A')
+            _update_array_(h, item)
+        elif isinstance(item, (list, tuple)):
+            h.update(("L%d" % len(item)).encode())
+            for it in item:
+                _update_(it)
+        else:
+            if isinstance(item, np.generic):
+                item = item.item()
+            h.update(("S%r" % (item,)).encode())
+
+    for item in items:
+        _update_(item)
+
+    return h.hexdigest()
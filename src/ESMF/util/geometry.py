@@ -0,0 +1,157 @@
+# $Id$
+
+"""
+geometry
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+from ESMF.api.constants import CoordSys
+
+#### POLYGON GEOMETRY #########################################################
+
+# number of polygons processed at once, this bounds the temporary memory
+_CHUNK_SIZE = 65536
+
+def _dot_(a, b):
+    return np.einsum('...d,...d->...', a, b)
+
+def _vectors_(coords, coord_sys):
+    # convert a list of coordinate arrays of shape (n, k) into an array of
+    # shape (n, k, 3) of points in 3D, unit vectors for spherical coordinates
+    if coord_sys == CoordSys.CART:
+        vec = np.zeros(coords[0].shape + (3,), dtype=np.float64)
+        for xyz, coord in enumerate(coords[:3]):
+            vec[..., xyz] = coord
+        return vec
+
+    lon = np.asarray(coords[0], dtype=np.float64)
+    lat = np.asarray(coords[1], dtype=np.float64)
+    if coord_sys == CoordSys.SPH_DEG:
+        lon = np.radians(lon)
+        lat = np.radians(lat)
+    coslat = np.cos(lat)
+    return np.stack((coslat * np.cos(lon), coslat * np.sin(lon),
+                     np.sin(lat)), axis=-1)
+
+def _triangles_(vec, coord_sys):
+    # fan triangulate every polygon from its first vertex and return the
+    # signed area and (unnormalized) centroid of every triangle
+    a = vec[:, :1, :]
+    b = vec[:, 1:-1, :]
+    c = vec[:, 2:, :]
+    centroid = a + b + c
+
+    if coord_sys == CoordSys.CART:
+        cross = 0.5 * np.cross(b - a, c - a)
+        # orient the triangles with the normal of the whole polygon
+        normal = cross.sum(axis=1, keepdims=True)
+        norm = np.sqrt(_dot_(normal, normal))
+        norm[norm == 0] = 1.
+        area = _dot_(cross, normal / norm[..., np.newaxis])
+        centroid = centroid / 3.
+    else:
+        # spherical excess of the triangle on the unit sphere (Eriksson)
+        num = _dot_(a, np.cross(b, c))
+        den = 1. + _dot_(a, b) + _dot_(b, c) + _dot_(c, a)
+        area = 2. * np.arctan2(num, den)
+
+    return area, centroid
+
+def _polygons_(coords, coord_sys, chunk_size, centroids):
+    coord_sys = CoordSys.SPH_DEG if coord_sys is None else coord_sys
+    coords = [np.asarray(coord) for coord in coords]
+    shape = coords[0].shape
+    if len(shape) != 2 or shape[1] < 3:
+        raise ValueError("polygon coordinates must be of shape (n, k) with "
+                         "k >= 3 vertices")
+    if chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+
+    n = shape[0]
+    areas = np.zeros(n, dtype=np.float64)
+    if centroids:
+        out = [np.zeros(n, dtype=np.float64) for _ in coords]
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        vec = _vectors_([coord[start:stop] for coord in coords], coord_sys)
+        tri_area, tri_centroid = _triangles_(vec, coord_sys)
+        area = tri_area.sum(axis=1)
+        areas[start:stop] = np.abs(area)
+
+        if not centroids:
+            continue
+
+        if coord_sys != CoordSys.CART:
+            norm = np.sqrt(_dot_(tri_centroid, tri_centroid))
+            norm[norm == 0] = 1.
+            tri_centroid = tri_centroid / norm[..., np.newaxis]
+        center = np.einsum('nt,ntd->nd', tri_area, tri_centroid)
+        weight = area
+        # degenerate polygons fall back to the mean of their vertices
+        degenerate = (weight == 0)
+        if np.any(degenerate):
+            center[degenerate] = vec[degenerate].mean(axis=1)
+            weight = np.where(degenerate, 1., weight)
+        center = center / weight[:, np.newaxis]
+
+        if coord_sys == CoordSys.CART:
+            for xyz in range(len(coords)):
+                out[xyz][start:stop] = center[:, xyz]
+        else:
+            lon = np.arctan2(center[:, 1], center[:, 0])
+            lat = np.arctan2(center[:, 2],
+                             np.sqrt(center[:, 0]**2 + center[:, 1]**2))
+            if coord_sys == CoordSys.SPH_DEG:
+                lon = np.degrees(lon)
+                lat = np.degrees(lat)
+            # keep longitudes within half a period of the first vertex
+            period = 360. if coord_sys == CoordSys.SPH_DEG else 2. * np.pi
+            lon0 = coords[0][start:stop, 0]
+            lon = lon0 + np.mod(lon - lon0 + period / 2., period) - period / 2.
+            out[0][start:stop] = lon
+            out[1][start:stop] = lat
+            for xyz in range(2, len(coords)):
+                out[xyz][start:stop] = coords[xyz][start:stop].mean(axis=1)
+
+    if centroids:
+        return out
+    return areas
+
+def polygon_areas(coords, coord_sys=None, chunk_size=None):
+    """
+    Compute the areas of polygons from the coordinates of their vertices.
+    Spherical polygons are bounded by great circle arcs and their areas are
+    given on the unit sphere, cartesian polygons are planar.
+
+    :param list coords: a list of numpy arrays of shape ``(n, k)``, one for
+        each coordinate dimension, holding the ``k`` vertices of ``n``
+        polygons in order around the polygon. Polygons with fewer vertices
+        repeat their last vertex.
+    :param CoordSys coord_sys: the coordinate system of the vertices.
+        If ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :param int chunk_size: the number of polygons processed at once.
+    :return: a numpy array of ``n`` areas
+    """
+    return _polygons_(coords, coord_sys, chunk_size, False)
+
+def polygon_centroids(coords, coord_sys=None, chunk_size=None):
+    """
+    Compute the centroids of polygons from the coordinates of their
+    vertices, as the area weighted mean of the centroids of a triangulation
+    of each polygon.  Spherical centroids are projected back onto the sphere.
+
+    :param list coords: a list of numpy arrays of shape ``(n, k)``, one for
+        each coordinate dimension, holding the ``k`` vertices of ``n``
+        polygons in order around the polygon. Polygons with fewer vertices
+        repeat their last vertex.
+    :param CoordSys coord_sys: the coordinate system of the vertices.
+        If ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :param int chunk_size: the number of polygons processed at once.
+    :return: a list of numpy arrays of ``n`` centroid coordinates, one for
+        each coordinate dimension
+    """
+    return _polygons_(coords, coord_sys, chunk_size, True)
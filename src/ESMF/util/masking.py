@@ -0,0 +1,44 @@
+# $Id$
+
+"""
+masking
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+#### MASKING ##################################################################
+
+def masked_cells(values, rank, missing_value=None, nan=True, predicate=None):
+    """
+    Find the masked cells of data values in a single vectorized pass.  A cell
+    is masked if any of its values, along leading (e.g. ungridded)
+    dimensions, is masked.
+
+    :param values: a numpy array, or a numpy masked array whose masked
+        values are masked cells, the last ``rank`` dimensions of which are the
+        cell dimensions.
+    :param int rank: the number of cell dimensions.
+    :param missing_value: a value, or a list of values, which mark masked
+        cells.
+    :param bool nan: ``True`` to mask the cells with NaN values.
+    :param predicate: a function of the values which returns a boolean numpy
+        array that is ``True`` for masked cells.
+    :return: a boolean numpy array of the shape of the last ``rank``
+        dimensions of ``values``, ``True`` for masked cells.
+    """
+    masked = np.ma.getmaskarray(values)
+    data = np.ma.getdata(values)
+
+    if nan and np.issubdtype(data.dtype, np.inexact):
+        masked = masked | np.isnan(data)
+    if missing_value is not None:
+        masked = masked | np.isin(data, missing_value)
+    if predicate is not None:
+        masked = masked | np.asarray(predicate(data), dtype=bool)
+
+    if masked.ndim > rank:
+        masked = np.any(masked, axis=tuple(range(masked.ndim - rank)))
+
+    return masked
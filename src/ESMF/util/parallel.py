@@ -0,0 +1,45 @@
+# $Id$
+
+"""
+parallel
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+from ESMF.api.esmpymanager import pet_count
+from ESMF.util.exceptions import MPI4PyMissing
+
+#### PARALLEL #################################################################
+
+def require_mpi4py(method):
+    """
+    Check that mpi4py is available to the methods which gather objects across
+    PETs, before any PET enters a collective operation.  mpi4py is only
+    required when running on more than one PET.
+
+    :param str method: the name of the method, used in the error message
+    :raises MPI4PyMissing: if mpi4py cannot be imported on more than one PET
+    """
+    if pet_count() == 1:
+        return
+
+    try:
+        import mpi4py
+    except ImportError:
+        raise MPI4PyMissing("mpi4py is required to run {0} on more than one "
+                            "PET".format(method))
+
+def allgather(obj):
+    """
+    Gather a (picklable) object from every PET on every PET.  mpi4py is only
+    required when running on more than one PET.
+
+    :param obj: the object of the local PET
+    :return: a list of the objects of all PETs, in the order of the PETs
+    """
+    if pet_count() == 1:
+        return [obj]
+
+    require_mpi4py("allgather")
+    from mpi4py import MPI
+    return MPI.COMM_WORLD.allgather(obj)
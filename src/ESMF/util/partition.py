@@ -0,0 +1,233 @@
+# $Id$
+
+"""
+mesh partitioning
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+from collections import namedtuple
+import numpy as np
+
+from ESMF.api.constants import CoordSys
+
+#### PARTITIONING #############################################################
+
+PartitionPlan = namedtuple('PartitionPlan', ['element_owners', 'node_owners',
+                                             'counts', 'imbalance'])
+PartitionPlan.__doc__ = """
+A partition of the elements and nodes of a mesh over the PETs.
+
+:param element_owners: a numpy array of the PET owning every element.
+:param node_owners: a numpy array of the PET owning every node, the lowest
+    PET of the elements of the node.
+:param counts: a numpy array of the number of elements of every PET.
+:param float imbalance: the largest number of elements of a PET over the
+    mean number.
+"""
+
+def _transpose_bits_(axes, bits):
+    # interleave the bits of the coordinates, most significant bit first
+    keys = np.zeros(axes.shape[1], dtype=np.uint64)
+    for bit in range(bits - 1, -1, -1):
+        for axis in axes:
+            keys = (keys << np.uint64(1)) | ((axis >> np.uint64(bit)) &
+                                             np.uint64(1))
+
+    return keys
+
+def _hilbert_transpose_(axes, bits):
+    # the transposed Hilbert index of integer coordinates (J. Skilling,
+    # Programming the Hilbert curve, AIP Conf. Proc. 707, 2004), computed for
+    # all points at once
+    axes = axes.copy()
+    ndims = axes.shape[0]
+    top = np.uint64(1 << (bits - 1))
+
+    q = top
+    while q > 1:
+        p = q - np.uint64(1)
+        for i in range(ndims):
+            high = (axes[i] & q) != 0
+            axes[0] = np.where(high, axes[0] ^ p, axes[0])
+            t = np.where(high, np.uint64(0), (axes[0] ^ axes[i]) & p)
+            axes[0] ^= t
+            axes[i] ^= t
+        q >>= np.uint64(1)
+
+    # Gray encode
+    for i in range(1, ndims):
+        axes[i] ^= axes[i - 1]
+    t = np.zeros(axes.shape[1], dtype=np.uint64)
+    q = top
+    while q > 1:
+        t = np.where((axes[ndims - 1] & q) != 0, t ^ (q - np.uint64(1)), t)
+        q >>= np.uint64(1)
+    axes ^= t
+
+    return axes
+
+def curve_keys(coords, curve='hilbert', bits=None):
+    """
+    Get the positions of points along a space filling curve through the
+    bounding box of the points.
+
+    :param coords: a numpy array of shape ``(n, dims)`` of point coordinates.
+    :param str curve: ``'hilbert'`` or ``'morton'``.
+    :param int bits: the number of bits of every quantized coordinate.  If
+        ``None``, defaults to the most that fit into a 64 bit key.
+    :return: a numpy array of ``n`` uint64 keys.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.ndim != 2:
+        raise ValueError("coordinates must be of shape (n, dims)")
+    ndims = coords.shape[1]
+    if bits is None:
+        bits = min(63 // ndims, 32)
+    if bits * ndims > 64:
+        raise ValueError("keys of {0} bits per dimension do not fit into 64 "
+                         "bits".format(bits))
+
+    lower = coords.min(axis=0) if coords.size else np.zeros(ndims)
+    extent = (coords.max(axis=0) - lower) if coords.size else np.ones(ndims)
+    extent[extent == 0] = 1.
+    scale = float((1 << bits) - 1)
+    axes = np.floor((coords - lower) / extent * scale).astype(np.uint64).T
+
+    if curve == 'hilbert':
+        axes = _hilbert_transpose_(axes, bits)
+    elif curve != 'morton':
+        raise ValueError("curve must be 'hilbert' or 'morton'")
+
+    return _transpose_bits_(axes, bits)
+
+def cartesian_coords(coords, coord_sys=None):
+    """
+    Get Cartesian coordinates of points on the unit sphere from spherical
+    coordinates, so that points across the periodic boundary and around the
+    poles are close.
+
+    :param coords: a numpy array of shape ``(n, dims)`` of point coordinates.
+    :param CoordSys coord_sys: the coordinate system of ``coords``.  If
+        ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :return: a numpy array of shape ``(n, 3)``, or ``coords`` in Cartesian
+        coordinates.
+    """
+    if coord_sys == CoordSys.CART:
+        return np.asarray(coords, dtype=np.float64)
+
+    coords = np.asarray(coords, dtype=np.float64)
+    if coord_sys == CoordSys.SPH_RAD:
+        lon, lat = coords[:, 0], coords[:, 1]
+    else:
+        lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+
+    return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon),
+                     np.sin(lat)), axis=1)
+
+def curve_order(coords, coord_sys=None, curve='hilbert'):
+    """
+    Get the order of points along a space filling curve, so that points which
+    are close in the order are close in space.
+
+    :param coords: a numpy array of shape ``(n, dims)`` of point coordinates.
+    :param CoordSys coord_sys: the coordinate system of ``coords``.  If
+        ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :param str curve: ``'hilbert'`` or ``'morton'``.
+    :return: a numpy array of the indices of the points along the curve.
+    """
+    keys = curve_keys(cartesian_coords(coords, coord_sys), curve=curve)
+
+    return np.argsort(keys, kind='mergesort')
+
+def plan_partition(node_coords, offsets, conn, pets, curve='hilbert',
+                   coord_sys=None, weights=None):
+    """
+    Partition the elements of a mesh over the PETs by cutting a space filling
+    curve through the element centroids into pieces of balanced weight.
+    Every node is owned by the lowest PET of its elements.
+
+    :param node_coords: a numpy array of shape ``(nodes, dims)`` of node
+        coordinates.
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements.
+    :param int pets: the number of PETs.
+    :param str curve: ``'hilbert'`` or ``'morton'``.
+    :param CoordSys coord_sys: the coordinate system of ``node_coords``.
+    :param weights: a numpy array of the weight of every element.  If
+        ``None``, all elements weigh the same.
+    :return: a :class:`PartitionPlan`.
+    """
+    pets = int(pets)
+    if pets < 1:
+        raise ValueError("there must be at least one PET")
+    offsets = np.asarray(offsets, dtype=np.int64)
+    conn = np.asarray(conn, dtype=np.int64)
+    points = cartesian_coords(node_coords, coord_sys)
+    element_count = offsets.size - 1
+    nodes = np.diff(offsets)
+
+    # the centroids of the elements along the curve
+    if element_count:
+        sums = np.add.reduceat(points[conn], offsets[:-1], axis=0)
+        order = np.argsort(curve_keys(sums / nodes[:, None], curve=curve),
+                           kind='mergesort')
+    else:
+        order = np.zeros(0, dtype=np.int64)
+
+    # cut the curve where the cumulative weight passes every PET's share
+    if weights is None:
+        weights = np.ones(element_count)
+    weights = np.asarray(weights, dtype=np.float64)[order]
+    total = weights.sum()
+    before = np.cumsum(weights) - weights
+    element_owners = np.empty(element_count, dtype=np.int32)
+    if total > 0:
+        element_owners[order] = np.minimum(before * pets // total, pets - 1)
+    else:
+        element_owners[order] = np.arange(element_count) * pets // \
+            max(element_count, 1)
+
+    node_owners = np.full(points.shape[0], pets, dtype=np.int32)
+    np.minimum.at(node_owners, conn, np.repeat(element_owners, nodes))
+    # nodes of no element are cut along the curve by themselves
+    unused = np.where(node_owners == pets)[0]
+    if unused.size:
+        rank = np.argsort(np.argsort(curve_keys(points[unused], curve=curve),
+                                     kind='mergesort'), kind='mergesort')
+        node_owners[unused] = rank * pets // unused.size
+
+    counts = np.bincount(element_owners, minlength=pets)
+    mean = counts.mean()
+    imbalance = float(counts.max() / mean) if mean > 0 else 1.
+
+    return PartitionPlan(element_owners, node_owners, counts, imbalance)
+
+def local_part(plan, pet, offsets, conn):
+    """
+    Select the part of a mesh partitioned by a :class:`PartitionPlan` which
+    is added on a PET: its elements, the nodes it owns and the nodes of its
+    elements owned by other PETs.
+
+    :param PartitionPlan plan: the partition of the mesh.
+    :param int pet: the PET.
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements.
+    :return: a tuple of the indices of the local nodes, the indices of the
+        local elements, and the offsets and 0 based local node indices of
+        the connectivity of the local elements.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    conn = np.asarray(conn)
+    elements = np.where(plan.element_owners == pet)[0]
+    nodes = np.diff(offsets)[elements]
+
+    local_offsets = np.zeros(elements.size + 1, dtype=np.int64)
+    np.cumsum(nodes, out=local_offsets[1:])
+    entries = conn[np.repeat(offsets[elements] - local_offsets[:-1], nodes) +
+                   np.arange(local_offsets[-1])]
+
+    node_index = np.union1d(entries, np.where(plan.node_owners == pet)[0])
+    local_conn = np.searchsorted(node_index, entries)
+
+    return node_index, elements, local_offsets, local_conn
@@ -49,6 +49,21 @@ def get_none_or_slice(target, slc):
         ret = target[slc]
     return ret
 
+def get_none_or_1d(target, dim):
+    """
+    Get none or the 1D vector along dim of a broadcast coordinate array
+    :param target: broadcast grid coordinates array
+    :param dim: the dimension which the coordinates vary along
+    :return:
+    """
+    if target is None:
+        ret = None
+    else:
+        slc = [0] * target.ndim
+        slc[dim] = slice(None)
+        ret = target[tuple(slc)]
+    return ret
+
 def get_none_or_ssslice(target, slc, stagger, rank):
     """
     Get none or stagger specific slice
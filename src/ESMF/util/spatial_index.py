@@ -0,0 +1,577 @@
+# $Id$
+
+"""
+spatial index
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+from ESMF.api.constants import CoordSys
+from ESMF.util.geometry import _dot_, _vectors_, _triangles_
+
+#### SPATIAL INDEX ############################################################
+
+# number of points located at once, this bounds the temporary memory
+_CHUNK_SIZE = 65536
+
+# relative tolerance of the point in cell tests
+_TOLERANCE = 1e-10
+
+# maximum number of Newton iterations of the inverse bilinear mapping
+_NEWTON_ITERATIONS = 12
+
+class SpatialIndex(object):
+    """
+    A bin grid over the cells of a grid or mesh, used to find the cells
+    containing a set of points.  Spherical cells are binned by the bounding
+    boxes of their unit vectors in 3D, so the index has no seam at the
+    dateline or singularity at the poles; cartesian cells are binned in the
+    plane.
+
+    :param list coords: a list of numpy arrays of shape ``(n, k)``, one for
+        each coordinate dimension, holding the ``k`` vertices of ``n`` cells
+        in order around the cell.  Cells with fewer vertices repeat their last
+        vertex.
+    :param CoordSys coord_sys: the coordinate system of the vertices.
+        If ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :param nverts: a numpy array with the number of vertices of each cell.
+        If ``None``, all cells have ``k`` vertices.
+    """
+
+    def __init__(self, coords, coord_sys=None, nverts=None):
+        coord_sys = CoordSys.SPH_DEG if coord_sys is None else coord_sys
+        coords = [np.asarray(coord) for coord in coords[:2]]
+        shape = coords[0].shape
+        if len(shape) != 2 or shape[1] < 3:
+            raise ValueError("cell coordinates must be of shape (n, k) with "
+                             "k >= 3 vertices")
+
+        self._coord_sys = coord_sys
+        self._vertices = _vectors_(coords, coord_sys)
+        if nverts is None:
+            nverts = np.full(shape[0], shape[1], dtype=np.int64)
+        self._nverts = np.asarray(nverts, dtype=np.int64)
+
+        # the orientation of every cell, to test the side of its edges
+        if coord_sys == CoordSys.CART:
+            vert = self._vertices
+            area = np.cross(vert[:, 1:-1, :] - vert[:, :1, :],
+                            vert[:, 2:, :] - vert[:, :1, :])[..., 2]
+        else:
+            area, _ = _triangles_(self._vertices, coord_sys)
+        self._orient = np.where(area.sum(axis=1) < 0, -1., 1.)
+
+        self._edge_normals_()
+        self._build_()
+
+    @property
+    def size(self):
+        """
+        :rtype: int
+        :return: The number of cells in the index.
+        """
+
+        return self._vertices.shape[0]
+
+    def _bounding_boxes_(self):
+        vert = self._vertices
+        if self._coord_sys == CoordSys.CART:
+            return vert.min(axis=1), vert.max(axis=1)
+
+        # points inside spherical cells are normalized convex combinations of
+        # the vertices, which are at least the cosine of the radius of the
+        # cap around the mean vertex from the origin, so the bounding box of
+        # the vertices is padded by the distance of the normalization
+        center = vert.mean(axis=1)
+        norm = np.sqrt(_dot_(center, center))
+        norm[norm == 0] = 1.
+        center = center / norm[:, np.newaxis]
+        cosr = np.clip(_dot_(vert, center[:, np.newaxis, :]).min(axis=1),
+                       0., 1.)
+        pad = (1. - cosr)[:, np.newaxis]
+        self._center = center
+
+        return vert.min(axis=1) - pad, vert.max(axis=1) + pad
+
+    def _build_(self):
+        lo, hi = self._bounding_boxes_()
+        extent = hi - lo
+        pad = _TOLERANCE * max(1., float(np.abs(extent).max()))
+        lo = lo - pad
+        hi = hi + pad
+        self._scale = extent.max(axis=1) ** 2 + _TOLERANCE
+
+        # bins of about half the size of a typical cell
+        self._lower = lo.min(axis=0)
+        upper = hi.max(axis=0)
+        width = 0.5 * float(np.median(extent.max(axis=1))) if lo.shape[0] else 1.
+        span = upper - self._lower
+        if width <= 0:
+            width = max(float(span.max()), 1.)
+        self._nbins = np.maximum(np.ceil(span / width), 1).astype(np.int64)
+        # cap the number of bins along each dimension
+        self._nbins = np.minimum(self._nbins, 2 ** 20)
+        self._width = np.where(span > 0, span / self._nbins, 1.)
+
+        ilo = self._bin_(lo)
+        ihi = self._bin_(hi)
+        nrange = ihi - ilo + 1
+        counts = nrange.prod(axis=1)
+
+        # every bin overlapped by the bounding box of every cell
+        cells = np.repeat(np.arange(counts.size, dtype=np.int64), counts)
+        offset = np.zeros(counts.size, dtype=np.int64)
+        offset[1:] = np.cumsum(counts)[:-1]
+        k = np.arange(cells.size, dtype=np.int64) - offset[cells]
+        nrange = nrange[cells]
+        ijk = ilo[cells] + np.stack((k % nrange[:, 0],
+                                     (k // nrange[:, 0]) % nrange[:, 1],
+                                     k // (nrange[:, 0] * nrange[:, 1])),
+                                    axis=-1)
+        bins = self._bin_id_(ijk)
+
+        order = np.argsort(bins, kind='mergesort')
+        self._bins = bins[order]
+        self._cells = cells[order]
+
+    def _bin_(self, vec):
+        ijk = np.floor((vec - self._lower) / self._width).astype(np.int64)
+        return np.clip(ijk, 0, self._nbins - 1)
+
+    def _bin_id_(self, ijk):
+        return ijk[:, 0] + self._nbins[0] * (ijk[:, 1] +
+                                             self._nbins[1] * ijk[:, 2])
+
+    def _edge_normals_(self):
+        # the inward normals of the edges of every cell, a point is inside a
+        # cell if its dot products with all of them are non negative.  In the
+        # plane the third component holds the offsets of the edge lines
+        vert = self._vertices
+        nxt = np.roll(vert, -1, axis=1)
+        if self._coord_sys == CoordSys.CART:
+            edge = nxt - vert
+            normals = np.stack((-edge[..., 1], edge[..., 0],
+                                edge[..., 1] * vert[..., 0] -
+                                edge[..., 0] * vert[..., 1]), axis=-1)
+        else:
+            normals = np.cross(vert, nxt)
+        normals *= self._orient[:, np.newaxis, np.newaxis]
+        self._normals = normals
+
+    def _inside_(self, cells, points):
+        # test if points are inside (or on the boundary of) cells
+        normals = self._normals[cells]
+        if self._coord_sys == CoordSys.CART:
+            side = np.einsum('nkd,nd->nk', normals[..., :2], points[:, :2]) + \
+                normals[..., 2]
+        else:
+            side = np.einsum('nkd,nd->nk', normals, points)
+        inside = np.all(side >= -_TOLERANCE * self._scale[cells, np.newaxis],
+                        axis=1)
+        if self._coord_sys != CoordSys.CART:
+            # exclude the antipodes of the cells
+            inside &= _dot_(self._center[cells], points) > 0
+
+        return inside
+
+    def _project_(self, cells, points):
+        # project the vertices of cells onto the plane tangent to the sphere
+        # at the points, great circle arcs project onto straight lines
+        vert = self._vertices[cells]
+        if self._coord_sys == CoordSys.CART:
+            return vert
+        den = _dot_(vert, points[:, np.newaxis, :])
+        den[den == 0] = _TOLERANCE
+
+        return vert / den[..., np.newaxis]
+
+    def _weights_(self, cells, points):
+        vert = self._project_(cells, points)
+        n, k = vert.shape[:2]
+        weights = np.zeros((n, k), dtype=np.float64)
+        rows = np.arange(n)
+
+        # bilinear weights of quadrilaterals, from the inverse of the
+        # bilinear mapping solved by Newton iterations
+        quad = (self._nverts[cells] == 4)
+        if np.any(quad):
+            p0, p1, p2, p3 = [vert[quad, i, :] for i in range(4)]
+            q = points[quad]
+            s = np.full(q.shape[0], 0.5)
+            t = np.full(q.shape[0], 0.5)
+            for _ in range(_NEWTON_ITERATIONS):
+                sc = s[:, np.newaxis]
+                tc = t[:, np.newaxis]
+                res = (1 - sc) * (1 - tc) * p0 + sc * (1 - tc) * p1 + \
+                    sc * tc * p2 + (1 - sc) * tc * p3 - q
+                ds = (1 - tc) * (p1 - p0) + tc * (p2 - p3)
+                dt = (1 - sc) * (p3 - p0) + sc * (p2 - p1)
+                a, b, c = _dot_(ds, ds), _dot_(ds, dt), _dot_(dt, dt)
+                rs, rt = _dot_(ds, res), _dot_(dt, res)
+                det = a * c - b * b
+                det[det == 0] = 1.
+                step_s = (c * rs - b * rt) / det
+                step_t = (a * rt - b * rs) / det
+                s = s - step_s
+                t = t - step_t
+                if max(np.abs(step_s).max(), np.abs(step_t).max()) < \
+                        _TOLERANCE:
+                    break
+            s = np.clip(s, 0., 1.)
+            t = np.clip(t, 0., 1.)
+            weights[quad, 0] = (1 - s) * (1 - t)
+            weights[quad, 1] = s * (1 - t)
+            weights[quad, 2] = s * t
+            weights[quad, 3] = (1 - s) * t
+
+        # barycentric weights of the triangle of a fan triangulation of the
+        # other cells which contains the point
+        other = ~quad
+        if np.any(other):
+            vert = vert[other]
+            q = points[other, np.newaxis, :]
+            a = vert[:, :1, :]
+            b = vert[:, 1:-1, :]
+            c = vert[:, 2:, :]
+            normal = np.cross(b - a, c - a)
+            nn = _dot_(normal, normal)
+            nn[nn == 0] = np.inf
+            wa = _dot_(np.cross(b - q, c - q), normal) / nn
+            wb = _dot_(np.cross(c - q, a - q), normal) / nn
+            wc = 1. - wa - wb
+            # the first non degenerate triangle with the point inside
+            fit = np.minimum(np.minimum(wa, wb), wc)
+            fit[np.isinf(nn)] = -np.inf
+            tri = np.argmax(fit, axis=1)
+            sub = np.arange(tri.size)
+            wa, wb, wc = wa[sub, tri], wb[sub, tri], wc[sub, tri]
+            idx = rows[other]
+            weights[idx, 0] += wa
+            weights[idx, tri + 1] += wb
+            weights[idx, tri + 2] += wc
+
+        return weights
+
+    def locate(self, lons, lats, chunk_size=None):
+        """
+        Find the cells containing a set of points.
+
+        :param lons: a numpy array of the longitudes (or ``x`` coordinates)
+            of the points, in the coordinate system of the cells.
+        :param lats: a numpy array of the latitudes (or ``y`` coordinates)
+            of the points.
+        :param int chunk_size: the number of points located at once.
+        :return: a tuple of a numpy array of the index of the cell containing
+            every point, ``-1`` for points outside all cells, and a numpy
+            array of shape ``(n, k)`` of the weights of the ``k`` vertices of
+            that cell at every point.  The weights are bilinear for cells with
+            four vertices and barycentric on a triangle of the cell otherwise,
+            they are zero for points outside all cells.  Points on the
+            boundary between cells are located in the first of them.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64),
+                                         np.asarray(lats, dtype=np.float64))
+        shape = lons.shape
+        points = _vectors_([lons.reshape(-1), lats.reshape(-1)],
+                           self._coord_sys)
+        if chunk_size is None:
+            chunk_size = _CHUNK_SIZE
+
+        n = points.shape[0]
+        k = self._vertices.shape[1]
+        found = np.full(n, -1, dtype=np.int64)
+        weights = np.zeros((n, k), dtype=np.float64)
+
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            pts = points[start:stop]
+
+            # candidate cells of the bin of every point inside the index
+            ijk = np.floor((pts - self._lower) /
+                           self._width).astype(np.int64)
+            valid = np.all((ijk >= 0) & (ijk < self._nbins), axis=1)
+            ijk = np.clip(ijk, 0, self._nbins - 1)
+            bins = self._bin_id_(ijk)
+            lo = np.searchsorted(self._bins, bins, side='left')
+            hi = np.searchsorted(self._bins, bins, side='right')
+            counts = np.where(valid, hi - lo, 0)
+
+            pair = np.repeat(np.arange(stop - start, dtype=np.int64), counts)
+            offset = np.zeros(counts.size, dtype=np.int64)
+            offset[1:] = np.cumsum(counts)[:-1]
+            cand = self._cells[lo[pair] + np.arange(pair.size) - offset[pair]]
+
+            inside = self._inside_(cand, pts[pair])
+            pair, cand = pair[inside], cand[inside]
+            # keep the first cell found for every point
+            pair, first = np.unique(pair, return_index=True)
+            cand = cand[first]
+
+            found[start + pair] = cand
+            if pair.size:
+                weights[start + pair] = self._weights_(cand, pts[pair])
+
+        return found.reshape(shape), weights.reshape(shape + (k,))
+
+    def relocate(self, cells, lons, lats, chunk_size=None):
+        """
+        Find the cells containing a set of points which moved.  Every point
+        is first tested against its previous cell, the weights of the points
+        which are still inside it are recomputed in that cell, and only the
+        other points are searched in the index.
+
+        :param cells: a numpy array of the index of the previous cell of
+            every point, ``-1`` for points without one.
+        :param lons: a numpy array of the new longitudes (or ``x``
+            coordinates) of the points, in the coordinate system of the
+            cells.
+        :param lats: a numpy array of the new latitudes (or ``y``
+            coordinates) of the points.
+        :param int chunk_size: the number of points located at once.
+        :return: a tuple of the cells and weights of the points as returned
+            by :meth:`locate`, and a boolean numpy array which is ``True``
+            for the points which were searched.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64),
+                                         np.asarray(lats, dtype=np.float64))
+        shape = lons.shape
+        lons, lats = lons.reshape(-1), lats.reshape(-1)
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1)
+        if cells.size != lons.size:
+            raise ValueError("there must be a previous cell for every point")
+        if chunk_size is None:
+            chunk_size = _CHUNK_SIZE
+
+        n = lons.size
+        k = self._vertices.shape[1]
+        found = np.full(n, -1, dtype=np.int64)
+        weights = np.zeros((n, k), dtype=np.float64)
+
+        # the points which stayed inside their previous cell
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            stay = np.where(cells[start:stop] >= 0)[0] + start
+            if stay.size == 0:
+                continue
+            pts = _vectors_([lons[stay], lats[stay]], self._coord_sys)
+            inside = self._inside_(cells[stay], pts)
+            stay, pts = stay[inside], pts[inside]
+            found[stay] = cells[stay]
+            weights[stay] = self._weights_(cells[stay], pts)
+
+        searched = (found < 0)
+        if np.any(searched):
+            found[searched], weights[searched] = \
+                self.locate(lons[searched], lats[searched],
+                            chunk_size=chunk_size)
+
+        return found.reshape(shape), weights.reshape(shape + (k,)), \
+            searched.reshape(shape)
+
+class PointIndex(object):
+    """
+    A bin grid over a set of points of a grid or mesh, used to find the point
+    closest to every point of another set.  Spherical points are binned as
+    unit vectors in 3D and compared by the length of the chord between them,
+    which orders them as their great circle distance, so the index has no
+    seam at the dateline or singularity at the poles.
+
+    :param list coords: a list of numpy arrays, one for each coordinate
+        dimension, of the coordinates of the points.
+    :param CoordSys coord_sys: the coordinate system of the points.
+        If ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    """
+
+    def __init__(self, coords, coord_sys=None):
+        coord_sys = CoordSys.SPH_DEG if coord_sys is None else coord_sys
+        coords = [np.ravel(np.asarray(coord, dtype=np.float64))
+                  for coord in coords[:2]]
+
+        self._coord_sys = coord_sys
+        self._points = _vectors_(coords, coord_sys)
+
+        n = self._points.shape[0]
+        if n:
+            self._lower = self._points.min(axis=0)
+            span = self._points.max(axis=0) - self._lower
+        else:
+            self._lower = np.zeros(3)
+            span = np.zeros(3)
+
+        # bins holding a few points each, for points spread over a surface
+        extent = np.sort(span)[::-1]
+        if extent[1] > 0:
+            width = 2. * np.sqrt(extent[0] * extent[1] / n)
+        else:
+            width = 2. * extent[0] / max(n, 1)
+        if width <= 0:
+            width = 1.
+        self._nbins = np.maximum(np.ceil(span / width), 1).astype(np.int64)
+        # cap the number of bins along each dimension
+        self._nbins = np.minimum(self._nbins, 2 ** 20)
+        self._width = np.where(span > 0, span / self._nbins, 1.)
+
+        ijk = np.clip(np.floor((self._points - self._lower) /
+                               self._width).astype(np.int64),
+                      0, self._nbins - 1)
+        bins = self._bin_id_(ijk)
+        order = np.argsort(bins, kind='mergesort')
+        self._bins = bins[order]
+        self._index = order
+
+    @property
+    def size(self):
+        """
+        :rtype: int
+        :return: The number of points in the index.
+        """
+
+        return self._points.shape[0]
+
+    def _bin_id_(self, ijk):
+        return ijk[..., 0] + self._nbins[0] * (ijk[..., 1] +
+                                               self._nbins[1] * ijk[..., 2])
+
+    def _shell_(self, ring):
+        # the offsets of the bins at a distance of ring bins, along the
+        # dimensions with more than one bin
+        ranges = [np.arange(-ring, ring + 1) if nbins > 1 else np.zeros(1)
+                  for nbins in self._nbins]
+        offsets = np.stack(np.meshgrid(*ranges, indexing='ij'),
+                           axis=-1).reshape(-1, 3).astype(np.int64)
+
+        return offsets[np.abs(offsets).max(axis=1) == ring]
+
+    def _bound_(self, points, ijk, ring):
+        # the distance from the points to the bins outside of the block of
+        # bins within ring bins of their own, infinite if there are none
+        lower = np.where(ijk - ring > 0,
+                         points - (self._lower + (ijk - ring) * self._width),
+                         np.inf)
+        upper = np.where(ijk + ring + 1 < self._nbins,
+                         self._lower + (ijk + ring + 1) * self._width - points,
+                         np.inf)
+
+        return np.minimum(lower, upper).min(axis=1)
+
+    def _search_(self, points):
+        # search rings of bins of growing size around every point until the
+        # second closest point found is closer than any bin left
+        m = points.shape[0]
+        ijk = np.clip(np.floor((points - self._lower) /
+                               self._width).astype(np.int64),
+                      0, self._nbins - 1)
+        best = np.full((m, 2), np.inf)
+        found = np.full(m, -1, dtype=np.int64)
+        active = np.arange(m, dtype=np.int64)
+
+        ring = 0
+        while active.size:
+            shell = self._shell_(ring)
+            a = active.size
+            nshell = max(shell.shape[0], 1)
+            block = ijk[active, np.newaxis, :] + shell[np.newaxis, :, :]
+            valid = np.all((block >= 0) & (block < self._nbins), axis=-1)
+            bins = self._bin_id_(block)
+            lo = np.searchsorted(self._bins, bins, side='left')
+            hi = np.searchsorted(self._bins, bins, side='right')
+            counts = np.where(valid, hi - lo, 0).reshape(-1)
+            lo = lo.reshape(-1)
+
+            slot = np.repeat(np.arange(counts.size, dtype=np.int64), counts)
+            offset = np.zeros(counts.size, dtype=np.int64)
+            offset[1:] = np.cumsum(counts)[:-1]
+            cand = self._index[lo[slot] + np.arange(slot.size) - offset[slot]]
+            pair = slot // nshell
+            delta = self._points[cand] - points[active[pair]]
+            dist = np.sqrt(_dot_(delta, delta))
+
+            # merge the two closest candidates of every point, which are
+            # ordered by point, into the two closest points found so far
+            dists = np.full((a, 4), np.inf)
+            index = np.full((a, 4), -1, dtype=np.int64)
+            dists[:, :2] = best[active]
+            index[:, 0] = found[active]
+            counts = counts.reshape(a, -1).sum(axis=1)
+            one = np.where(counts > 0)[0]
+            if one.size:
+                first = offset[one * nshell]
+                dists[one, 2] = np.minimum.reduceat(dist, first)
+                is_min = np.where(dist == dists[pair, 2])[0]
+                keep = np.ones(is_min.size, dtype=bool)
+                keep[1:] = pair[is_min[1:]] != pair[is_min[:-1]]
+                index[one, 2] = cand[is_min[keep]]
+                dist[is_min[keep]] = np.inf
+                dists[one, 3] = np.minimum.reduceat(dist, first)
+            closest = np.argsort(dists, axis=1, kind='mergesort')[:, :2]
+            sub = np.arange(a)[:, np.newaxis]
+            best[active] = dists[sub, closest]
+            found[active] = index[np.arange(a), closest[:, 0]]
+
+            bound = self._bound_(points[active], ijk[active], ring)
+            active = active[best[active, 1] > bound]
+            ring += 1
+
+        return found, 0.5 * (best[:, 1] - best[:, 0])
+
+    def nearest(self, lons, lats, chunk_size=None):
+        """
+        Find the point of the index closest to every point of a set.
+
+        :param lons: a numpy array of the longitudes (or ``x`` coordinates)
+            of the points, in the coordinate system of the index.
+        :param lats: a numpy array of the latitudes (or ``y`` coordinates)
+            of the points.
+        :param int chunk_size: the number of points searched at once.
+        :return: a tuple of a numpy array of the index of the closest point
+            to every point, ``-1`` if the index is empty, and a numpy array
+            of the distance every point can move, as returned by
+            :meth:`distance`, before another point of the index may be
+            closer to it.  Of two points at the same distance the one found
+            first is closest.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=np.float64),
+                                         np.asarray(lats, dtype=np.float64))
+        shape = lons.shape
+        points = _vectors_([lons.reshape(-1), lats.reshape(-1)],
+                           self._coord_sys)
+        if chunk_size is None:
+            chunk_size = _CHUNK_SIZE
+
+        n = points.shape[0]
+        found = np.full(n, -1, dtype=np.int64)
+        radius = np.full(n, np.inf)
+        if self.size == 0:
+            return found.reshape(shape), radius.reshape(shape)
+
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            found[start:stop], radius[start:stop] = \
+                self._search_(points[start:stop])
+
+        return found.reshape(shape), radius.reshape(shape)
+
+    def distance(self, lons, lats, other_lons, other_lats):
+        """
+        The distance between two sets of points, as the length of the chord
+        between them on the unit sphere for spherical coordinates.
+
+        :param lons: a numpy array of the longitudes (or ``x`` coordinates)
+            of the first points, in the coordinate system of the index.
+        :param lats: a numpy array of the latitudes (or ``y`` coordinates)
+            of the first points.
+        :param other_lons: the longitudes of the second points.
+        :param other_lats: the latitudes of the second points.
+        :return: a numpy array of the distance between every pair of points.
+        """
+        coords = np.broadcast_arrays(*[np.asarray(coord, dtype=np.float64)
+                                       for coord in (lons, lats, other_lons,
+                                                     other_lats)])
+        shape = coords[0].shape
+        coords = [coord.reshape(-1) for coord in coords]
+        delta = _vectors_(coords[:2], self._coord_sys) - \
+            _vectors_(coords[2:], self._coord_sys)
+
+        return np.sqrt(_dot_(delta, delta)).reshape(shape)
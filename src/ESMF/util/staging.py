@@ -0,0 +1,108 @@
+# $Id$
+
+"""
+staging
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+#### STAGING ##################################################################
+
+class ChunkedArray(object):
+    """
+    An array of a final type filled chunk by chunk.  If the number of rows is
+    known up front the array is allocated once and every chunk is copied into
+    place, otherwise the chunks are kept and concatenated when the array is
+    finished.
+
+    :param dtype: the numpy data type of the array.
+    :param int width: the number of values of every row.
+    :param int count: the number of rows, or ``None`` if it is unknown.
+    """
+
+    def __init__(self, dtype, width=1, count=None):
+        self._dtype = dtype
+        self._width = width
+        self._size = 0
+        if count is None:
+            self._array = None
+            self._chunks = []
+        else:
+            self._array = np.empty((count, width), dtype=dtype)
+            self._chunks = None
+
+    def append(self, values):
+        """
+        Append the rows of a chunk.
+
+        :param values: a numpy array of the values of the rows.
+        :return: the number of rows appended.
+        """
+        values = np.asarray(values, dtype=self._dtype).reshape(-1,
+                                                               self._width)
+        rows = values.shape[0]
+        if self._chunks is None:
+            if self._size + rows > self._array.shape[0]:
+                raise ValueError("more than the {0} announced rows were "
+                                 "staged".format(self._array.shape[0]))
+            self._array[self._size:self._size + rows] = values
+        else:
+            self._chunks.append(values)
+        self._size += rows
+
+        return rows
+
+    def finish(self):
+        """
+        Get the array of all staged rows, the staging references are dropped.
+
+        :return: a numpy array of shape ``(rows,)``, or ``(rows, width)`` if
+            the rows have more than one value.
+        """
+        if self._chunks is None:
+            if self._size != self._array.shape[0]:
+                raise ValueError("{0} rows were staged but {1} were "
+                                 "announced".format(self._size,
+                                                    self._array.shape[0]))
+            ret = self._array
+        elif self._chunks:
+            ret = np.concatenate(self._chunks)
+        else:
+            ret = np.empty((0, self._width), dtype=self._dtype)
+        self._array = None
+        self._chunks = []
+
+        return ret.reshape(-1) if self._width == 1 else ret
+
+def stage_chunk(staged, chunk, layout, count=None):
+    """
+    Append a chunk of named arrays to their staged arrays, which are created
+    for the arrays of the first chunk.
+
+    :param dict staged: the :class:`ChunkedArray` of every name.
+    :param dict chunk: the numpy arrays of the chunk by name, ``None`` values
+        are ignored.
+    :param dict layout: the numpy data type and width of every name.
+    :param int count: the number of rows of all chunks, or ``None`` if it is
+        unknown.
+    :return: the number of rows of the chunk.
+    """
+    names = set(name for name, values in chunk.items() if values is not None)
+    unknown = names - set(layout)
+    if unknown:
+        raise ValueError("unknown arrays {0}".format(sorted(unknown)))
+    if not staged:
+        for name in names:
+            dtype, width = layout[name]
+            staged[name] = ChunkedArray(dtype, width=width, count=count)
+    elif names != set(staged):
+        raise ValueError("every chunk must hold the same arrays")
+
+    rows = set(staged[name].append(chunk[name]) for name in names)
+    if len(rows) > 1:
+        raise ValueError("the arrays of a chunk must have the same number of "
+                         "rows")
+
+    return rows.pop() if rows else 0
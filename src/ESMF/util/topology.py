@@ -0,0 +1,155 @@
+# $Id$
+
+"""
+topology
+"""
+
+#### IMPORT LIBRARIES #########################################################
+
+import numpy as np
+
+from ESMF.api.constants import CoordSys
+from ESMF.util.partition import cartesian_coords
+
+#### TOPOLOGY #################################################################
+
+def element_edges(offsets, conn):
+    """
+    Get the edges of polygons, in the order of their nodes.
+
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements,
+        in counterclockwise order.
+    :return: a tuple of a numpy array of shape ``(edges, 2)`` of the nodes
+        of every edge, and a numpy array of the element of every edge.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    conn = np.asarray(conn, dtype=np.int64)
+    nodes = np.diff(offsets)
+    elements = np.repeat(np.arange(nodes.size), nodes)
+
+    # the last node of every element is followed by its first node
+    following = np.arange(1, conn.size + 1)
+    full = nodes > 0
+    following[offsets[1:][full] - 1] = offsets[:-1][full]
+
+    return np.stack((conn, conn[following]), axis=1), elements
+
+def _matching_edges_(edges):
+    # sort the edges by their unordered pair of nodes, and find the sorted
+    # edges which match the next one
+    lower = edges.min(axis=1)
+    upper = edges.max(axis=1)
+    order = np.lexsort((upper, lower))
+    lower, upper = lower[order], upper[order]
+    same = (lower[1:] == lower[:-1]) & (upper[1:] == upper[:-1])
+
+    return order, same
+
+def element_adjacency(offsets, conn):
+    """
+    Find the elements sharing an edge with every element, by sorting the
+    keys of all edges once.
+
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements.
+    :return: a tuple of a numpy array of ``elements + 1`` offsets and a
+        numpy array of the neighbours of all elements, the neighbours of
+        element ``i`` are ``neighbours[offsets[i]:offsets[i+1]]`` in
+        ascending order.
+    """
+    count = np.asarray(offsets).size - 1
+    edges, elements = element_edges(offsets, conn)
+    order, same = _matching_edges_(edges)
+    first = elements[order][:-1][same]
+    second = elements[order][1:][same]
+
+    a = np.concatenate((first, second))
+    b = np.concatenate((second, first))
+    pair = np.lexsort((b, a))
+    a, b = a[pair], b[pair]
+    # elements sharing several edges are neighbours once
+    keep = (a != b)
+    keep[1:] &= (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b = a[keep], b[keep]
+
+    ret = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(a, minlength=count), out=ret[1:])
+
+    return ret, b
+
+def boundary_edges(offsets, conn):
+    """
+    Find the edges which belong to a single element.
+
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements,
+        in counterclockwise order.
+    :return: a tuple of a numpy array of shape ``(edges, 2)`` of the nodes
+        of every boundary edge, in the counterclockwise order of its
+        element, and a numpy array of the element of every boundary edge.
+    """
+    edges, elements = element_edges(offsets, conn)
+    order, same = _matching_edges_(edges)
+    shared = np.zeros(edges.shape[0], dtype=bool)
+    shared[order[1:][same]] = True
+    shared[order[:-1][same]] = True
+
+    return edges[~shared], elements[~shared]
+
+def dual_cells(node_coords, element_coords, offsets, conn, coord_sys=None):
+    """
+    Build the cells of the dual of a 2D mesh: a cell around every node
+    inside the mesh, whose vertices are the centers of the elements of the
+    node in counterclockwise order around it.
+
+    :param node_coords: a numpy array of shape ``(nodes, dims)`` of node
+        coordinates.
+    :param element_coords: a numpy array of shape ``(elements, dims)`` of
+        element center coordinates.
+    :param offsets: a numpy array of ``elements + 1`` offsets into ``conn``.
+    :param conn: a numpy array of the 0 based node indices of all elements.
+    :param CoordSys coord_sys: the coordinate system of the coordinates.  If
+        ``None``, defaults to :attr:`~ESMF.api.constants.CoordSys.SPH_DEG`.
+    :return: a tuple of a numpy array of the nodes with a dual cell, and a
+        numpy array of ``cells + 1`` offsets and a numpy array of the
+        elements of all dual cells.
+    """
+    conn = np.asarray(conn, dtype=np.int64)
+    node_coords = np.asarray(node_coords, dtype=np.float64)
+    element_coords = np.asarray(element_coords, dtype=np.float64)
+    _, elements = element_edges(offsets, conn)
+    boundary, _ = boundary_edges(offsets, conn)
+
+    # the node and element of every connectivity entry of an inner node
+    inner = ~np.isin(conn, boundary)
+    nodes, elements = conn[inner], elements[inner]
+
+    # order the element centers by their angle around the node, in the plane
+    # tangent to the sphere at the node in spherical coordinates
+    if coord_sys == CoordSys.CART:
+        delta = element_coords[elements, :2] - node_coords[nodes, :2]
+        dx, dy = delta[:, 0], delta[:, 1]
+    else:
+        lon, lat = node_coords[nodes, 0], node_coords[nodes, 1]
+        if coord_sys != CoordSys.SPH_RAD:
+            lon, lat = np.radians(lon), np.radians(lat)
+        delta = cartesian_coords(element_coords, coord_sys)[elements] - \
+            cartesian_coords(node_coords, coord_sys)[nodes]
+        dx = -np.sin(lon) * delta[:, 0] + np.cos(lon) * delta[:, 1]
+        dy = -np.sin(lat) * (np.cos(lon) * delta[:, 0] +
+                             np.sin(lon) * delta[:, 1]) + \
+            np.cos(lat) * delta[:, 2]
+    order = np.lexsort((np.arctan2(dy, dx), nodes))
+    nodes, elements = nodes[order], elements[order]
+
+    # cells need at least three vertices
+    cells, counts = np.unique(nodes, return_counts=True)
+    valid = counts >= 3
+    elements = elements[np.repeat(valid, counts)]
+    cells, counts = cells[valid], counts[valid]
+
+    ret = np.zeros(cells.size + 1, dtype=np.int64)
+    np.cumsum(counts, out=ret[1:])
+
+    return cells, ret, elements